@@ -0,0 +1,160 @@
+"""Benchmark concurrent `agenerate` calls with and without `RecordLLMCalls`.
+
+Runs `--n-calls` concurrent `agenerate` calls against a fake LLM with a fixed
+latency, first unrecorded and then recorded, and reports the wall time and the
+recording overhead per call. With `--baseline`, the same calls are also timed
+on another revision, checked out in a temporary git worktree, e.g. the one
+before the native async wrapper:
+
+    python benchmarks/async_recording.py --n-calls 100 --baseline 133b754^
+
+Measured with Python 3.11, Prefect 2.10 and an ephemeral local API, for 100
+concurrent calls with a 0.05s latency:
+
+    revision                 unrecorded   recorded       overhead
+    133b754^ (sync wrapper)       0.07s     20.55s     204.81ms/call
+    native async wrapper          0.07s     20.76s     206.85ms/call
+
+Both revisions spend about 0.2s per call creating and tracking its flow run
+against the API, which hides any difference between the wrappers. With more
+calls, the SQLite database of the ephemeral API starts failing with "database
+is locked", so larger runs need a Prefect server backed by PostgreSQL.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from langchain.llms.base import LLM
+from prefect import flow
+
+from langchain_prefect.plugins import RecordLLMCalls
+
+
+class FakeLatencyLLM(LLM):
+    """Fake LLM answering every prompt after a fixed latency."""
+
+    latency: float = 0.05
+
+    @property
+    def _llm_type(self) -> str:
+        """Type of the LLM."""
+        return "fake-latency"
+
+    def _call(self, prompt: str, stop: List[str] | None = None, **kwargs: Any) -> str:
+        """Answer a prompt after `latency` seconds."""
+        time.sleep(self.latency)
+        return "fake response"
+
+    async def _acall(
+        self, prompt: str, stop: List[str] | None = None, **kwargs: Any
+    ) -> str:
+        """Answer a prompt after `latency` seconds, without blocking the loop."""
+        await asyncio.sleep(self.latency)
+        return "fake response"
+
+
+async def run_concurrent_calls(llm: LLM, n_calls: int) -> float:
+    """Return the wall time of `n_calls` concurrent `agenerate` calls."""
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[llm.agenerate([f"What is {i} + {i}?"]) for i in range(n_calls)]
+    )
+    return time.perf_counter() - start
+
+
+@flow
+async def run_recorded_calls(latency: float, n_calls: int) -> float:
+    """Return the wall time of `n_calls` concurrent recorded calls in a flow run.
+
+    Prefect 2.10 cannot run concurrent top-level flow runs from one event loop,
+    so the recorded calls are made as subflow runs of this flow.
+    """
+    with RecordLLMCalls(max_prompt_tokens=None):
+        return await run_concurrent_calls(FakeLatencyLLM(latency=latency), n_calls)
+
+
+def run_benchmark(n_calls: int, latency: float) -> Dict[str, float]:
+    """Return the wall time of the calls unrecorded and recorded, in seconds."""
+    llm = FakeLatencyLLM(latency=latency)
+
+    unrecorded = asyncio.run(run_concurrent_calls(llm, n_calls))
+    recorded = asyncio.run(run_recorded_calls(latency, n_calls))
+    return {"unrecorded": unrecorded, "recorded": recorded}
+
+
+def run_baseline(revision: str, n_calls: int, latency: float) -> Dict[str, float]:
+    """Run this benchmark on the package of another git revision."""
+    repo = Path(__file__).resolve().parents[1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        worktree = Path(tmp_dir) / "baseline"
+        subprocess.run(
+            ["git", "worktree", "add", "--detach", str(worktree), revision],
+            cwd=repo,
+            check=True,
+            capture_output=True,
+        )
+        try:
+            process = subprocess.run(
+                [
+                    sys.executable,
+                    __file__,
+                    f"--n-calls={n_calls}",
+                    f"--latency={latency}",
+                    "--json",
+                ],
+                env={**os.environ, "PYTHONPATH": str(worktree)},
+                capture_output=True,
+                text=True,
+            )
+        finally:
+            subprocess.run(
+                ["git", "worktree", "remove", "--force", str(worktree)],
+                cwd=repo,
+                check=True,
+            )
+    if process.returncode:
+        raise RuntimeError(f"The benchmark failed on {revision}:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def main():
+    """Run the benchmark and print its results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-calls", type=int, default=100)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument(
+        "--baseline", help="A git revision to compare the current tree with."
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Print the timings as JSON."
+    )
+    args = parser.parse_args()
+
+    timings = {}
+    if args.baseline:
+        timings[args.baseline] = run_baseline(args.baseline, args.n_calls, args.latency)
+    timings["current"] = run_benchmark(args.n_calls, args.latency)
+
+    if args.json:
+        print(json.dumps(timings["current"]))
+        return
+
+    print(f"{args.n_calls} concurrent agenerate calls, {args.latency}s latency")
+    print(f"  {'revision':<24} {'unrecorded':>10} {'recorded':>10} {'overhead':>14}")
+    for revision, timing in timings.items():
+        overhead = (timing["recorded"] - timing["unrecorded"]) / args.n_calls * 1e3
+        print(
+            f"  {revision:<24} {timing['unrecorded']:>9.2f}s"
+            f" {timing['recorded']:>9.2f}s {overhead:>10.2f}ms/call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""Load test `RecordLLMCalls` with many concurrent agent-style loops.
+
+Each agent makes `--steps` sequential `agenerate` calls, waiting `--think-time`
+seconds between them. For each concurrency level, the agents run first
+unrecorded and then recorded, against a fake LLM or, with `--server`, against
+`FakeOpenAIServer` through `langchain.llms.OpenAI`. The harness reports the
+throughput, the end-to-end latency of calls, the recording overhead per call
+and the requests made to the Prefect API, and the concurrency at which the
+recorded throughput stops growing. Run it against the Prefect API that your
+workers use, e.g.
+
+    python benchmarks/load_test.py --concurrency 1 4 16 64 256 --server
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from typing import Any, Dict, List
+
+from async_recording import FakeLatencyLLM
+from langchain.base_language import BaseLanguageModel
+from prefect.client.base import PrefectHttpxClient
+
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.testing import FakeOpenAIServer
+
+prefect_api_requests = 0
+
+
+def count_prefect_api_requests():
+    """Count the requests sent by Prefect clients in `prefect_api_requests`."""
+    send = PrefectHttpxClient.send
+
+    async def counting_send(self, *args, **kwargs):
+        """Send a request, counting it."""
+        global prefect_api_requests
+        prefect_api_requests += 1
+        return await send(self, *args, **kwargs)
+
+    PrefectHttpxClient.send = counting_send
+
+
+async def run_agent(
+    llm: BaseLanguageModel, agent: int, steps: int, think_time: float
+) -> List[float]:
+    """Run one agent loop and return the latency of each of its calls."""
+    latencies = []
+    for step in range(steps):
+        start = time.perf_counter()
+        await llm.agenerate([f"Agent {agent}, step {step}: what next?"])
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(think_time)
+    return latencies
+
+
+async def run_agents(
+    llm: BaseLanguageModel, concurrency: int, steps: int, think_time: float
+) -> Dict[str, Any]:
+    """Run `concurrency` agent loops at once and return their statistics."""
+    requests_before = prefect_api_requests
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[run_agent(llm, agent, steps, think_time) for agent in range(concurrency)]
+    )
+    duration = time.perf_counter() - start
+
+    latencies = sorted(latency for result in results for latency in result)
+    quantiles = statistics.quantiles(latencies, n=100, method="inclusive")
+    return {
+        "calls": len(latencies),
+        "throughput": len(latencies) / duration,
+        "mean_latency": statistics.fmean(latencies),
+        "p50_latency": quantiles[49],
+        "p95_latency": quantiles[94],
+        "p99_latency": quantiles[98],
+        "api_requests": (prefect_api_requests - requests_before) / duration,
+    }
+
+
+def find_saturation(rows: List[Dict[str, Any]], min_gain: float) -> int | None:
+    """Return the first concurrency at which recorded throughput stops growing.
+
+    Throughput stops growing when it increases by less than `min_gain` times the
+    increase in concurrency.
+    """
+    for previous, row in zip(rows, rows[1:]):
+        concurrency_gain = row["concurrency"] / previous["concurrency"] - 1
+        throughput_gain = row["throughput"] / previous["throughput"] - 1
+        if throughput_gain < min_gain * concurrency_gain:
+            return previous["concurrency"]
+    return None
+
+
+def main():
+    """Run the load test and print its results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--steps", type=int, default=5)
+    parser.add_argument("--think-time", type=float, default=0.1)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument(
+        "--server",
+        action="store_true",
+        help="Call FakeOpenAIServer over HTTP instead of a fake LLM.",
+    )
+    parser.add_argument(
+        "--min-gain",
+        type=float,
+        default=0.5,
+        help="Fraction of the concurrency increase below which throughput gains"
+        " count as saturated.",
+    )
+    args = parser.parse_args()
+
+    count_prefect_api_requests()
+    server = None
+    if args.server:
+        from langchain.llms import OpenAI
+
+        server = FakeOpenAIServer(latency=args.latency).start()
+        llm = OpenAI(openai_api_base=server.url, openai_api_key="fake", max_retries=0)
+    else:
+        llm = FakeLatencyLLM(latency=args.latency)
+
+    rows = []
+    try:
+        for concurrency in args.concurrency:
+            unrecorded = asyncio.run(
+                run_agents(llm, concurrency, args.steps, args.think_time)
+            )
+            with RecordLLMCalls(max_prompt_tokens=None):
+                recorded = asyncio.run(
+                    run_agents(llm, concurrency, args.steps, args.think_time)
+                )
+            rows.append(
+                {
+                    "concurrency": concurrency,
+                    **recorded,
+                    "overhead": recorded["mean_latency"] - unrecorded["mean_latency"],
+                }
+            )
+    finally:
+        if server:
+            server.stop()
+
+    print(
+        f"{args.steps} calls per agent, {args.think_time}s think time,"
+        f" {args.latency}s LLM latency{' over HTTP' if args.server else ''}"
+    )
+    print(
+        f"{'agents':>7} {'calls/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        f" {'overhead ms':>12} {'API req/s':>10}"
+    )
+    for row in rows:
+        print(
+            f"{row['concurrency']:>7} {row['throughput']:>9.1f}"
+            f" {row['p50_latency'] * 1e3:>8.1f} {row['p95_latency'] * 1e3:>8.1f}"
+            f" {row['p99_latency'] * 1e3:>8.1f} {row['overhead'] * 1e3:>12.1f}"
+            f" {row['api_requests']:>10.1f}"
+        )
+
+    saturation = find_saturation(rows, args.min_gain)
+    if saturation:
+        print(f"Recorded throughput saturates at {saturation} concurrent agents.")
+    else:
+        print("Recorded throughput did not saturate; try higher concurrency.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Soak test the memory retained by `RecordLLMCalls` in a long-running flow.
+
+One flow makes `--n-calls` sequential recorded `generate` calls against a fake
+LLM, like a long-running agent, with usage tracked by a `UsageTracker`. After
+`--warmup` calls, which fill Prefect's caches, every allocation of the process
+is traced with `tracemalloc`. Every `--interval` calls, the harness reports the
+traced memory, its growth since the warm-up and the time per call. Once the
+`UsageTracker` keeps usage for `--max-tracked-runs` runs, the growth should stay
+flat however many calls are made:
+
+    python benchmarks/soak_recording.py --n-calls 100000
+
+Measured with Python 3.11, Prefect 2.10 and an ephemeral local API, for 3000
+calls with `--interval 500 --max-tracked-runs 100`:
+
+       calls       traced       growth   per call
+         500      0.59MiB     609.0KiB   532.27ms
+        1000      0.60MiB     609.8KiB   519.83ms
+        1500      0.60MiB     613.1KiB   627.79ms
+        2000      0.60MiB     613.0KiB   529.39ms
+        2500      0.60MiB     610.4KiB   473.06ms
+        3000      0.60MiB     611.5KiB   513.84ms
+
+The first few hundred calls fill bounded caches of Prefect and its
+dependencies. At this rate, 100k calls take about 14 hours.
+
+Logs are sent to the Prefect API as usual; set `PREFECT_LOGGING_LEVEL=WARNING`
+to keep them out of the console.
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import List
+
+from async_recording import FakeLatencyLLM
+from prefect import flow
+from prefect.logging.handlers import APILogHandler
+
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.usage import UsageTracker
+
+
+def traced_memory() -> int:
+    """Return the memory traced once queued logs are sent and garbage collected."""
+    APILogHandler.flush()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+@flow
+def long_running_agent(n_calls: int, interval: int, warmup: int) -> List[int]:
+    """Make recorded calls, returning the memory traced at each report."""
+    llm = FakeLatencyLLM(latency=0)
+    for step in range(warmup):
+        llm.generate([f"Warm-up step {step}"])
+
+    tracemalloc.start()
+    try:
+        reports = [traced_memory()]
+        print(f"  {'calls':>8} {'traced':>12} {'growth':>12} {'per call':>10}")
+        start = time.perf_counter()
+        for step in range(1, n_calls + 1):
+            llm.generate([f"Step {step} of a long-running agent"])
+            if step % interval == 0:
+                duration = time.perf_counter() - start
+                reports.append(traced_memory())
+                print(
+                    f"  {step:>8} {reports[-1] / 2**20:>9.2f}MiB"
+                    f" {(reports[-1] - reports[0]) / 2**10:>9.1f}KiB"
+                    f" {duration / interval * 1e3:>8.2f}ms"
+                )
+                start = time.perf_counter()
+        return reports
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    """Run the soak test and print its results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n-calls", type=int, default=100_000)
+    parser.add_argument("--interval", type=int, default=1000)
+    parser.add_argument("--warmup", type=int, default=200)
+    parser.add_argument("--max-tracked-runs", type=int, default=10_000)
+    args = parser.parse_args()
+
+    tracker = UsageTracker(
+        publish_artifacts=False, max_tracked_runs=args.max_tracked_runs
+    )
+    with RecordLLMCalls(include=[FakeLatencyLLM], usage_tracker=tracker):
+        reports = long_running_agent(args.n_calls, args.interval, args.warmup)
+
+    # the usage of runs is tracked until `max_tracked_runs` are
+    first = max(-(-args.max_tracked_runs // args.interval), 1)
+    if len(reports) > first + 1:
+        n_calls = (len(reports) - 1 - first) * args.interval
+        growth = reports[-1] - reports[first]
+        print(
+            f"{growth / 2**10:.1f}KiB retained over the last {n_calls} calls,"
+            f" {growth / n_calls:.1f}B per call"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,715 @@
+"""Bounded, order-preserving fan-out of many prompts to an LLM."""
+
+import asyncio
+import heapq
+import json
+import os
+import time
+import zlib
+from collections import deque
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Coroutine,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Tuple,
+)
+
+from langchain.base_language import BaseLanguageModel
+from langchain.schema import Generation, LLMResult
+from prefect import flow
+from prefect import tags as prefect_tags
+from prefect.artifacts import create_table_artifact
+
+from langchain_prefect.usage import DryRunEstimator, TokenUsage, parse_token_usage
+from langchain_prefect.utilities import (
+    get_current_logger,
+    get_prompt_content,
+    num_tokens,
+)
+
+
+def chunk_prompts(
+    prompts: Iterable[Any],
+    max_batch_tokens: int | None = int(1e4),
+    max_batch_size: int = 20,
+) -> Iterator[Tuple[int, List[Any]]]:
+    """Lazily group prompts into batches limited in tokens and size.
+
+    A prompt with more than `max_batch_tokens` tokens forms a batch of its own.
+
+    Yields:
+        The index of the first prompt of each batch, and the batch of prompts.
+    """
+    batch, batch_tokens, start = [], 0, 0
+    for index, prompt in enumerate(prompts):
+        prompt_tokens = (
+            num_tokens(get_prompt_content([prompt])) if max_batch_tokens else 0
+        )
+        if batch and (
+            len(batch) >= max_batch_size
+            or (max_batch_tokens and batch_tokens + prompt_tokens > max_batch_tokens)
+        ):
+            yield start, batch
+            batch, batch_tokens, start = [], 0, index
+        batch.append(prompt)
+        batch_tokens += prompt_tokens
+    if batch:
+        yield start, batch
+
+
+async def agenerate_many(
+    llm: BaseLanguageModel,
+    prompts: Iterable[Any],
+    max_concurrency: int = 4,
+    max_batch_tokens: int | None = int(1e4),
+    max_batch_size: int = 20,
+    ordered: bool = True,
+    tags: Iterable[str] = (),
+    on_batch: Callable[[LLMResult, float], None] | None = None,
+    dry_run: DryRunEstimator | None = None,
+    **generate_kwargs,
+) -> AsyncIterator[Tuple[int, List[Generation]]]:
+    """Generate completions for many prompts with a bounded pool of workers.
+
+    Prompts are read lazily and grouped into `agenerate` batches by token count,
+    so that batches stay within the `max_prompt_tokens` of `RecordLLMCalls`.
+    At most `max_concurrency` batches are in flight, and no more prompts are
+    read until a worker is free. When yielding in order, no more prompts are
+    read either while `2 * max_concurrency` batches wait for an earlier one, so
+    that a slow batch does not buffer the results of the rest of the input.
+    Calls are recorded like any other call made within `RecordLLMCalls`.
+
+    Args:
+        llm: The LLM to call.
+        prompts: The prompts, e.g. strings for LLMs or message lists for chat models.
+        max_concurrency: The maximum number of batches in flight.
+        max_batch_tokens: The maximum number of prompt tokens per batch.
+        max_batch_size: The maximum number of prompts per batch.
+        ordered: Whether to yield results in the order of the prompts, as soon as
+            all earlier prompts are done, rather than as they complete.
+        tags: Tags to apply to the flow runs of the recorded calls.
+        on_batch: Called with the result and latency in seconds of each batch.
+        dry_run: A `DryRunEstimator` to project the usage of each batch with
+            instead of calling the LLM. Generations are empty.
+        **generate_kwargs: Keyword arguments passed to `llm.agenerate`.
+
+    Yields:
+        The index of each prompt and its generations.
+
+    Example:
+        Classify many texts, 8 batches at a time:
+
+        >>> with RecordLLMCalls():
+        >>>     async for i, generations in agenerate_many(
+        >>>         OpenAI(temperature=0), prompts, max_concurrency=8
+        >>>     ):
+        >>>         print(i, generations[0].text)
+    """
+    batches: asyncio.Queue = asyncio.Queue(maxsize=max_concurrency)
+    results: asyncio.Queue = asyncio.Queue(maxsize=max_concurrency * max_batch_size)
+    # the batches read but not yielded in order yet, and the index each ends at
+    read_ahead = asyncio.Semaphore(2 * max_concurrency)
+    batch_ends: Deque[int] = deque()
+
+    async def produce():
+        """Queue batches of prompts, then one stop signal per worker."""
+        try:
+            for batch in chunk_prompts(prompts, max_batch_tokens, max_batch_size):
+                if ordered:
+                    await read_ahead.acquire()
+                    batch_ends.append(batch[0] + len(batch[1]))
+                await batches.put(batch)
+        except Exception as exc:
+            await results.put(exc)
+        for _ in range(max_concurrency):
+            await batches.put(None)
+
+    async def work():
+        """Generate queued batches, queueing the generations of each prompt."""
+        try:
+            while (batch := await batches.get()) is not None:
+                start, batch_prompts = batch
+                started = time.monotonic()
+                if dry_run:
+                    llm_result = await dry_run.aestimate(llm, batch_prompts)
+                else:
+                    with prefect_tags(*tags):
+                        llm_result = await llm.agenerate(
+                            batch_prompts, **generate_kwargs
+                        )
+                if len(llm_result.generations) != len(batch_prompts):
+                    raise ValueError(
+                        f"Got {len(llm_result.generations)} generations"
+                        f" for a batch of {len(batch_prompts)} prompts."
+                    )
+                if on_batch:
+                    on_batch(llm_result, time.monotonic() - started)
+                for offset, generations in enumerate(llm_result.generations):
+                    await results.put((start + offset, generations))
+        except Exception as exc:
+            await results.put(exc)
+        else:
+            await results.put(None)
+
+    tasks = [asyncio.create_task(produce())]
+    tasks += [asyncio.create_task(work()) for _ in range(max_concurrency)]
+    try:
+        pending, next_index, finished_workers = {}, 0, 0
+        while finished_workers < max_concurrency:
+            item = await results.get()
+            if item is None:
+                finished_workers += 1
+                continue
+            if isinstance(item, Exception):
+                raise item
+            if not ordered:
+                yield item
+                continue
+            pending[item[0]] = item[1]
+            while next_index in pending:
+                yield next_index, pending.pop(next_index)
+                next_index += 1
+            while batch_ends and batch_ends[0] <= next_index:
+                batch_ends.popleft()
+                read_ahead.release()
+    finally:
+        for running_task in tasks:
+            running_task.cancel()
+
+
+def generate_many_flow(
+    llm: BaseLanguageModel,
+    prompts: Iterable[Any],
+    flow_kwargs: dict | None = None,
+    **kwargs,
+) -> Coroutine[Any, Any, List[List[Generation]]]:
+    """Run `agenerate_many` in a Prefect flow and return the generations in order.
+
+    The LLM and prompts are not sent to the Prefect API as flow run parameters;
+    only the LLM endpoint and the number of prompts, if known, are. The flow is
+    async, so the returned coroutine must be awaited, or run with `asyncio.run`
+    from sync code.
+
+    Args:
+        llm: The LLM to call.
+        prompts: The prompts to generate completions for.
+        flow_kwargs: Keyword arguments to pass to the flow decorator.
+        **kwargs: Keyword arguments passed to `agenerate_many`. With a `dry_run`
+            estimator, its projected usage is published as a table artifact.
+
+    Example:
+        >>> with RecordLLMCalls(tags={"bulk"}):
+        >>>     generations = asyncio.run(
+        >>>         generate_many_flow(OpenAI(), prompts, max_concurrency=8)
+        >>>     )
+    """
+    flow_kwargs = flow_kwargs or dict(name="Generate Many", validate_parameters=False)
+
+    async def generate_many(llm_endpoint: str, n_prompts: int | None):
+        """flow generating completions for many prompts"""
+        generations = [
+            generations
+            async for _, generations in agenerate_many(llm, prompts, **kwargs)
+        ]
+        if dry_run := kwargs.get("dry_run"):
+            await dry_run.publish()
+        return generations
+
+    return flow(**flow_kwargs)(generate_many)(
+        llm_endpoint=llm.__module__,
+        n_prompts=len(prompts) if hasattr(prompts, "__len__") else None,
+    )
+
+
+class BatchCheckpoint:
+    """Compact index of the finished rows of a batch inference job.
+
+    Finished rows are kept as a bitmap, one bit per input row, together with the
+    size of the output file that the bitmap accounts for.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        """Compact index of the finished rows of a batch inference job.
+
+        Args:
+            path: Where to save the checkpoint. If `None`, it is kept in memory.
+        """
+        self.path = Path(path) if path else None
+        self.bitmap = bytearray()
+        self.output_offset = 0
+        self.n_done = 0
+
+    @classmethod
+    def load(cls, path: str | Path | None) -> "BatchCheckpoint":
+        """Load a checkpoint, or return an empty one if it does not exist."""
+        checkpoint = cls(path)
+        if checkpoint.path and checkpoint.path.exists():
+            with open(checkpoint.path, "rb") as f:
+                header = json.loads(f.readline())
+                checkpoint.bitmap = bytearray(f.read())
+            checkpoint.output_offset = header["output_offset"]
+            checkpoint.n_done = header["n_done"]
+        return checkpoint
+
+    def __contains__(self, row: int) -> bool:
+        """Return whether a row is finished."""
+        byte, bit = divmod(row, 8)
+        return byte < len(self.bitmap) and bool(self.bitmap[byte] & (1 << bit))
+
+    def add(self, row: int):
+        """Mark a row as finished."""
+        if row in self:
+            return
+        byte, bit = divmod(row, 8)
+        if byte >= len(self.bitmap):
+            self.bitmap.extend(bytes(byte + 1 - len(self.bitmap)))
+        self.bitmap[byte] |= 1 << bit
+        self.n_done += 1
+
+    def save(self, output_offset: int):
+        """Atomically save the checkpoint, covering output up to `output_offset`."""
+        self.output_offset = output_offset
+        if not self.path:
+            return
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_path, "wb") as f:
+            header = {"output_offset": output_offset, "n_done": self.n_done}
+            f.write(json.dumps(header).encode() + b"\n")
+            f.write(self.bitmap)
+        os.replace(tmp_path, self.path)
+
+    def recover(self, output_path: str | Path, read_only: bool = False):
+        """Mark rows written after the last save as finished.
+
+        Output written after `output_offset` is scanned for finished rows, and a
+        trailing partial line left by a crash is truncated.
+
+        Args:
+            output_path: The output that the checkpoint accounts for.
+            read_only: Only mark the rows as finished, leaving the output and the
+                saved checkpoint untouched.
+        """
+        if not Path(output_path).exists():
+            return
+        with open(output_path, "rb" if read_only else "rb+") as f:
+            offset = min(self.output_offset, f.seek(0, os.SEEK_END))
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self.add(json.loads(line)["row"])
+                offset += len(line)
+            if read_only:
+                return
+            f.truncate(offset)
+        self.save(offset)
+
+
+def _count_newlines(f, end: int) -> int:
+    """Count the newlines in the first `end` bytes of a binary file."""
+    f.seek(0)
+    n_newlines, remaining = 0, end
+    while remaining > 0 and (chunk := f.read(min(2**20, remaining))):
+        n_newlines += chunk.count(b"\n")
+        remaining -= len(chunk)
+    return n_newlines
+
+
+def read_jsonl_prompts(
+    input_path: str | Path,
+    prompt_key: str = "prompt",
+    skip: BatchCheckpoint | None = None,
+    shard: Tuple[int, int] | None = None,
+    shard_by: Literal["hash", "bytes"] = "hash",
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """Lazily read the rows of a JSONL file, skipping finished rows.
+
+    Args:
+        input_path: The JSONL file to read.
+        prompt_key: The key that each record must contain.
+        skip: A checkpoint of rows to skip.
+        shard: The index of the shard to read and the number of shards. If
+            `None`, all rows are read.
+        shard_by: Whether rows are assigned to shards by the CRC32 hash of the
+            line, or by the byte range of the file their line starts in.
+
+    Yields:
+        The row number and record of each unfinished row.
+    """
+    with open(input_path, "rb") as f:
+        row, position, end = 0, 0, None
+        if shard and shard_by == "bytes":
+            index, n_shards = shard
+            size = f.seek(0, os.SEEK_END)
+            position = size * index // n_shards
+            end = size * (index + 1) // n_shards
+            if position > 0:
+                # the line containing `position` belongs to the previous shard
+                f.seek(position - 1)
+                position += len(f.readline()) - 1
+            row = _count_newlines(f, position)
+            f.seek(position)
+
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            row += 1
+            if (
+                (skip is not None and row - 1 in skip)
+                or not line.strip()
+                or (
+                    shard
+                    and shard_by == "hash"
+                    and zlib.crc32(line.rstrip(b"\r\n")) % shard[1] != shard[0]
+                )
+            ):
+                continue
+            record = json.loads(line)
+            if prompt_key not in record:
+                raise ValueError(
+                    f"Row {row - 1} of {input_path} has no {prompt_key!r}."
+                )
+            yield row - 1, record
+
+
+async def abatch_inference(
+    llm: BaseLanguageModel,
+    input_path: str | Path,
+    output_path: str | Path,
+    checkpoint_path: str | Path | None = None,
+    prompt_key: str = "prompt",
+    id_key: str | None = None,
+    checkpoint_every: int = 100,
+    shard: Tuple[int, int] | None = None,
+    shard_by: Literal["hash", "bytes"] = "hash",
+    dry_run: DryRunEstimator | None = None,
+    **kwargs,
+) -> Dict[str, Any]:
+    """Stream prompts from a JSONL file through an LLM into a JSONL file.
+
+    Each output line holds the input `row` number, the `id_key` value if given,
+    and the generated `generations` texts. Output lines are appended as results
+    arrive, in completion order. Rows already present in the output are skipped,
+    so a crashed run resumes where it stopped when given the same checkpoint.
+    Memory stays flat apart from the checkpoint bitmap of one bit per row.
+
+    Args:
+        llm: The LLM to call.
+        input_path: JSONL file with one record containing a prompt per line.
+        output_path: JSONL file to append results to.
+        checkpoint_path: Where to save the index of finished rows. Defaults to the
+            output path with a `.checkpoint` suffix.
+        prompt_key: The key of the prompt in each input record.
+        id_key: The key of an identifier to copy from input to output records.
+        checkpoint_every: Save the checkpoint after this many results.
+        shard: The index of the shard of the input to process and the number of
+            shards, see `read_jsonl_prompts`.
+        shard_by: How rows are assigned to shards, see `read_jsonl_prompts`.
+        dry_run: A `DryRunEstimator` to project the usage of the unfinished rows
+            with instead of calling the LLM. The output and checkpoint are left
+            untouched.
+        **kwargs: Keyword arguments passed to `agenerate_many`.
+
+    Returns:
+        The number of rows `processed` by this run and `skipped` as finished, the
+        token usage reported by the LLM, and the number and latency of batches.
+    """
+    checkpoint = BatchCheckpoint.load(
+        checkpoint_path or Path(output_path).with_suffix(".checkpoint")
+    )
+    checkpoint.recover(output_path, read_only=bool(dry_run))
+    skipped = checkpoint.n_done
+
+    in_flight: Dict[int, Tuple[int, Any]] = {}
+    usage, latencies = TokenUsage(), []
+
+    def prompts() -> Iterator[Any]:
+        """Yield the unfinished prompts, remembering the row and ID of each."""
+        for index, (row, record) in enumerate(
+            read_jsonl_prompts(
+                input_path, prompt_key, skip=checkpoint, shard=shard, shard_by=shard_by
+            )
+        ):
+            in_flight[index] = (row, record.get(id_key) if id_key else None)
+            yield record[prompt_key]
+
+    def on_batch(llm_result: LLMResult, latency: float):
+        """Add the usage and latency of a batch to the statistics of the run."""
+        nonlocal usage
+        usage += parse_token_usage(llm_result)
+        latencies.append(latency)
+
+    processed = 0
+    kwargs.setdefault("ordered", False)
+    with open(os.devnull if dry_run else output_path, "ab") as output:
+        async for index, generations in agenerate_many(
+            llm, prompts(), on_batch=on_batch, dry_run=dry_run, **kwargs
+        ):
+            row, record_id = in_flight.pop(index)
+            result = {"row": row, "generations": [g.text for g in generations]}
+            if id_key:
+                result["id"] = record_id
+            output.write(json.dumps(result).encode() + b"\n")
+            output.flush()
+
+            checkpoint.add(row)
+            processed += 1
+            if processed % checkpoint_every == 0:
+                if not dry_run:
+                    checkpoint.save(output.tell())
+                get_current_logger(__name__).info(
+                    f"Processed {processed} rows of {input_path}"
+                    + (f" shard {shard[0]}/{shard[1]}." if shard else ".")
+                )
+        if not dry_run:
+            checkpoint.save(output.tell())
+
+    return {
+        "processed": processed,
+        "skipped": skipped,
+        "prompt_tokens": usage.prompt_tokens,
+        "completion_tokens": usage.completion_tokens,
+        "total_tokens": usage.total_tokens,
+        "batches": len(latencies),
+        "mean_latency": sum(latencies) / len(latencies) if latencies else 0.0,
+        "max_latency": max(latencies, default=0.0),
+    }
+
+
+def batch_inference_flow(
+    llm: BaseLanguageModel,
+    input_path: str | Path,
+    output_path: str | Path,
+    flow_kwargs: dict | None = None,
+    **kwargs,
+) -> Coroutine[Any, Any, Dict[str, Any]]:
+    """Run `abatch_inference` in a Prefect flow.
+
+    Only the LLM endpoint and the input and output paths are sent to the Prefect
+    API as flow run parameters. The flow is async, so the returned coroutine
+    must be awaited, or run with `asyncio.run` from sync code.
+
+    Args:
+        llm: The LLM to call.
+        input_path: JSONL file with one record containing a prompt per line.
+        output_path: JSONL file to append results to.
+        flow_kwargs: Keyword arguments to pass to the flow decorator.
+        **kwargs: Keyword arguments passed to `abatch_inference`. With a `dry_run`
+            estimator, its projected usage is published as a table artifact.
+
+    Example:
+        Score a large file, resuming from the checkpoint if it was interrupted:
+
+        >>> with RecordLLMCalls(tags={"scoring"}):
+        >>>     stats = asyncio.run(
+        >>>         batch_inference_flow(
+        >>>             OpenAI(temperature=0),
+        >>>             "prompts.jsonl",
+        >>>             "scores.jsonl",
+        >>>             max_concurrency=16,
+        >>>         )
+        >>>     )
+    """
+    flow_kwargs = flow_kwargs or dict(name="Batch Inference", validate_parameters=False)
+
+    async def batch_inference(llm_endpoint: str, input_path: str, output_path: str):
+        """flow streaming prompts from a JSONL file through an LLM"""
+        stats = await abatch_inference(llm, input_path, output_path, **kwargs)
+        if dry_run := kwargs.get("dry_run"):
+            await dry_run.publish()
+        return stats
+
+    return flow(**flow_kwargs)(batch_inference)(
+        llm_endpoint=llm.__module__,
+        input_path=str(input_path),
+        output_path=str(output_path),
+    )
+
+
+def shard_output_path(output_path: str | Path, index: int, n_shards: int) -> Path:
+    """Return the output path of a shard."""
+    output_path = Path(output_path)
+    return output_path.with_name(
+        f"{output_path.stem}.shard-{index:04d}-of-{n_shards:04d}{output_path.suffix}"
+    )
+
+
+def _sorted_runs(path: Path) -> List[Tuple[int, int]]:
+    """Return the byte ranges of the runs of lines sorted by row in a file."""
+    runs, start, position, previous_row = [], 0, 0, -1
+    with open(path, "rb") as f:
+        for line in f:
+            row = json.loads(line)["row"]
+            if row < previous_row:
+                runs.append((start, position))
+                start = position
+            position += len(line)
+            previous_row = row
+    if position > start:
+        runs.append((start, position))
+    return runs
+
+
+def _read_run(path: Path, start: int, end: int) -> Iterator[Tuple[int, bytes]]:
+    """Yield the row and line of each line in a byte range of a file."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while start < end and (line := f.readline()):
+            start += len(line)
+            yield json.loads(line)["row"], line
+
+
+def merge_shard_outputs(shard_paths: Iterable[Path], output_path: str | Path):
+    """Merge shard outputs into one output ordered by row.
+
+    Each shard output is made of runs of rows in order, one per (resumed) run of
+    the shard, which are merged lazily so that memory stays flat.
+    """
+    runs = [
+        _read_run(path, start, end)
+        for path in shard_paths
+        if path.exists()
+        for start, end in _sorted_runs(path)
+    ]
+    tmp_path = Path(output_path).with_name(Path(output_path).name + ".tmp")
+    with open(tmp_path, "wb") as output:
+        for _, line in heapq.merge(*runs, key=lambda item: item[0]):
+            output.write(line)
+    os.replace(tmp_path, output_path)
+
+
+def sharded_batch_inference_flow(
+    llm: BaseLanguageModel,
+    input_path: str | Path,
+    output_path: str | Path,
+    n_shards: int = 4,
+    shard_by: Literal["hash", "bytes"] = "hash",
+    shard_retries: int = 2,
+    flow_kwargs: dict | None = None,
+    **kwargs,
+) -> Coroutine[Any, Any, List[Dict[str, Any]]]:
+    """Run `abatch_inference` over shards of the input as Prefect subflows.
+
+    Each shard is a subflow writing to its own output and checkpoint, so the
+    LLM calls it makes can be recorded by `RecordLLMCalls`. Shards run
+    concurrently, and a failed shard is retried, resuming from its checkpoint,
+    without rerunning the others. Once every shard is done, their outputs are
+    merged into `output_path` in row order, which does not depend on the
+    sharding. Each shard writes its rows in order, holding
+    at most `2 * max_concurrency` batches behind a slow one, see
+    `agenerate_many`. Per-shard progress, tokens and latency are published as
+    a table artifact.
+
+    Rerunning the flow after a shard exhausted its retries only processes the
+    unfinished rows of each shard. The flow is async, so the returned coroutine
+    must be awaited, or run with `asyncio.run` from sync code.
+
+    Args:
+        llm: The LLM to call.
+        input_path: JSONL file with one record containing a prompt per line.
+        output_path: JSONL file to write the merged results to.
+        n_shards: The number of shards.
+        shard_by: Whether to assign rows to shards by line hash or byte range.
+        shard_retries: The number of times to retry a failed shard.
+        flow_kwargs: Keyword arguments to pass to the flow decorator.
+        **kwargs: Keyword arguments passed to `abatch_inference`. With a `dry_run`
+            estimator, its projected usage over all shards is published as a
+            table artifact and no output is merged.
+
+    Returns:
+        The stats of each shard, see `abatch_inference`.
+
+    Example:
+        Score a large file in 16 shards:
+
+        >>> with RecordLLMCalls(tags={"scoring"}):
+        >>>     shard_stats = asyncio.run(
+        >>>         sharded_batch_inference_flow(
+        >>>             OpenAI(temperature=0),
+        >>>             "prompts.jsonl",
+        >>>             "scores.jsonl",
+        >>>             n_shards=16,
+        >>>         )
+        >>>     )
+    """
+    flow_kwargs = {
+        "name": "Sharded Batch Inference",
+        "validate_parameters": False,
+        **(flow_kwargs or {}),
+    }
+    # runs within each shard output are ordered so that they can be merged lazily;
+    # the rows a shard buffers behind a slow batch are bounded by its read-ahead
+    kwargs["ordered"] = True
+
+    async def run_shard(index: int) -> Dict[str, Any]:
+        """subflow processing one shard of the input"""
+        started = time.monotonic()
+        stats = await abatch_inference(
+            llm,
+            input_path,
+            shard_output_path(output_path, index, n_shards),
+            shard=(index, n_shards),
+            shard_by=shard_by,
+            **kwargs,
+        )
+        return {"shard": index, **stats, "duration": time.monotonic() - started}
+
+    async def sharded_batch_inference(
+        llm_endpoint: str, input_path: str, output_path: str, n_shards: int
+    ):
+        """flow streaming shards of a JSONL file through an LLM"""
+        # shards are subflows rather than tasks, as recorded LLM calls are flows;
+        # each has its own flow, as concurrent runs cannot share a task runner
+        states = await asyncio.gather(
+            *[
+                flow(
+                    run_shard,
+                    name="Batch Inference Shard",
+                    flow_run_name=f"shard-{index}",
+                    retries=shard_retries,
+                    validate_parameters=False,
+                )(index, return_state=True)
+                for index in range(n_shards)
+            ]
+        )
+        results = [
+            await state.result(raise_on_failure=False, fetch=True) for state in states
+        ]
+
+        shard_stats = [r for r in results if not isinstance(r, BaseException)]
+        if shard_stats:
+            await create_table_artifact(
+                table=shard_stats,
+                description=f"Progress, tokens and latency per shard of {input_path}",
+            )
+
+        if failed := [i for i, r in enumerate(results) if isinstance(r, BaseException)]:
+            raise RuntimeError(
+                f"Shards {failed} of {input_path} failed. Rerun to resume them."
+            )
+
+        if dry_run := kwargs.get("dry_run"):
+            await dry_run.publish()
+            return shard_stats
+
+        merge_shard_outputs(
+            [shard_output_path(output_path, i, n_shards) for i in range(n_shards)],
+            output_path,
+        )
+        return shard_stats
+
+    return flow(**flow_kwargs)(sharded_batch_inference)(
+        llm_endpoint=llm.__module__,
+        input_path=str(input_path),
+        output_path=str(output_path),
+        n_shards=n_shards,
+    )
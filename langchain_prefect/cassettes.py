@@ -0,0 +1,252 @@
+"""Record and replay the results of LLM calls for deterministic reruns."""
+
+import json
+import os
+import threading
+from functools import wraps
+from pathlib import Path
+from typing import Any, Callable, Dict, Literal
+
+from langchain.schema import (
+    BaseMessage,
+    ChatGeneration,
+    ChatResult,
+    Generation,
+    LLMResult,
+    messages_from_dict,
+    messages_to_dict,
+)
+from prefect.utilities.asyncutils import is_async_fn
+
+from langchain_prefect.storage import IGNORED_KWARGS, content_hash
+from langchain_prefect.utilities import LLMInvocation, get_current_logger
+
+FINGERPRINT_LENGTH = 64
+
+
+class CassetteMiss(LookupError):
+    """Raised when a strict cassette in replay mode has no recorded result."""
+
+
+def _fingerprint_default(obj: Any) -> Any:
+    """Serialize messages with their type, and `repr` anything else."""
+    if isinstance(obj, BaseMessage):
+        return messages_to_dict([obj])[0]
+    return obj.dict() if hasattr(obj, "dict") else repr(obj)
+
+
+def fingerprint(invocation: LLMInvocation, llm: Any = None) -> str:
+    """Return the hash of the endpoint, model parameters and inputs of a call."""
+    request = {
+        "llm_endpoint": invocation.llm_endpoint,
+        "llm_params": getattr(llm, "_identifying_params", None),
+        "invocation_fn": invocation.invocation_fn.__name__,
+        "prompts": invocation.prompts,
+        "args": invocation.args,
+        "kwargs": {
+            k: v for k, v in invocation.kwargs.items() if k not in IGNORED_KWARGS
+        },
+    }
+    return content_hash(
+        json.dumps(
+            request,
+            default=_fingerprint_default,
+            sort_keys=True,
+            separators=(",", ":"),
+        ).encode()
+    )
+
+
+def _dump_generation(generation: Generation) -> Dict[str, Any]:
+    """Return a JSON serializable dict of a generation, keeping chat messages."""
+    if isinstance(generation, ChatGeneration):
+        return {
+            "message": messages_to_dict([generation.message])[0],
+            "generation_info": generation.generation_info,
+        }
+    return generation.dict()
+
+
+def _load_generation(data: Dict[str, Any]) -> Generation:
+    """Return the generation serialized by `_dump_generation`."""
+    if "message" in data:
+        return ChatGeneration(
+            message=messages_from_dict([data["message"]])[0],
+            generation_info=data["generation_info"],
+        )
+    return Generation(**data)
+
+
+def dump_result(result: LLMResult | ChatResult) -> Dict[str, Any]:
+    """Return a JSON serializable dict of an LLM or chat result."""
+    if isinstance(result, ChatResult):
+        return {
+            "chat": True,
+            "generations": [_dump_generation(g) for g in result.generations],
+            "llm_output": result.llm_output,
+        }
+    # the run info of a call is not part of its result, and holds a UUID;
+    # chat models return chat generations from `generate` too
+    return {
+        "generations": [[_dump_generation(g) for g in gs] for gs in result.generations],
+        "llm_output": result.llm_output,
+    }
+
+
+def load_result(data: Dict[str, Any]) -> LLMResult | ChatResult:
+    """Return the LLM or chat result serialized by `dump_result`."""
+    if data.get("chat"):
+        return ChatResult(
+            generations=[_load_generation(g) for g in data["generations"]],
+            llm_output=data["llm_output"],
+        )
+    return LLMResult(
+        generations=[[_load_generation(g) for g in gs] for gs in data["generations"]],
+        llm_output=data["llm_output"],
+    )
+
+
+class Cassette:
+    """Stores LLM results by request fingerprint, to replay them without calls."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        mode: Literal["record", "replay"] = "replay",
+        policy: Literal["strict", "fallthrough"] = "strict",
+    ):
+        """Stores LLM results by request fingerprint, to replay them without calls.
+
+        A cassette is an append-only file with one line per recorded call: the
+        request fingerprint followed by the compact JSON of its result. Only the
+        fingerprints and their offsets are kept in memory, and each replayed
+        result is read from disk when needed.
+
+        Args:
+            path: The cassette file.
+            mode: In `record` mode, every call is made and its result recorded,
+                replacing any earlier result for the same request. In `replay`
+                mode, recorded results are returned without calling the LLM.
+            policy: What to do in `replay` mode for a request that was not
+                recorded: `strict` raises `CassetteMiss`, `fallthrough` calls
+                the LLM and records its result.
+
+        Example:
+            Record the LLM calls of a flow once, then replay them in CI:
+
+            >>> mode = "replay" if os.getenv("CI") else "record"
+            >>> with RecordLLMCalls(cassette=Cassette("tests/agent.jsonl", mode)):
+            >>>     my_flow()
+        """
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown cassette mode {mode!r}.")
+        if policy not in ("strict", "fallthrough"):
+            raise ValueError(f"Unknown cassette policy {policy!r}.")
+        self.path = Path(path)
+        self.mode = mode
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self._index: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        """Index the offset of the last result recorded for each fingerprint."""
+        if not self.path.exists():
+            return
+        offset = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._index[line[:FINGERPRINT_LENGTH].decode()] = offset
+                offset += len(line)
+
+        if offset < self.path.stat().st_size and (
+            self.mode == "record" or self.policy == "fallthrough"
+        ):
+            # discard a result that was interrupted while being recorded
+            os.truncate(self.path, offset)
+
+    def __contains__(self, request_fingerprint: str) -> bool:
+        """Return whether a result is recorded for a request fingerprint."""
+        return request_fingerprint in self._index
+
+    def __len__(self) -> int:
+        """Return the number of recorded requests."""
+        return len(self._index)
+
+    def get(self, request_fingerprint: str) -> LLMResult | ChatResult:
+        """Return the result recorded for a request fingerprint."""
+        with self._lock:
+            offset = self._index[request_fingerprint]
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                line = f.readline()
+        return load_result(json.loads(line[FINGERPRINT_LENGTH + 1 :]))
+
+    def put(self, request_fingerprint: str, result: LLMResult | ChatResult):
+        """Record the result of a request."""
+        line = (
+            request_fingerprint.encode()
+            + b" "
+            + json.dumps(dump_result(result), separators=(",", ":")).encode()
+            + b"\n"
+        )
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "ab") as f:
+                offset = f.tell()
+                f.write(line)
+            self._index[request_fingerprint] = offset
+
+    def _replay(self, request_fingerprint: str, llm_endpoint: str) -> bool:
+        """Return whether to replay a request, raising if it must but cannot."""
+        if self.mode == "record":
+            return False
+        if request_fingerprint in self:
+            self.hits += 1
+            return True
+        self.misses += 1
+        if self.policy == "strict":
+            raise CassetteMiss(
+                f"No result recorded for this call to {llm_endpoint!r} in"
+                f" {str(self.path)!r}. Record it with mode='record', or use"
+                " policy='fallthrough'."
+            )
+        get_current_logger(__name__).info(
+            f"Calling {llm_endpoint!r}: no result recorded in {str(self.path)!r}."
+        )
+        return False
+
+    def wrap(
+        self,
+        request_fingerprint: str,
+        llm_endpoint: str,
+        func: Callable[..., LLMResult],
+    ) -> Callable[..., LLMResult]:
+        """Wrap an LLM call so that its result is replayed or recorded."""
+        if is_async_fn(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                """async wrapper replaying or recording results"""
+                if self._replay(request_fingerprint, llm_endpoint):
+                    return self.get(request_fingerprint)
+                result = await func(*args, **kwargs)
+                self.put(request_fingerprint, result)
+                return result
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            """wrapper replaying or recording results"""
+            if self._replay(request_fingerprint, llm_endpoint):
+                return self.get(request_fingerprint)
+            result = func(*args, **kwargs)
+            self.put(request_fingerprint, result)
+            return result
+
+        return wrapper
@@ -0,0 +1,287 @@
+"""Per-endpoint circuit breaker for recorded LLM calls."""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import deque
+from enum import Enum
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, List
+
+from langchain.base_language import BaseLanguageModel
+from langchain.schema import LLMResult
+from prefect.utilities.asyncutils import is_async_fn
+
+from langchain_prefect.utilities import get_current_logger
+
+
+# the LLM calls made through `CircuitBreaker.wrap` by the call in progress
+_calls_made: contextvars.ContextVar[List[bool] | None] = contextvars.ContextVar(
+    "langchain_prefect_calls_made", default=None
+)
+
+
+class CircuitState(str, Enum):
+    """State of a circuit."""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+
+class CircuitOpen(RuntimeError):
+    """Raised when calling an endpoint whose circuit is open."""
+
+
+class _Circuit:
+    """Call outcomes and state of a single endpoint."""
+
+    def __init__(self, window_size: int):
+        self.state = CircuitState.CLOSED
+        self.outcomes: Deque[bool] = deque(maxlen=window_size)
+        self.opened_at = 0.0
+        self.probes = 0
+
+
+class CircuitBreaker:
+    """Opens a circuit per LLM endpoint when calls fail or are too slow."""
+
+    def __init__(
+        self,
+        failure_rate_threshold: float = 0.5,
+        latency_threshold: float | None = None,
+        window_size: int = 20,
+        min_calls: int = 5,
+        recovery_timeout: float = 30,
+        half_open_max_calls: int = 1,
+        fallback: BaseLanguageModel | None = None,
+    ):
+        """Opens a circuit per LLM endpoint when calls fail or are too slow.
+
+        Args:
+            failure_rate_threshold: The fraction of failed or slow calls in the
+                window at which the circuit opens.
+            latency_threshold: Calls taking longer than this many seconds count
+                as failures. If `None`, latency is not considered.
+            window_size: The number of most recent calls considered.
+            min_calls: The minimum number of calls in the window before the
+                circuit can open.
+            recovery_timeout: Seconds to wait before probing an open circuit.
+            half_open_max_calls: The number of concurrent probe calls allowed
+                while half-open.
+            fallback: An LLM to route calls to while the circuit is open. If
+                `None`, calls fail fast with `CircuitOpen`. Calls to the fallback
+                itself bypass the breaker, so it may share the endpoint of the
+                LLMs it stands in for.
+
+        Example:
+            Route calls to a cheaper model while the primary one is struggling:
+
+            >>> breaker = CircuitBreaker(
+            >>>     latency_threshold=10, fallback=OpenAI(model_name="text-curie-001")
+            >>> )
+            >>> with RecordLLMCalls(circuit_breaker=breaker):
+            >>>     llm = OpenAI(model_name="text-davinci-003")
+            >>>     llm("What would be a good company name for colorful socks?")
+        """
+        self.failure_rate_threshold = failure_rate_threshold
+        self.latency_threshold = latency_threshold
+        self.window_size = window_size
+        self.min_calls = min_calls
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.fallback = fallback
+
+        self._circuits: Dict[str, _Circuit] = {}
+        self._lock = threading.Lock()
+
+    def state(self, llm_endpoint: str) -> CircuitState:
+        """Return the current state of the circuit for an endpoint."""
+        with self._lock:
+            return self._get_circuit(llm_endpoint).state
+
+    def is_fallback_llm(self, llm: BaseLanguageModel) -> bool:
+        """Return whether an LLM instance is the fallback of this breaker."""
+        return self.fallback is not None and llm is self.fallback
+
+    def allow(self, llm_endpoint: str) -> bool:
+        """Return whether a call to the endpoint may proceed.
+
+        Returns `False` if the circuit is open and a fallback is configured.
+
+        Raises:
+            CircuitOpen: If the circuit is open and there is no fallback.
+        """
+        with self._lock:
+            circuit = self._get_circuit(llm_endpoint)
+
+            if (
+                circuit.state == CircuitState.OPEN
+                and time.monotonic() - circuit.opened_at >= self.recovery_timeout
+            ):
+                self._transition(llm_endpoint, circuit, CircuitState.HALF_OPEN)
+
+            if circuit.state == CircuitState.CLOSED:
+                return True
+            if (
+                circuit.state == CircuitState.HALF_OPEN
+                and circuit.probes < self.half_open_max_calls
+            ):
+                circuit.probes += 1
+                return True
+
+        if self.fallback is None:
+            raise CircuitOpen(
+                f"Circuit for {llm_endpoint!r} is {circuit.state.value}."
+                f" Did not call {llm_endpoint!r}."
+            )
+        return False
+
+    def record(self, llm_endpoint: str, failed: bool, latency: float = 0.0):
+        """Record the outcome of a call and update the circuit state."""
+        failed = failed or bool(
+            self.latency_threshold and latency > self.latency_threshold
+        )
+        with self._lock:
+            circuit = self._get_circuit(llm_endpoint)
+
+            if circuit.state == CircuitState.HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+                self._transition(
+                    llm_endpoint,
+                    circuit,
+                    CircuitState.OPEN if failed else CircuitState.CLOSED,
+                )
+                return
+
+            circuit.outcomes.append(failed)
+            n_failed = sum(circuit.outcomes)
+            if (
+                circuit.state == CircuitState.CLOSED
+                and len(circuit.outcomes) >= self.min_calls
+                and n_failed / len(circuit.outcomes) >= self.failure_rate_threshold
+            ):
+                self._transition(
+                    llm_endpoint,
+                    circuit,
+                    CircuitState.OPEN,
+                    reason=f" after {n_failed}/{len(circuit.outcomes)} failed"
+                    " or slow calls",
+                )
+
+    def release(self, llm_endpoint: str):
+        """Give back the probe slot taken by `allow` for a call that was not made."""
+        with self._lock:
+            circuit = self._get_circuit(llm_endpoint)
+            if circuit.state == CircuitState.HALF_OPEN:
+                circuit.probes = max(circuit.probes - 1, 0)
+
+    def wrap(
+        self, llm_endpoint: str, func: Callable[..., LLMResult]
+    ) -> Callable[..., LLMResult]:
+        """Wrap an LLM call so that its errors and latency are recorded.
+
+        A cancelled call releases its probe slot without recording an outcome.
+        """
+        if is_async_fn(func):
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                """async wrapper recording call outcomes"""
+                if (calls_made := _calls_made.get()) is not None:
+                    calls_made.append(True)
+                start = time.monotonic()
+                try:
+                    result = await func(*args, **kwargs)
+                except Exception:
+                    self.record(llm_endpoint, True, time.monotonic() - start)
+                    raise
+                except BaseException:
+                    self.release(llm_endpoint)
+                    raise
+                self.record(llm_endpoint, False, time.monotonic() - start)
+                return result
+
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            """wrapper recording call outcomes"""
+            if (calls_made := _calls_made.get()) is not None:
+                calls_made.append(True)
+            start = time.monotonic()
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                self.record(llm_endpoint, True, time.monotonic() - start)
+                raise
+            except BaseException:
+                self.release(llm_endpoint)
+                raise
+            self.record(llm_endpoint, False, time.monotonic() - start)
+            return result
+
+        return wrapper
+
+    def releasing(
+        self, llm_endpoint: str, call: Callable[[], Any]
+    ) -> Callable[[], Any]:
+        """Return `call`, releasing the probe slot `allow` took for it if needed.
+
+        The slot is given back if `call` does not reach a call wrapped by `wrap`,
+        e.g. because a cassette replays its result or its flow run fails first.
+        """
+        if is_async_fn(call):
+
+            async def async_call():
+                """Await the call, releasing its probe slot if the LLM is not called."""
+                token = _calls_made.set(calls_made := [])
+                try:
+                    return await call()
+                finally:
+                    _calls_made.reset(token)
+                    if not calls_made:
+                        self.release(llm_endpoint)
+
+            return async_call
+
+        def released_call():
+            """Make the call, releasing its probe slot if the LLM is not called."""
+            token = _calls_made.set(calls_made := [])
+            try:
+                return call()
+            finally:
+                _calls_made.reset(token)
+                if not calls_made:
+                    self.release(llm_endpoint)
+
+        return released_call
+
+    def _get_circuit(self, llm_endpoint: str) -> _Circuit:
+        """Return the circuit for an endpoint, creating it if needed."""
+        if llm_endpoint not in self._circuits:
+            self._circuits[llm_endpoint] = _Circuit(self.window_size)
+        return self._circuits[llm_endpoint]
+
+    def _transition(
+        self,
+        llm_endpoint: str,
+        circuit: _Circuit,
+        state: CircuitState,
+        reason: str = "",
+    ):
+        """Move a circuit to a new state and log the change."""
+        previous, circuit.state = circuit.state, state
+        if state == CircuitState.OPEN:
+            circuit.opened_at = time.monotonic()
+        if state == CircuitState.CLOSED:
+            circuit.outcomes.clear()
+        if state != CircuitState.HALF_OPEN:
+            circuit.probes = 0
+
+        get_current_logger(__name__).log(
+            logging.WARNING if state == CircuitState.OPEN else logging.INFO,
+            f"Circuit for {llm_endpoint!r} changed from {previous.value}"
+            f" to {state.value}{reason}.",
+        )
@@ -0,0 +1,109 @@
+"""Bounded executor for sync LangChain calls made from async code."""
+
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from langchain_prefect.utilities import get_current_logger
+
+
+class SyncCallExecutor:
+    """Runs sync LangChain calls awaited from async code on worker threads."""
+
+    def __init__(self, max_workers: int = 8, queue_time_warning: float = 1.0):
+        """Runs sync LangChain calls awaited from async code on worker threads.
+
+        A sync call made from a thread running an event loop, such as a sync
+        chain called from an async request handler, blocks the loop until the
+        provider answers. Awaiting the call with `arun` instead runs it, and the
+        recording of the LLM calls it makes, on a worker thread, while the loop
+        serves other requests. The number of calls in flight is bounded, and
+        waiting for a free worker is reported.
+
+        Args:
+            max_workers: The maximum number of calls running at once.
+            queue_time_warning: Log a warning when a call waits longer than this
+                many seconds for a free worker.
+
+        Example:
+            Run a sync chain from async request handlers on 4 threads:
+
+            >>> executor = SyncCallExecutor(max_workers=4)
+            >>> @app.post("/ask")
+            >>> async def ask(question: str):  # noqa: D103
+            >>>     return await executor.arun(chain.run, question)
+            >>> with RecordLLMCalls():
+            >>>     uvicorn.run(app)
+            >>> executor.stats()
+        """
+        self.max_workers = max_workers
+        self.queue_time_warning = queue_time_warning
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="langchain-prefect"
+        )
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._calls = 0
+        self._saturated_calls = 0
+        self._total_queue_time = 0.0
+        self._max_queue_time = 0.0
+
+    async def arun(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run `fn` on a worker thread with the caller's context and await it."""
+        with self._lock:
+            self._calls += 1
+            self._in_flight += 1
+            if saturated := self._in_flight > self.max_workers:
+                self._saturated_calls += 1
+        if saturated:
+            get_current_logger(__name__).warning(
+                f"All {self.max_workers} workers are busy; sync call is queued."
+            )
+
+        submitted = time.monotonic()
+
+        def _run():
+            """Run the call, recording how long it waited for a worker."""
+            queue_time = time.monotonic() - submitted
+            with self._lock:
+                self._total_queue_time += queue_time
+                self._max_queue_time = max(self._max_queue_time, queue_time)
+            if queue_time > self.queue_time_warning:
+                get_current_logger(__name__).warning(
+                    f"Sync call waited {queue_time:.2f}s for a worker."
+                )
+            return fn(*args, **kwargs)
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, contextvars.copy_context().run, _run
+            )
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the number of calls, saturation and queue times so far."""
+        with self._lock:
+            return {
+                "calls": self._calls,
+                "in_flight": self._in_flight,
+                "saturated_calls": self._saturated_calls,
+                "mean_queue_time": self._total_queue_time / max(self._calls, 1),
+                "max_queue_time": self._max_queue_time,
+            }
+
+    def shutdown(self, wait: bool = True):
+        """Shut down the worker threads."""
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        """Return the executor, to shut it down on exit."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Shut the executor down."""
+        self.shutdown()
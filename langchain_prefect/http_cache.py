@@ -0,0 +1,209 @@
+"""On-disk cache of HTTP responses revalidated with conditional requests."""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+import httpx
+from prefect.settings import PREFECT_HOME
+
+from langchain_prefect.storage import content_hash
+
+# request headers that select a different response for the same URL
+VARY_HEADERS = ("Accept", "Authorization")
+
+
+def cache_key(request: httpx.Request) -> str:
+    """Return the key of the cached response to a request."""
+    return content_hash(
+        "\n".join(
+            [str(request.url), *(request.headers.get(h, "") for h in VARY_HEADERS)]
+        ).encode()
+    )
+
+
+class HttpCache:
+    """Stores HTTP responses with validators on disk, evicting the least used."""
+
+    def __init__(self, path: str | Path | None = None, max_bytes: int = 256 * 2**20):
+        """Stores HTTP responses with validators on disk, evicting the least used.
+
+        Each response is stored in its own file: a line of JSON with its status
+        and headers, followed by its body. Only the keys and sizes of responses
+        are kept in memory.
+
+        Args:
+            path: The directory to store responses in. Defaults to
+                `$PREFECT_HOME/langchain_prefect/http_cache`.
+            max_bytes: The maximum total size of the stored responses. The least
+                recently used responses are evicted beyond it.
+
+        Example:
+            Revalidate the pages of issues and comments loaded on the last run:
+
+            >>> cache = HttpCache(max_bytes=50 * 2**20)
+            >>> loader = GithubIssueLoader("prefecthq/prefect", 500, cache=cache)
+            >>> documents = loader.load()
+            >>> print(cache.hits, cache.misses)
+        """
+        self.path = Path(
+            path or PREFECT_HOME.value() / "langchain_prefect" / "http_cache"
+        )
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._sizes: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _load_index(self):
+        """Index the stored responses, from the least to the most recently used."""
+        if not self.path.exists():
+            return
+        entries = [(f.stat(), f.stem) for f in self.path.glob("*.http")]
+        for stat, key in sorted(entries, key=lambda entry: entry[0].st_mtime):
+            self._sizes[key] = stat.st_size
+
+    @property
+    def size(self) -> int:
+        """The total size of the stored responses, in bytes."""
+        return sum(self._sizes.values())
+
+    def __contains__(self, key: str) -> bool:
+        """Return whether a response is stored for a key."""
+        return key in self._sizes
+
+    def __len__(self) -> int:
+        """Return the number of stored responses."""
+        return len(self._sizes)
+
+    def _file(self, key: str) -> Path:
+        """Return the file of a stored response."""
+        return self.path / f"{key}.http"
+
+    def get(self, key: str) -> Tuple[Dict[str, Any], bytes] | None:
+        """Return the metadata and body of a stored response, if any."""
+        with self._lock:
+            if key not in self._sizes:
+                return None
+            try:
+                with open(self._file(key), "rb") as f:
+                    metadata = json.loads(f.readline())
+                    body = f.read()
+            except (OSError, ValueError):
+                # removed by another process, or interrupted while being stored
+                self._sizes.pop(key)
+                return None
+            self._sizes.move_to_end(key)
+            os.utime(self._file(key))
+        return metadata, body
+
+    def put(self, key: str, metadata: Dict[str, Any], body: bytes):
+        """Store a response, evicting the least recently used beyond `max_bytes`."""
+        data = json.dumps(metadata, separators=(",", ":")).encode() + b"\n" + body
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            self.path.mkdir(parents=True, exist_ok=True)
+            tmp_file = self._file(key).with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_file.write_bytes(data)
+            os.replace(tmp_file, self._file(key))
+            self._sizes[key] = len(data)
+            self._sizes.move_to_end(key)
+            total = sum(self._sizes.values())
+            while total > self.max_bytes:
+                evicted, size = self._sizes.popitem(last=False)
+                self._file(evicted).unlink(missing_ok=True)
+                total -= size
+
+
+class CachingTransport(httpx.AsyncBaseTransport):
+    """Transport revalidating cached GET responses with conditional requests."""
+
+    def __init__(
+        self, cache: HttpCache, transport: httpx.AsyncBaseTransport | None = None
+    ):
+        """Transport revalidating cached GET responses with conditional requests.
+
+        Successful GET responses with an `ETag` or `Last-Modified` header are
+        stored in `cache`. Later requests for the same URL send `If-None-Match`
+        or `If-Modified-Since`, and a `304 Not Modified` response is answered
+        with the stored response. GitHub does not count 304 responses against
+        the rate limit.
+
+        Args:
+            cache: The `HttpCache` to store responses in.
+            transport: The transport sending requests. Defaults to a new
+                `httpx.AsyncHTTPTransport`.
+
+        Example:
+            Cache the responses of a client:
+
+            >>> transport = CachingTransport(HttpCache("~/.cache/github"))
+            >>> async with httpx.AsyncClient(transport=transport) as client:
+            >>>     await client.get("https://api.github.com/repos/prefecthq/prefect")
+        """
+        self.cache = cache
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """Send a request, conditional if its response is cached."""
+        if request.method != "GET":
+            return await self.transport.handle_async_request(request)
+
+        key = cache_key(request)
+        cached = self.cache.get(key)
+        if cached:
+            metadata, body = cached
+            if metadata["etag"]:
+                request.headers["If-None-Match"] = metadata["etag"]
+            if metadata["last_modified"]:
+                request.headers["If-Modified-Since"] = metadata["last_modified"]
+
+        response = await self.transport.handle_async_request(request)
+
+        if cached and response.status_code == 304:
+            await response.aclose()
+            self.cache.hits += 1
+            return httpx.Response(
+                metadata["status_code"],
+                headers=metadata["headers"],
+                content=body,
+                request=request,
+                extensions={**response.extensions, "from_cache": True},
+            )
+
+        self.cache.misses += 1
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if response.status_code != 200 or not (etag or last_modified):
+            return response
+
+        # keep the encoded body, which the client decodes with the headers
+        body = b"".join([chunk async for chunk in response.stream])
+        await response.aclose()
+        self.cache.put(
+            key,
+            {
+                "url": str(request.url),
+                "status_code": response.status_code,
+                "headers": response.headers.multi_items(),
+                "etag": etag,
+                "last_modified": last_modified,
+            },
+            body,
+        )
+        return httpx.Response(
+            response.status_code,
+            headers=response.headers,
+            content=body,
+            request=request,
+            extensions=response.extensions,
+        )
+
+    async def aclose(self):
+        """Close the underlying transport."""
+        await self.transport.aclose()
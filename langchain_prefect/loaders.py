@@ -4,27 +4,73 @@ import httpx
 import os
 import shutil
 import tempfile
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List
+from typing import AsyncIterator, List
 
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
+from langchain_prefect.http_cache import CachingTransport, HttpCache
 from langchain_prefect.types import GitHubComment, GitHubIssue
-from prefect.utilities.asyncutils import sync_compatible
+from prefect.utilities.asyncutils import sync, sync_compatible
 
 
 class GithubIssueLoader(BaseLoader):
     """Loader for GitHub issues for a given repository."""
 
-    def __init__(self, repo: str, n_issues: int):
+    def __init__(
+        self,
+        repo: str,
+        n_issues: int,
+        max_concurrency: int = 10,
+        client: httpx.AsyncClient | None = None,
+        http2: bool = False,
+        limits: httpx.Limits | None = None,
+        cache: HttpCache | None = None,
+    ):
         """
         Initialize the loader with the given repository.
 
+        Requests share a pool of keep-alive connections: that of the loader while
+        it is entered with `async with`, or else one per call of `load`/`aload`.
+
         Args:
             repo: The name of the repository, in the format "<owner>/<repo>"
+            n_issues: The maximum number of issues to load.
+            max_concurrency: The maximum number of issues whose comments are
+                fetched at once.
+            client: An `httpx.AsyncClient` to send requests with instead of
+                pooling connections in the loader, e.g. to share it between
+                loaders or to use another transport. It is not closed by the
+                loader.
+            http2: Whether to multiplex requests over HTTP/2 connections. Needs
+                `pip install httpx[http2]`.
+            limits: The connection limits of the pool. Defaults to keeping
+                `max_concurrency` connections alive.
+            cache: An `HttpCache` to store the pages of issues and comments in,
+                and to revalidate them from with conditional requests, which do
+                not count against the rate limit. To cache the requests of an
+                injected `client`, give it a `CachingTransport` instead.
+
+        Example:
+            Load the issues of two repositories over the same connections:
+
+            >>> async with GithubIssueLoader("prefecthq/prefect", 500) as loader:
+            >>>     documents = await loader.aload()
+            >>>     loader.repo = "prefecthq/langchain-prefect"
+            >>>     documents += await loader.aload()
         """
         self.repo = repo
         self.n_issues = n_issues
+        self.max_concurrency = max_concurrency
+        self.client = client
+        self.http2 = http2
+        self.limits = limits or httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+        )
+        self.cache = cache
+        self._owned_client: httpx.AsyncClient | None = None
         self.request_headers = {
             "Accept": "application/vnd.github.v3+json",
         }
@@ -32,20 +78,52 @@ class GithubIssueLoader(BaseLoader):
         if token := os.environ.get("GITHUB_TOKEN"):
             self.request_headers["Authorization"] = f"Bearer {token}"
 
-    def _get_issue_comments(
-        self, issue_number: int, per_page: int = 100
+    def _new_client(self) -> httpx.AsyncClient:
+        """Return a client pooling connections with the limits of the loader."""
+        transport = httpx.AsyncHTTPTransport(http2=self.http2, limits=self.limits)
+        if self.cache is not None:
+            transport = CachingTransport(self.cache, transport)
+        return httpx.AsyncClient(transport=transport)
+
+    @asynccontextmanager
+    async def _session(self) -> AsyncIterator[httpx.AsyncClient]:
+        """Yield the client of the loader, or a client for one load."""
+        if client := self.client or self._owned_client:
+            yield client
+        else:
+            async with self._new_client() as client:
+                yield client
+
+    async def aclose(self):
+        """Close the connections pooled by the loader, if it was entered."""
+        if self._owned_client:
+            await self._owned_client.aclose()
+            self._owned_client = None
+
+    async def __aenter__(self):
+        """Pool connections until the loader is exited."""
+        if not self.client and not self._owned_client:
+            self._owned_client = self._new_client()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Close the connections pooled by the loader."""
+        await self.aclose()
+
+    async def _get_issue_comments(
+        self, client: httpx.AsyncClient, issue_number: int, per_page: int = 100
     ) -> List[GitHubComment]:
         """
         Get a list of all comments for the given issue.
 
         Returns:
-            A list of dictionaries, each representing a comment.
+            A list of `GitHubComment` objects, each representing a comment.
         """
         url = f"https://api.github.com/repos/{self.repo}/issues/{issue_number}/comments"
         comments = []
         page = 1
         while True:
-            response = httpx.get(
+            response = await client.get(
                 url=url,
                 headers=self.request_headers,
                 params={"per_page": per_page, "page": page},
@@ -57,7 +135,9 @@ class GithubIssueLoader(BaseLoader):
             page += 1
         return comments
 
-    def _get_issues(self, per_page: int = 100) -> List[GitHubIssue]:
+    async def _get_issues(
+        self, client: httpx.AsyncClient, per_page: int = 100
+    ) -> List[GitHubIssue]:
         """
         Get a list of all issues for the given repository.
 
@@ -71,7 +151,7 @@ class GithubIssueLoader(BaseLoader):
             if len(issues) >= self.n_issues:
                 break
             remaining = self.n_issues - len(issues)
-            response = httpx.get(
+            response = await client.get(
                 url=url,
                 headers=self.request_headers,
                 params={
@@ -87,20 +167,32 @@ class GithubIssueLoader(BaseLoader):
             page += 1
         return issues
 
-    def load(self) -> List[Document]:
+    async def aload(self) -> List[Document]:
         """
-        Load all issues for the given repository.
+        Load all issues for the given repository, fetching comments concurrently.
 
         Returns:
-            A list of `Document` objects, each representing an issue.
+            A list of `Document` objects, each representing an issue, in the
+            order of the issues.
         """
-        issues = self._get_issues()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def get_comments(issue: GitHubIssue) -> List[GitHubComment]:
+            """Get the comments of an issue, if it has any."""
+            if not issue.comments:
+                return []
+            async with semaphore:
+                return await self._get_issue_comments(client, issue.number)
+
+        async with self._session() as client:
+            issues = await self._get_issues(client)
+            issue_comments = await asyncio.gather(*map(get_comments, issues))
+
         documents = []
-        for issue in issues:
+        for issue, comments in zip(issues, issue_comments):
             text = f"{issue.title}\n{issue.body}"
-            if issue.comments:
-                for comment in self._get_issue_comments(issue.number):
-                    text += f"\n\n{comment.user.login}: {comment.body}\n\n"
+            for comment in comments:
+                text += f"\n\n{comment.user.login}: {comment.body}\n\n"
             metadata = {
                 "source": issue.html_url,
                 "title": issue.title,
@@ -109,6 +201,15 @@ class GithubIssueLoader(BaseLoader):
             documents.append(Document(page_content=text, metadata=metadata))
         return documents
 
+    def load(self) -> List[Document]:
+        """
+        Load all issues for the given repository.
+
+        Returns:
+            A list of `Document` objects, each representing an issue.
+        """
+        return sync(self.aload)
+
 
 class GitHubRepoLoader(BaseLoader):
     """Loader for files on GitHub that match a glob pattern."""
@@ -1,71 +1,615 @@
 """Module for defining Prefect plugins for langchain."""
 
+import asyncio
+import contextvars
+import inspect
+import json
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import ContextDecorator
-from functools import wraps
-from typing import Callable
+from fnmatch import fnmatch
+from functools import lru_cache, partial, wraps
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import UUID
 
 from langchain.schema import LLMResult
 from langchain.base_language import BaseLanguageModel
+from langchain.chat_models.base import BaseChatModel
 from prefect import Flow
+from prefect import get_run_logger
 from prefect import tags as prefect_tags
+from prefect.context import FlowRunContext, PrefectObjectRegistry, TagsContext
+from prefect.utilities.asyncutils import is_async_fn
 
+from langchain_prefect.cassettes import Cassette, fingerprint
+from langchain_prefect.circuit_breaker import CircuitBreaker
+from langchain_prefect.routing import TokenCountRouter
+from langchain_prefect.storage import BlobStore
+from langchain_prefect.usage import DryRunEstimator, UsageTracker, get_model_name
 from langchain_prefect.utilities import (
+    ResultLogConfig,
     flow_wrapped_fn,
     get_prompt_content,
+    json_default,
     llm_invocation_summary,
+    merge_llm_results,
     num_tokens,
 )
 
+# the usage tracker of the recorded call in progress, which counts its usage once
+# rather than again in the patched methods it calls, such as `_generate`
+_tracking_usage: contextvars.ContextVar[UsageTracker | None] = contextvars.ContextVar(
+    "langchain_prefect_tracking_usage", default=None
+)
+# the router of the recorded call in progress, which routes it once rather than
+# again in the patched methods it calls
+_routing: contextvars.ContextVar[TokenCountRouter | None] = contextvars.ContextVar(
+    "langchain_prefect_routing", default=None
+)
+
 
 def record_llm_call(
     func: Callable[..., LLMResult],
     tags: set | None = None,
     max_prompt_tokens: int | None = int(1e4),
     flow_kwargs: dict | None = None,
+    usage_tracker: UsageTracker | None = None,
+    circuit_breaker: CircuitBreaker | None = None,
+    router: TokenCountRouter | None = None,
+    blob_store: BlobStore | None = None,
+    max_parameter_bytes: int = 2048,
+    result_log_config: ResultLogConfig | None = None,
+    dry_run: DryRunEstimator | None = None,
+    cassette: Cassette | None = None,
+    sub_batch_size: int | None = None,
+    max_sub_batch_concurrency: int = 4,
+    deduplicate_prompts: bool = False,
 ) -> Callable[..., Flow]:
     """Decorator for wrapping a Langchain LLM call with a prefect flow."""
 
     tags = tags or set()
 
-    @wraps(func)
-    def wrapper(*args, **kwargs):
-        """wrapper for LLM calls"""
+    def prepare_call(*args, **kwargs) -> Tuple[Callable[[], Any], List[str]]:
+        """Return how to make an LLM call, and the tags to make it with."""
         invocation_artifact = llm_invocation_summary(
             invocation_fn=func, *args, **kwargs
         )
 
-        llm_endpoint = invocation_artifact.content["llm_endpoint"]
-        prompts = invocation_artifact.content["prompts"]
+        llm_endpoint = invocation_artifact.llm_endpoint
+        prompts = invocation_artifact.prompts
 
-        if max_prompt_tokens and (
-            (N := num_tokens(get_prompt_content(prompts))) > max_prompt_tokens
-        ):
+        if dry_run:
+            if isinstance(args[0], BaseChatModel) and not func.__name__.startswith("_"):
+                # chat models are estimated by `_generate` and `_agenerate`, whose
+                # results `generate` turns into the result its callers expect
+                return partial(func, *args, **kwargs), []
+            # project usage instead of calling the LLM, without creating a flow run
+            estimate = dry_run.aestimate if is_async_fn(func) else dry_run.estimate
+            return (
+                partial(
+                    estimate,
+                    args[0],
+                    prompts,
+                    llm_endpoint,
+                    chat=func.__name__ in ("_generate", "_agenerate"),
+                ),
+                [],
+            )
+
+        N = None
+        if max_prompt_tokens or router:
+            N = num_tokens(get_prompt_content(prompts))
+            invocation_artifact.prompt_tokens = N
+
+        if max_prompt_tokens and N > max_prompt_tokens:
             raise ValueError(
                 f"Prompt is too long: it contains {N} tokens"
                 f" and {max_prompt_tokens=}. Did not call {llm_endpoint!r}. "
                 "If desired, increase `max_prompt_tokens`."
             )
 
-        llm_generate = flow_wrapped_fn(func, flow_kwargs, *args, **kwargs)
+        route = router and _routing.get() is not router
+        if (
+            route
+            and not router.is_tier_llm(args[0])
+            and (
+                tier := router.route(
+                    N,
+                    {*TagsContext.get().current_tags, llm_endpoint, *tags},
+                    llm_endpoint,
+                )
+            )
+        ):
+            # the routed call is recorded by the tier's own patched method
+            return (
+                partial(getattr(tier.llm, func.__name__), *args[1:], **kwargs),
+                [f"routed:{tier.name}"],
+            )
+
+        on_start, on_result = [], []
+        if usage_tracker:
+            usage_tracker.check_budget(llm_endpoint)
+        track_usage = usage_tracker and _tracking_usage.get() is not usage_tracker
+        if track_usage:
+            parent_flow_run_context = FlowRunContext.get()
+            on_result.append(
+                partial(
+                    _record_usage,
+                    usage_tracker,
+                    model_name=get_model_name(args[0]),
+                    tags=[llm_endpoint, *tags],
+                    parent_flow_run_id=(
+                        str(parent_flow_run_context.flow_run.id)
+                        if parent_flow_run_context
+                        else None
+                    ),
+                )
+            )
+
+        # calls to the fallback bypass the breaker, whose circuit it may share
+        if circuit_breaker and circuit_breaker.is_fallback_llm(args[0]):
+            breaker = None
+        else:
+            breaker = circuit_breaker
 
-        with prefect_tags(*[llm_endpoint, *tags]):
-            return llm_generate.with_options(
-                flow_run_name=f"Calling {llm_endpoint}"  # noqa: E501
-            )(llm_input=invocation_artifact)
+        llm_call = func
+        is_batch_call = func.__name__ in ("generate", "agenerate")
+        if sub_batch_size and is_batch_call:
+            llm_call = _in_sub_batches(func, sub_batch_size, max_sub_batch_concurrency)
+        if deduplicate_prompts and is_batch_call and _is_deterministic(args[0], kwargs):
+            unique_prompts, positions = _unique_prompts(prompts)
+            invocation_artifact.duplicate_prompts = len(prompts) - len(unique_prompts)
+            if invocation_artifact.duplicate_prompts:
+                llm_call = _deduplicated(llm_call, unique_prompts, positions)
+        if breaker:
+            llm_call = breaker.wrap(llm_endpoint, llm_call)
+        if cassette is not None:
+            # replayed results bypass the circuit breaker
+            llm_call = cassette.wrap(
+                fingerprint(invocation_artifact, args[0]), llm_endpoint, llm_call
+            )
+
+        payload_hash = None
+        if blob_store:
+            payload_hash, blobs = blob_store.encode_invocation(invocation_artifact)
+            on_start.append(partial(blob_store.put_many, blobs))
+            on_result.append(partial(_store_result, blob_store))
+
+        # the result is handed over outside of the flow run state, with the id of
+        # the flow run, so that its parent flow run, if any, can forget its state
+        results: List[Tuple[UUID, LLMResult]] = []
+        on_result.append(partial(_hand_over, results))
+
+        llm_generate = flow_wrapped_fn(
+            llm_call,
+            flow_kwargs,
+            *args,
+            on_start=on_start,
+            on_result=on_result,
+            result_log_config=result_log_config,
+            return_result=False,
+            **kwargs,
+        )
+        with PrefectObjectRegistry():
+            llm_generate = llm_generate.with_options(
+                flow_run_name=f"Calling {llm_endpoint}"
+            )
+
+        llm_input = invocation_artifact.to_parameters(
+            max_bytes=max_parameter_bytes,
+            payload_hash=payload_hash,
+        )
+        call = _returning_result(
+            partial(llm_generate, llm_input=llm_input), results, is_async_fn(func)
+        )
+        if track_usage:
+            call = _setting(_tracking_usage, usage_tracker, call, is_async_fn(func))
+
+        call_tags = [llm_endpoint, *tags]
+        # take a half-open probe slot last, so that only the call can release it
+        if breaker:
+            if breaker.allow(llm_endpoint):
+                call = breaker.releasing(llm_endpoint, call)
+            else:
+                # route to the fallback, which is itself recorded if patched
+                fallback_method = getattr(breaker.fallback, func.__name__)
+                call, call_tags = partial(fallback_method, *args[1:], **kwargs), []
+        if route:
+            call = _setting(_routing, router, call, is_async_fn(func))
+        return call, call_tags
+
+    if is_async_fn(func):
+
+        @wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            """async wrapper for async LLM calls, recorded on the caller's loop"""
+            llm_call, call_tags = prepare_call(*args, **kwargs)
+            with prefect_tags(*call_tags):
+                return await llm_call()
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        """wrapper for LLM calls"""
+        llm_call, call_tags = prepare_call(*args, **kwargs)
+        with prefect_tags(*call_tags):
+            return llm_call()
+
+    return wrapper
+
+
+def _in_sub_batches(
+    func: Callable[..., LLMResult], sub_batch_size: int, max_concurrency: int
+) -> Callable[..., LLMResult]:
+    """Wrap a `generate` method to split large batches into concurrent sub-batches.
+
+    Sync sub-batches run on a thread pool, async ones as concurrent calls. Their
+    results are merged into one result, in the order of the prompts.
+    """
+    if is_async_fn(func):
+
+        @wraps(func)
+        async def async_wrapper(llm, prompts, *args, **kwargs):
+            """async wrapper generating sub-batches concurrently"""
+            if len(prompts) <= sub_batch_size:
+                return await func(llm, prompts, *args, **kwargs)
+            semaphore = asyncio.Semaphore(max_concurrency)
+
+            async def generate(sub_batch):
+                """Generate a sub-batch once fewer than `max_concurrency` run."""
+                async with semaphore:
+                    return await func(llm, sub_batch, *args, **kwargs)
+
+            return merge_llm_results(
+                await asyncio.gather(
+                    *[
+                        generate(prompts[i : i + sub_batch_size])
+                        for i in range(0, len(prompts), sub_batch_size)
+                    ]
+                )
+            )
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(llm, prompts, *args, **kwargs):
+        """wrapper generating sub-batches on a thread pool"""
+        if len(prompts) <= sub_batch_size:
+            return func(llm, prompts, *args, **kwargs)
+        with ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="langchain-prefect"
+        ) as executor:
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    func,
+                    llm,
+                    prompts[i : i + sub_batch_size],
+                    *args,
+                    **kwargs,
+                )
+                for i in range(0, len(prompts), sub_batch_size)
+            ]
+            return merge_llm_results([future.result() for future in futures])
 
     return wrapper
 
 
+def _is_deterministic(llm: Any, kwargs: dict) -> bool:
+    """Return whether an LLM call samples at temperature 0."""
+    return kwargs.get("temperature", getattr(llm, "temperature", None)) == 0
+
+
+def _unique_prompts(prompts: List[Any]) -> Tuple[List[Any], List[int]]:
+    """Return the distinct prompts of a batch, and the index of each among them."""
+    indexes: Dict[str, int] = {}
+    unique_prompts, positions = [], []
+    for prompt in prompts:
+        key = (
+            prompt
+            if isinstance(prompt, str)
+            else json.dumps(prompt, default=json_default, sort_keys=True)
+        )
+        if key not in indexes:
+            indexes[key] = len(unique_prompts)
+            unique_prompts.append(prompt)
+        positions.append(indexes[key])
+    return unique_prompts, positions
+
+
+def _deduplicated(
+    func: Callable[..., LLMResult], unique_prompts: List[Any], positions: List[int]
+) -> Callable[..., LLMResult]:
+    """Wrap a `generate` method to only generate the distinct prompts of a batch.
+
+    The generations of each distinct prompt are fanned back out to the positions
+    of its duplicates, and the number of duplicates is added to `llm_output`.
+    """
+
+    def fan_out(llm_result: LLMResult) -> LLMResult:
+        """Return the result of the batch with duplicates."""
+        return LLMResult(
+            generations=[llm_result.generations[i] for i in positions],
+            llm_output={
+                **(llm_result.llm_output or {}),
+                "duplicate_prompts": len(positions) - len(unique_prompts),
+            },
+        )
+
+    if is_async_fn(func):
+
+        @wraps(func)
+        async def async_wrapper(llm, prompts, *args, **kwargs):
+            """async wrapper generating distinct prompts only"""
+            return fan_out(await func(llm, unique_prompts, *args, **kwargs))
+
+        return async_wrapper
+
+    @wraps(func)
+    def wrapper(llm, prompts, *args, **kwargs):
+        """wrapper generating distinct prompts only"""
+        return fan_out(func(llm, unique_prompts, *args, **kwargs))
+
+    return wrapper
+
+
+def _hand_over(results: List[Tuple[UUID, LLMResult]], llm_result: LLMResult):
+    """Put the result of the current flow run in `results`, with its id."""
+    results.append((FlowRunContext.get().flow_run.id, llm_result))
+
+
+def _forget_completed_run(flow_run_id: UUID):
+    """Drop the state of a completed subflow run from its parent flow run.
+
+    A parent flow run keeps the state of each of its subflow runs until it
+    finishes, to derive its own state from them when it returns nothing. A
+    completed run does not change that state, and would otherwise be kept for
+    every call made by a long-running flow.
+    """
+    parent_flow_run_context = FlowRunContext.get()
+    if not parent_flow_run_context:
+        return
+    states = parent_flow_run_context.flow_run_states
+    for index in range(len(states) - 1, -1, -1):
+        if states[index].state_details.flow_run_id == flow_run_id:
+            del states[index]
+            return
+
+
+def _returning_result(
+    flow_call: Callable[[], Any],
+    results: List[Tuple[UUID, LLMResult]],
+    is_async: bool,
+) -> Callable[[], Any]:
+    """Return a call of a flow that returns the LLM result it put in `results`.
+
+    The flow is called in its own object registry, so that the task Prefect
+    creates to track it as a subflow run is not kept in the global registry, and
+    its state is dropped from its parent flow run once it completes.
+    """
+    if is_async:
+
+        async def async_call():
+            """Await the flow, then return its result."""
+            with PrefectObjectRegistry():
+                await flow_call()
+            flow_run_id, llm_result = results.pop()
+            _forget_completed_run(flow_run_id)
+            return llm_result
+
+        return async_call
+
+    def call():
+        """Call the flow, then return its result."""
+        with PrefectObjectRegistry():
+            flow_call()
+        flow_run_id, llm_result = results.pop()
+        _forget_completed_run(flow_run_id)
+        return llm_result
+
+    return call
+
+
+def _setting(
+    context_var: contextvars.ContextVar,
+    value: Any,
+    call: Callable[[], Any],
+    is_async: bool,
+) -> Callable[[], Any]:
+    """Return a call during which `context_var` is set to `value`.
+
+    Chat models are recorded at both `generate` and `_generate`, and subclasses
+    may override `generate` and call the parent method, so recorded calls use
+    this to leave the usage tracking and routing of an LLM call to the outermost
+    recorded call.
+    """
+    if is_async:
+
+        async def async_call():
+            """Await the call with the context variable set."""
+            token = context_var.set(value)
+            try:
+                return await call()
+            finally:
+                context_var.reset(token)
+
+        return async_call
+
+    def setting_call():
+        """Make the call with the context variable set."""
+        token = context_var.set(value)
+        try:
+            return call()
+        finally:
+            context_var.reset(token)
+
+    return setting_call
+
+
+def _record_usage(
+    usage_tracker: UsageTracker,
+    llm_result: LLMResult,
+    model_name: str | None,
+    **kwargs,
+):
+    """Record token usage of an LLM result from within its flow run."""
+    return usage_tracker.record_flow_run(
+        llm_result,
+        model_name=get_model_name(None, llm_result) or model_name,
+        **kwargs,
+    )
+
+
+def _store_result(blob_store: BlobStore, llm_result: LLMResult):
+    """Store an LLM result from within its flow run and log its hash."""
+    result_hash, blobs = blob_store.encode(llm_result)
+    get_run_logger().info(f"Stored LLM result as blob {result_hash!r}")
+    return blob_store.put_many(blobs)
+
+
+def _subclasses(cls: type) -> Tuple[type, ...]:
+    """Return all subclasses of a class, however deep, in breadth-first order."""
+    found = {}
+    queue = [cls]
+    while queue:
+        for subcls in queue.pop(0).__subclasses__():
+            if subcls not in found:
+                found[subcls] = None
+                queue.append(subcls)
+    return tuple(found)
+
+
+ClassPattern = str | type
+
+
+def _matches(cls: type, pattern: ClassPattern) -> bool:
+    """Return whether a class matches a class, or a glob of a module or class path.
+
+    A class matches the classes it subclasses, and a glob such as
+    `langchain.llms.openai.*` or `*.FakeListLLM` matches the module or the
+    `module.ClassName` path of the class.
+    """
+    if isinstance(pattern, type):
+        return issubclass(cls, pattern)
+    return fnmatch(cls.__module__, pattern) or fnmatch(
+        f"{cls.__module__}.{cls.__qualname__}", pattern
+    )
+
+
+def _is_selected(
+    cls: type,
+    include: Tuple[ClassPattern, ...] | None,
+    exclude: Tuple[ClassPattern, ...],
+) -> bool:
+    """Return whether to record the calls of a class."""
+    return (include is None or any(_matches(cls, p) for p in include)) and not any(
+        _matches(cls, p) for p in exclude
+    )
+
+
+def _method_names(cls: type) -> List[str]:
+    """Return the names of the methods of a class making LLM calls."""
+    if issubclass(cls, BaseChatModel):
+        # patch `BaseChatModel` generate methods when used as callable
+        return ["generate", "agenerate", "_generate", "_agenerate"]
+    return ["generate", "agenerate"]
+
+
+@lru_cache(maxsize=16)
+def _patch_plan(
+    classes: Tuple[type, ...],
+    include: Tuple[ClassPattern, ...] | None = None,
+    exclude: Tuple[ClassPattern, ...] = (),
+) -> Tuple[Tuple[type, str, bool], ...]:
+    """Return the methods to patch, as `(class, method name, recorded)` triples.
+
+    Methods are patched on the classes defining them, so that each method is
+    wrapped once however many classes inherit it. When some of the concrete
+    classes inheriting a method are not selected by `include` and `exclude`, the
+    method is patched on each selected class instead, and set back to the
+    original, unrecorded method on the classes that would inherit the patch.
+    The plan is cached until the set of language model classes changes.
+    """
+    plan = []
+    for cls in classes:
+        for method_name in _method_names(cls):
+            method = vars(cls).get(method_name)
+            if not method or getattr(method, "__isabstractmethod__", False):
+                continue
+            if include is None and not exclude:
+                plan.append((cls, method_name, True))
+                continue
+
+            # the concrete classes calling this implementation of the method
+            callers = [
+                c
+                for c in (cls, *_subclasses(cls))
+                if not inspect.isabstract(c)
+                and next(b for b in c.__mro__ if method_name in vars(b)) is cls
+            ]
+            selected = [c for c in callers if _is_selected(c, include, exclude)]
+            if selected and len(selected) == len(callers):
+                plan.append((cls, method_name, True))
+                continue
+            for caller in callers:
+                if caller in selected:
+                    plan.append((caller, method_name, True))
+                elif caller is not cls and any(issubclass(caller, c) for c in selected):
+                    plan.append((caller, method_name, False))
+    return tuple(plan)
+
+
+def _unrecorded(func: Callable, **decorator_kwargs) -> Callable:
+    """Return a method unchanged, for classes excluded from recording."""
+    return func
+
+
 class RecordLLMCalls(ContextDecorator):
     """Context decorator for patching LLM calls with a prefect flow."""
 
-    def __init__(self, **decorator_kwargs):
+    def __init__(
+        self,
+        include: List[ClassPattern] | None = None,
+        exclude: List[ClassPattern] | None = None,
+        **decorator_kwargs,
+    ):
         """Context decorator for patching LLM calls with a prefect flow.
 
         Args:
+            include: Only record the calls of language model classes matching one
+                of these classes, or globs of module or `module.ClassName` paths.
+                Defaults to all language model classes.
+            exclude: Do not record the calls of language model classes matching
+                one of these. They call the original methods, without any overhead.
             tags: Tags to apply to flow runs created by this context manager.
             flow_kwargs: Keyword arguments to pass to the flow decorator.
             max_prompt_tokens: The maximum number of tokens allowed in a prompt.
+            usage_tracker: A `UsageTracker` used to aggregate token usage and cost,
+                publish usage tables, and enforce token and cost budgets.
+            circuit_breaker: A `CircuitBreaker` used to fail fast or route calls to
+                a fallback LLM while an endpoint is failing or too slow.
+            router: A `TokenCountRouter` used to send each prompt to a model tier
+                based on its number of tokens and tags.
+            blob_store: A `BlobStore` to write the full prompts, args, kwargs and
+                results of each call to, once per distinct content. Flow run
+                parameters and logs only reference them by hash.
+            max_parameter_bytes: The maximum size of the JSON encoded `llm_input`
+                flow run parameter, which summarizes each call.
+            result_log_config: A `ResultLogConfig` selecting the fields of each LLM
+                result to log, their maximum size, a redaction hook and the level.
+            dry_run: A `DryRunEstimator` to project the tokens and cost of each
+                call with instead of calling the LLM. Calls return empty results.
+            cassette: A `Cassette` to record the result of each call to, or to
+                replay recorded results from instead of calling the LLM.
+            sub_batch_size: Split `generate` and `agenerate` calls with more
+                prompts than this into sub-batches of this size, generated
+                concurrently and merged into one result.
+            max_sub_batch_concurrency: The maximum number of sub-batches of a call
+                generated at once, on a thread pool for sync calls.
+            deduplicate_prompts: Whether to generate identical prompts of a
+                `generate` or `agenerate` batch once when sampling at temperature
+                0, and return their generations at each of their positions. The
+                number of duplicates is in the `llm_input` flow run parameter.
 
         Example:
             Create a flow with `a_custom_tag` upon calling `OpenAI.generate`:
@@ -112,9 +656,67 @@ class RecordLLMCalls(ContextDecorator):
             >>>        "What would be a good company name "
             >>>        "for a company that makes carbonated water?"
             >>>    )
+
+            Track token usage and cost, and stop calling the LLM after $1:
+
+            >>> tracker = UsageTracker(max_cost=1.0)
+            >>> with RecordLLMCalls(usage_tracker=tracker):
+            >>>     my_flow()
+            >>> print(tracker.table())
+
+            Project the tokens and cost of a flow without calling the LLM:
+
+            >>> estimator = DryRunEstimator()
+            >>> with RecordLLMCalls(dry_run=estimator):
+            >>>     my_flow()
+            >>> print(estimator.table())
+
+            Sync calls made from a running event loop, such as a sync chain run
+            in an async request handler, block the loop until the LLM answers.
+            Use `agenerate`, or await the call on a `SyncCallExecutor`:
+
+            >>> executor = SyncCallExecutor(max_workers=4)
+            >>> with RecordLLMCalls():
+            >>>     await executor.arun(chain.run, question)
+
+            Replay recorded results in CI instead of calling the LLM:
+
+            >>> with RecordLLMCalls(cassette=Cassette("tests/cassette.jsonl")):
+            >>>     my_flow()
+
+            Generate large batches as concurrent sub-batches of 20 prompts:
+
+            >>> with RecordLLMCalls(sub_batch_size=20, max_sub_batch_concurrency=8):
+            >>>     llm.generate(prompts)
+
+            Classify texts with many repeated inputs, generating each once:
+
+            >>> with RecordLLMCalls(deduplicate_prompts=True):
+            >>>     OpenAI(temperature=0).generate(prompts)
+
+            Only record calls to OpenAI models, except the fake one used in tests:
+
+            >>> recorder = RecordLLMCalls(
+            >>>     include=["langchain.*.openai"], exclude=[FakeOpenAI]
+            >>> )
+            >>> print(recorder.patch_plan)
+            >>> with recorder:
+            >>>     my_flow()
         """
+        self.include = tuple(include) if include is not None else None
+        self.exclude = tuple(exclude or ())
         self.decorator_kwargs = decorator_kwargs
 
+    @property
+    def patch_plan(self) -> Tuple[Tuple[type, str, bool], ...]:
+        """The methods patched when entering the context.
+
+        Each is a `(class, method name, recorded)` triple. Methods that are not
+        recorded are set back to the original method on a class so that it does
+        not inherit the recorded method of a parent class.
+        """
+        return _patch_plan(_subclasses(BaseLanguageModel), self.include, self.exclude)
+
     def __enter__(self):
         """Called when entering the context manager.
 
@@ -122,24 +724,25 @@ class RecordLLMCalls(ContextDecorator):
         LLM api calls in a different place.
         """
         self.patched_methods = []
-        for subcls in BaseLanguageModel.__subclasses__():
-            if subcls.__name__ == "BaseChatModel":
-                for subsubcls in subcls.__subclasses__():
-                    # patch `BaseChatModel` generate methods when used as callable
-                    self._patch_method(subsubcls, "_generate", record_llm_call)
-                    self._patch_method(subsubcls, "_agenerate", record_llm_call)
-
-            self._patch_method(subcls, "generate", record_llm_call)
-            self._patch_method(subcls, "agenerate", record_llm_call)
+        plan = self.patch_plan
+        # look the methods up before patching, so that none is a parent's patch
+        methods = [getattr(cls, method_name) for cls, method_name, _ in plan]
+        for (cls, method_name, recorded), method in zip(plan, methods):
+            decorator = record_llm_call if recorded else _unrecorded
+            self._patch_method(cls, method_name, method, decorator)
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Reset methods when exiting the context manager."""
-        for cls, method_name, original_method in self.patched_methods:
-            setattr(cls, method_name, original_method)
+        for cls, method_name, original_method in reversed(self.patched_methods):
+            if original_method is None:
+                # the method was inherited
+                delattr(cls, method_name)
+            else:
+                setattr(cls, method_name, original_method)
 
-    def _patch_method(self, cls, method_name, decorator):
-        """Patch a method on a class with a decorator."""
-        original_method = getattr(cls, method_name)
-        modified_method = decorator(original_method, **self.decorator_kwargs)
+    def _patch_method(self, cls, method_name, method, decorator):
+        """Patch a method of a class with a decorator."""
+        original_method = vars(cls).get(method_name)
+        modified_method = decorator(method, **self.decorator_kwargs)
         setattr(cls, method_name, modified_method)
         self.patched_methods.append((cls, method_name, original_method))
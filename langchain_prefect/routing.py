@@ -0,0 +1,92 @@
+"""Routing of LLM calls to model tiers based on prompt size and tags."""
+
+import threading
+from collections import Counter
+from typing import Iterable, List, Set
+
+from langchain.base_language import BaseLanguageModel
+from pydantic import BaseModel, Field
+
+from langchain_prefect.utilities import get_current_logger
+
+
+class ModelTier(BaseModel):
+    """A model that handles prompts up to a number of tokens."""
+
+    name: str = Field(...)
+    llm: BaseLanguageModel = Field(...)
+    max_prompt_tokens: int | None = Field(default=None)
+    tags: Set[str] = Field(default_factory=set)
+
+    class Config:
+        """Allow any LLM instance."""
+
+        arbitrary_types_allowed = True
+
+    def accepts(self, prompt_tokens: int, tags: Set[str]) -> bool:
+        """Return whether this tier handles a prompt of this size and tags."""
+        return (
+            self.max_prompt_tokens is None or prompt_tokens <= self.max_prompt_tokens
+        ) and self.tags <= tags
+
+
+class TokenCountRouter:
+    """Routes each prompt to the first model tier that accepts it."""
+
+    def __init__(self, tiers: List[ModelTier]):
+        """Routes each prompt to the first model tier that accepts it.
+
+        Tiers are tried in order. A tier accepts a prompt if the prompt has at most
+        `max_prompt_tokens` tokens and the call has all of the tier's `tags`. If no
+        tier accepts a prompt, the originally called LLM is used. Calls made
+        directly to a tier's LLM are not routed.
+
+        Each tier's LLM must be of the same kind as the models whose calls it
+        replaces, e.g. chat models for prompts sent to chat models.
+
+        Args:
+            tiers: The model tiers, usually ordered from smallest to largest.
+
+        Example:
+            Send short prompts to a fast model and long ones to a long-context one:
+
+            >>> router = TokenCountRouter(
+            >>>     tiers=[
+            >>>         ModelTier(
+            >>>             name="fast",
+            >>>             llm=ChatOpenAI(model_name="gpt-3.5-turbo"),
+            >>>             max_prompt_tokens=1000,
+            >>>         ),
+            >>>         ModelTier(
+            >>>             name="long-context",
+            >>>             llm=ChatOpenAI(model_name="gpt-4-32k"),
+            >>>         ),
+            >>>     ]
+            >>> )
+            >>> with RecordLLMCalls(router=router, max_prompt_tokens=30000):
+            >>>     chain.run("...")
+            >>> router.decisions
+        """
+        self.tiers = tiers
+        self.decisions: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def is_tier_llm(self, llm: BaseLanguageModel) -> bool:
+        """Return whether an LLM instance is the model of one of the tiers."""
+        return any(tier.llm is llm for tier in self.tiers)
+
+    def route(
+        self, prompt_tokens: int, tags: Iterable[str] = (), llm_endpoint: str = ""
+    ) -> ModelTier | None:
+        """Return the tier to send a prompt to, recording the decision."""
+        tags = set(tags)
+        tier = next((t for t in self.tiers if t.accepts(prompt_tokens, tags)), None)
+
+        with self._lock:
+            self.decisions[tier.name if tier else None] += 1
+
+        get_current_logger(__name__).info(
+            f"Routing {prompt_tokens} prompt tokens for {llm_endpoint!r} to "
+            + (f"model tier {tier.name!r}." if tier else "the original model.")
+        )
+        return tier
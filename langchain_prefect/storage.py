@@ -0,0 +1,142 @@
+"""Content-addressed storage of prompts and results of recorded LLM calls."""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from langchain.schema import BaseMessage
+from prefect.filesystems import LocalFileSystem, WritableFileSystem
+from prefect.settings import PREFECT_HOME
+from prefect.utilities.asyncutils import sync_compatible
+
+from langchain_prefect.utilities import LLMInvocation, json_default
+
+# keyword arguments that do not change the request sent to the provider
+IGNORED_KWARGS = frozenset({"callbacks", "run_manager"})
+
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hash used as the key of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize an object to compact, deterministic JSON."""
+    return json.dumps(
+        obj, default=json_default, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+class BlobStore:
+    """Stores prompts and LLM results once, keyed by the hash of their content."""
+
+    def __init__(
+        self,
+        filesystem: WritableFileSystem | str | Path | None = None,
+        max_known_hashes: int = 100_000,
+    ):
+        """Stores prompts and LLM results once, keyed by the hash of their content.
+
+        Each prompt, and each message of a chat prompt, is stored as its own blob
+        so that identical system prompts and retrieved contexts are stored once.
+        A manifest blob references the prompts of a call by hash.
+
+        Args:
+            filesystem: A filesystem block, or a local directory, to store blobs
+                in. Defaults to `$PREFECT_HOME/langchain_prefect/blobs`.
+            max_known_hashes: The number of recently stored hashes remembered in
+                order to skip writing them again.
+
+        Example:
+            Store prompts and results in an S3 bucket:
+
+            >>> blob_store = BlobStore(RemoteFileSystem.load("llm-blobs"))
+            >>> with RecordLLMCalls(blob_store=blob_store):
+            >>>     chain.run("...")
+        """
+        if not isinstance(filesystem, WritableFileSystem):
+            filesystem = LocalFileSystem(
+                basepath=str(
+                    filesystem or PREFECT_HOME.value() / "langchain_prefect" / "blobs"
+                )
+            )
+        self.filesystem = filesystem
+        self.max_known_hashes = max_known_hashes
+        self._known: OrderedDict[str, None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path(blob_hash: str) -> str:
+        """Return the path of a blob within the filesystem."""
+        return f"{blob_hash[:2]}/{blob_hash}.json"
+
+    def encode(self, obj: Any) -> Tuple[str, Dict[str, bytes]]:
+        """Return the hash of an object and the blobs needed to store it."""
+        data = _dumps(obj)
+        blob_hash = content_hash(data)
+        return blob_hash, {blob_hash: data}
+
+    def encode_invocation(
+        self, invocation: LLMInvocation
+    ) -> Tuple[str, Dict[str, bytes]]:
+        """Return the manifest hash of an invocation and the blobs to store it."""
+        blobs: Dict[str, bytes] = {}
+
+        def _encode_prompts(prompts: Any) -> Any:
+            """Encode each prompt or message as a blob and return the hashes."""
+            if isinstance(prompts, (str, BaseMessage)):
+                blob_hash, prompt_blobs = self.encode(prompts)
+                blobs.update(prompt_blobs)
+                return blob_hash
+            return [_encode_prompts(p) for p in prompts]
+
+        manifest_hash, manifest_blobs = self.encode(
+            {
+                "llm_endpoint": invocation.llm_endpoint,
+                "invocation_fn": invocation.invocation_fn.__name__,
+                "prompts": _encode_prompts(invocation.prompts),
+                "args": invocation.args,
+                "kwargs": {
+                    k: v
+                    for k, v in invocation.kwargs.items()
+                    if k not in IGNORED_KWARGS
+                },
+            }
+        )
+        blobs.update(manifest_blobs)
+        return manifest_hash, blobs
+
+    @sync_compatible
+    async def put_many(self, blobs: Dict[str, bytes]) -> int:
+        """Write the blobs that are not known to be stored already.
+
+        Returns:
+            The number of blobs written.
+        """
+        with self._lock:
+            new_blobs = {h: data for h, data in blobs.items() if h not in self._known}
+
+        for blob_hash, data in new_blobs.items():
+            await self.filesystem.write_path(self.path(blob_hash), data)
+
+        with self._lock:
+            for blob_hash in new_blobs:
+                self._known[blob_hash] = None
+            while len(self._known) > self.max_known_hashes:
+                self._known.popitem(last=False)
+        return len(new_blobs)
+
+    @sync_compatible
+    async def put(self, obj: Any) -> str:
+        """Store an object and return its hash."""
+        blob_hash, blobs = self.encode(obj)
+        await self.put_many(blobs)
+        return blob_hash
+
+    @sync_compatible
+    async def get(self, blob_hash: str) -> Any:
+        """Return the deserialized content of a blob."""
+        return json.loads(await self.filesystem.read_path(self.path(blob_hash)))
@@ -0,0 +1,290 @@
+"""Local stand-in for the OpenAI API, to test recorded LLM calls offline."""
+
+import json
+import random
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List
+
+from langchain_prefect.utilities import num_tokens
+
+
+def _prompt_text(body: Dict[str, Any]) -> List[str]:
+    """Return the prompts of a completion or chat completion request."""
+    if "messages" in body:
+        return ["\n".join(m.get("content") or "" for m in body["messages"])]
+    prompts = body.get("prompt", "")
+    return [prompts] if isinstance(prompts, str) else list(prompts)
+
+
+class FakeOpenAIServer:
+    """HTTP server speaking the completion and chat completion API of OpenAI."""
+
+    def __init__(
+        self,
+        response: str | Callable[[str], str] = "fake response",
+        latency: float | Callable[[], float] = 0.0,
+        stream_chunk_latency: float = 0.0,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        max_requests_per_second: float | None = None,
+        retry_after: float = 1.0,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        seed: int | None = None,
+    ):
+        """HTTP server speaking the completion and chat completion API of OpenAI.
+
+        Serves `POST /v1/completions` and `POST /v1/chat/completions`, including
+        batched prompts, `n` choices, token usage and `stream=True`, so that
+        `langchain.llms.OpenAI` and `ChatOpenAI` can be pointed at it with
+        `openai_api_base=server.url`. Requests run on a thread per request.
+
+        Args:
+            response: The text of each completion, or a function of the prompt
+                returning it.
+            latency: Seconds to wait before responding, or a function returning
+                them for each request, e.g. `lambda: random.lognormvariate(-1, 1)`.
+            stream_chunk_latency: Seconds to wait between streamed chunks.
+            error_rate: The fraction of requests answered with a 500 error.
+            rate_limit_rate: The fraction of requests answered with a 429 error.
+            max_requests_per_second: Answer requests beyond this rate, over the
+                last second, with a 429 error.
+            retry_after: The `Retry-After` header of 429 responses, in seconds.
+            host: The host to listen on.
+            port: The port to listen on. Defaults to a free port.
+            seed: Seed for the random errors.
+
+        Example:
+            Load test a chain against a slow and flaky provider:
+
+            >>> with FakeOpenAIServer(latency=0.5, rate_limit_rate=0.05) as server:
+            >>>     llm = OpenAI(openai_api_base=server.url, openai_api_key="fake")
+            >>>     with RecordLLMCalls():
+            >>>         chain.run("...")
+            >>>     print(server.stats)
+        """
+        self.response = response
+        self.latency = latency
+        self.stream_chunk_latency = stream_chunk_latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.max_requests_per_second = max_requests_per_second
+        self.retry_after = retry_after
+        self.stats: Counter = Counter()
+        self._random = random.Random(seed)
+        self._recent: deque = deque()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        """The base URL of the API, to pass as `openai_api_base`."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeOpenAIServer":
+        """Start serving requests on a background thread."""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="fake-openai", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving requests and close the socket."""
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        """Start the server, to stop it on exit."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the server."""
+        self.stop()
+
+    def _is_rate_limited(self) -> bool:
+        """Return whether a request arriving now exceeds the rate limit."""
+        with self._lock:
+            if self._random.random() < self.rate_limit_rate:
+                return True
+            if self.max_requests_per_second is None:
+                return False
+            now = time.monotonic()
+            while self._recent and now - self._recent[0] > 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_requests_per_second:
+                return True
+            self._recent.append(now)
+            return False
+
+    def _count(self, key: str):
+        """Count a request outcome in `stats`."""
+        with self._lock:
+            self.stats[key] += 1
+
+    def _is_error(self) -> bool:
+        """Return whether to fail a request."""
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def _completion_text(self, prompt: str) -> str:
+        """Return the completion of a prompt."""
+        return self.response(prompt) if callable(self.response) else self.response
+
+    def _choices(self, body: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Return the choices of a request, `n` per prompt."""
+        chat = "messages" in body
+        choices = []
+        for prompt in _prompt_text(body):
+            text = self._completion_text(prompt)
+            for _ in range(body.get("n", 1)):
+                choice: Dict[str, Any] = {"index": len(choices)}
+                if chat:
+                    choice["message"] = {"role": "assistant", "content": text}
+                else:
+                    choice.update(text=text, logprobs=None)
+                choice["finish_reason"] = "stop"
+                choices.append(choice)
+        return choices
+
+    def complete(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the response to a completion or chat completion request."""
+        choices = self._choices(body)
+        prompt_tokens = sum(num_tokens(p) for p in _prompt_text(body))
+        completion_tokens = sum(
+            num_tokens(c["message"]["content"] if "message" in c else c["text"])
+            for c in choices
+        )
+        chat = "messages" in body
+        return {
+            "id": f"{'chatcmpl' if chat else 'cmpl'}-{uuid.uuid4().hex}",
+            "object": "chat.completion" if chat else "text_completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": choices,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def stream(self, body: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        """Yield the chunks of a streamed response, one per word of each choice."""
+        response = self.complete(body)
+        chat = "messages" in body
+        chunk_object = "chat.completion.chunk" if chat else response["object"]
+        for choice in response["choices"]:
+            text = choice["message"]["content"] if chat else choice["text"]
+            words = text.split(" ")
+            for i, word in enumerate(words):
+                piece = word if i == len(words) - 1 else f"{word} "
+                delta: Dict[str, Any] = {"index": choice["index"]}
+                if chat:
+                    delta["delta"] = {"content": piece}
+                    if i == 0:
+                        delta["delta"]["role"] = "assistant"
+                else:
+                    delta.update(text=piece, logprobs=None)
+                delta["finish_reason"] = "stop" if i == len(words) - 1 else None
+                yield {
+                    "id": response["id"],
+                    "object": chunk_object,
+                    "created": response["created"],
+                    "model": response["model"],
+                    "choices": [delta],
+                }
+
+    def _handler_class(self) -> type:
+        """Return the request handler class bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Answers requests with the behaviour of the server."""
+
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                """Do not log requests to stderr."""
+
+            def _send_json(self, status: int, body: Any, headers: Dict | None = None):
+                """Send a JSON response."""
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_error(self, status: int, message: str, error_type: str, **kw):
+                """Send an error response in the format of the OpenAI API."""
+                self._send_json(
+                    status,
+                    {"error": {"message": message, "type": error_type, "code": None}},
+                    **kw,
+                )
+
+            def do_POST(self):
+                """Answer a completion or chat completion request."""
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._count("requests")
+
+                if self.path.rstrip("/") not in (
+                    "/v1/completions",
+                    "/v1/chat/completions",
+                ):
+                    server._count("not_found")
+                    self._send_error(404, f"Unknown path {self.path}", "invalid_url")
+                    return
+                if server._is_rate_limited():
+                    server._count("rate_limited")
+                    self._send_error(
+                        429,
+                        "Rate limit reached for requests",
+                        "requests",
+                        headers={"Retry-After": str(server.retry_after)},
+                    )
+                    return
+
+                latency = server.latency
+                time.sleep(latency() if callable(latency) else latency)
+
+                if server._is_error():
+                    server._count("errors")
+                    self._send_error(500, "The server had an error", "server_error")
+                    return
+
+                if not body.get("stream"):
+                    server._count("completed")
+                    self._send_json(200, server.complete(body))
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for chunk in server.stream(body):
+                    self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+                    time.sleep(server.stream_chunk_latency)
+                self._write_chunk(b"data: [DONE]\n\n")
+                self._write_chunk(b"")
+                server._count("completed")
+
+            def _write_chunk(self, data: bytes):
+                """Write a chunk of a chunked response."""
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+        return Handler
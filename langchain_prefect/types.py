@@ -30,5 +30,6 @@ class GitHubIssue(BaseModel):
     number: int = Field(...)
     title: str = Field(default="")
     body: str | None = Field(default="")
+    comments: int = Field(default=0)
     labels: List[GitHubLabel] = Field(default_factory=GitHubLabel)
     user: GitHubUser = Field(default_factory=GitHubUser)
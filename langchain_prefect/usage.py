@@ -0,0 +1,463 @@
+"""Token usage and cost accounting for recorded LLM calls."""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import repeat
+from typing import Any, Dict, Iterable, List
+
+from langchain.base_language import BaseLanguageModel
+from langchain.schema import (
+    AIMessage,
+    ChatGeneration,
+    ChatResult,
+    Generation,
+    LLMResult,
+)
+from prefect.artifacts import create_table_artifact
+from prefect.context import FlowRunContext
+from pydantic import BaseModel, Field
+
+from langchain_prefect.utilities import (
+    encoding_name_for_model,
+    get_prompt_content,
+    num_tokens,
+)
+
+
+class ModelPrice(BaseModel):
+    """Price of a model in USD per 1,000 tokens."""
+
+    prompt: float = Field(default=0.0)
+    completion: float = Field(default=0.0)
+
+
+DEFAULT_PRICES: Dict[str, ModelPrice] = {
+    "gpt-4-32k": ModelPrice(prompt=0.06, completion=0.12),
+    "gpt-4": ModelPrice(prompt=0.03, completion=0.06),
+    "gpt-3.5-turbo": ModelPrice(prompt=0.002, completion=0.002),
+    "text-davinci": ModelPrice(prompt=0.02, completion=0.02),
+    "text-curie": ModelPrice(prompt=0.002, completion=0.002),
+    "text-babbage": ModelPrice(prompt=0.0005, completion=0.0005),
+    "text-ada": ModelPrice(prompt=0.0004, completion=0.0004),
+}
+
+
+class TokenUsage(BaseModel):
+    """Token counts and estimated cost of one or more LLM calls."""
+
+    calls: int = Field(default=0)
+    prompt_tokens: int = Field(default=0)
+    completion_tokens: int = Field(default=0)
+    total_tokens: int = Field(default=0)
+    cost: float = Field(default=0.0)
+
+    def __add__(self, other: "TokenUsage") -> "TokenUsage":
+        """Sum two usages."""
+        return TokenUsage(
+            calls=self.calls + other.calls,
+            prompt_tokens=self.prompt_tokens + other.prompt_tokens,
+            completion_tokens=self.completion_tokens + other.completion_tokens,
+            total_tokens=self.total_tokens + other.total_tokens,
+            cost=self.cost + other.cost,
+        )
+
+
+class BudgetExceeded(ValueError):
+    """Raised when a recorded LLM call would exceed the configured budget."""
+
+
+def get_model_name(llm: Any, llm_result: Any = None) -> str | None:
+    """Return the model name reported by the result, or configured on the LLM."""
+    llm_output = getattr(llm_result, "llm_output", None) or {}
+    return llm_output.get("model_name") or getattr(llm, "model_name", None)
+
+
+def parse_token_usage(llm_result: LLMResult) -> TokenUsage:
+    """Return the token usage reported in `llm_output["token_usage"]`."""
+    llm_output = getattr(llm_result, "llm_output", None) or {}
+    token_usage = llm_output.get("token_usage") or {}
+    prompt_tokens = token_usage.get("prompt_tokens", 0)
+    completion_tokens = token_usage.get("completion_tokens", 0)
+    return TokenUsage(
+        calls=1,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=token_usage.get("total_tokens", prompt_tokens + completion_tokens),
+    )
+
+
+class UsageTracker:
+    """Aggregates token usage and cost per flow run, parent flow and tag."""
+
+    def __init__(
+        self,
+        prices: Dict[str, ModelPrice] | None = None,
+        max_total_tokens: int | None = None,
+        max_cost: float | None = None,
+        publish_artifacts: bool = True,
+        max_tracked_runs: int = 10_000,
+    ):
+        """Aggregates token usage and cost of recorded LLM calls.
+
+        Args:
+            prices: Price per 1,000 tokens keyed by model name. Model names are
+                matched exactly first, then by longest prefix.
+                Defaults to `DEFAULT_PRICES`.
+            max_total_tokens: Refuse further calls once this many tokens are used.
+            max_cost: Refuse further calls once this cost in USD is reached.
+            publish_artifacts: Whether to publish a usage table artifact at the
+                end of each recorded flow run.
+            max_tracked_runs: The number of most recently used flow runs, parent
+                flow runs and tags to keep usage of, so that long-running services
+                use bounded memory, including with per-run tags. The totals are
+                not affected.
+
+        Example:
+            Stop an agent once it has spent $0.50:
+
+            >>> tracker = UsageTracker(max_cost=0.5)
+            >>> with RecordLLMCalls(usage_tracker=tracker):
+            >>>     agent.run("How old is the current Dalai Lama?")
+            >>> tracker.total
+        """
+        self.prices = DEFAULT_PRICES if prices is None else prices
+        self.max_total_tokens = max_total_tokens
+        self.max_cost = max_cost
+        self.publish_artifacts = publish_artifacts
+        self.max_tracked_runs = max_tracked_runs
+
+        self.total = TokenUsage()
+        self.by_flow_run: OrderedDict[str, TokenUsage] = OrderedDict()
+        self.by_parent_flow_run: OrderedDict[str, TokenUsage] = OrderedDict()
+        self.by_tag: OrderedDict[str, TokenUsage] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_price(self, model_name: str | None) -> ModelPrice:
+        """Return the price of a model, matching the longest known prefix."""
+        if not model_name:
+            return ModelPrice()
+        if model_name in self.prices:
+            return self.prices[model_name]
+        matches = [name for name in self.prices if model_name.startswith(name)]
+        return self.prices[max(matches, key=len)] if matches else ModelPrice()
+
+    def estimate_cost(self, model_name: str | None, usage: TokenUsage) -> float:
+        """Return the estimated cost in USD of the given usage."""
+        price = self.get_price(model_name)
+        return (
+            usage.prompt_tokens * price.prompt
+            + usage.completion_tokens * price.completion
+        ) / 1000
+
+    def check_budget(self, llm_endpoint: str):
+        """Raise `BudgetExceeded` if the budget has already been used up."""
+        if self.max_total_tokens and self.total.total_tokens >= self.max_total_tokens:
+            raise BudgetExceeded(
+                f"Token budget exhausted: {self.total.total_tokens} tokens used"
+                f" and {self.max_total_tokens=}. Did not call {llm_endpoint!r}."
+            )
+        if self.max_cost and self.total.cost >= self.max_cost:
+            raise BudgetExceeded(
+                f"Cost budget exhausted: ${self.total.cost:.4f} spent"
+                f" and {self.max_cost=}. Did not call {llm_endpoint!r}."
+            )
+
+    def record(
+        self,
+        llm_result: LLMResult,
+        model_name: str | None = None,
+        tags: Iterable[str] = (),
+        flow_run_id: str | None = None,
+        parent_flow_run_id: str | None = None,
+    ) -> TokenUsage:
+        """Add the usage reported by an LLM result to the running totals."""
+        return self.add(
+            parse_token_usage(llm_result),
+            model_name=model_name,
+            tags=tags,
+            flow_run_id=flow_run_id,
+            parent_flow_run_id=parent_flow_run_id,
+        )
+
+    def add(
+        self,
+        usage: TokenUsage,
+        model_name: str | None = None,
+        tags: Iterable[str] = (),
+        flow_run_id: str | None = None,
+        parent_flow_run_id: str | None = None,
+    ) -> TokenUsage:
+        """Add token usage, e.g. recorded in another process, to the running totals.
+
+        The cost is estimated with the prices of this tracker.
+        """
+        usage = usage.copy(update={"cost": self.estimate_cost(model_name, usage)})
+
+        with self._lock:
+            self.total += usage
+            if flow_run_id:
+                self._add_tracked_usage(self.by_flow_run, flow_run_id, usage)
+            if parent_flow_run_id:
+                self._add_tracked_usage(
+                    self.by_parent_flow_run, parent_flow_run_id, usage
+                )
+            for tag in tags:
+                self._add_tracked_usage(self.by_tag, tag, usage)
+        return usage
+
+    def _add_tracked_usage(
+        self, usages: OrderedDict[str, TokenUsage], key: str, usage: TokenUsage
+    ):
+        """Add usage to a run or tag, forgetting the least recently used ones."""
+        usages[key] = usages.get(key, TokenUsage()) + usage
+        usages.move_to_end(key)
+        while len(usages) > self.max_tracked_runs:
+            usages.popitem(last=False)
+
+    def record_flow_run(
+        self,
+        llm_result: LLMResult,
+        model_name: str | None = None,
+        tags: Iterable[str] = (),
+        parent_flow_run_id: str | None = None,
+    ):
+        """Record the usage of the current flow run and publish its usage table.
+
+        Must be called from within the flow run executing the LLM call. Returns
+        an awaitable when called from an async flow run.
+        """
+        tags = list(tags)
+        flow_run_context = FlowRunContext.get()
+        flow_run_id = str(flow_run_context.flow_run.id) if flow_run_context else None
+
+        self.record(
+            llm_result,
+            model_name=model_name,
+            tags=tags,
+            flow_run_id=flow_run_id,
+            parent_flow_run_id=parent_flow_run_id,
+        )
+
+        if self.publish_artifacts and flow_run_id:
+            return create_table_artifact(
+                table=self.table(
+                    flow_run_id=flow_run_id,
+                    parent_flow_run_id=parent_flow_run_id,
+                    tags=tags,
+                ),
+                description=f"Token usage and estimated cost for {model_name!r}",
+            )
+
+    def table(
+        self,
+        flow_run_id: str | None = None,
+        parent_flow_run_id: str | None = None,
+        tags: Iterable[str] | None = None,
+    ) -> List[Dict[str, Any]]:
+        """Return usage rows, optionally restricted to a flow run, parent or tags.
+
+        Each row has a `scope` (`flow run`, `parent flow`, `tag` or `total`),
+        the `key` within that scope, and the aggregated usage.
+        """
+
+        def _rows(scope: str, usages: Dict[str, TokenUsage], keys: Any):
+            """Return the rows of a scope, for the given keys or all of them."""
+            keys = usages.keys() if keys is None else [k for k in keys if k]
+            return [
+                {"scope": scope, "key": key, **usages[key].dict()}
+                for key in keys
+                if key in usages
+            ]
+
+        restricted = any(x is not None for x in (flow_run_id, parent_flow_run_id))
+        with self._lock:
+            return [
+                *_rows(
+                    "flow run",
+                    self.by_flow_run,
+                    [flow_run_id] if restricted else None,
+                ),
+                *_rows(
+                    "parent flow",
+                    self.by_parent_flow_run,
+                    [parent_flow_run_id] if restricted else None,
+                ),
+                *_rows("tag", self.by_tag, tags),
+                {"scope": "total", "key": "", **self.total.dict()},
+            ]
+
+
+class DryRunEstimator:
+    """Projects the tokens and cost of LLM calls without calling any provider."""
+
+    def __init__(
+        self,
+        prices: Dict[str, ModelPrice] | None = None,
+        completion_tokens: int | None = None,
+        max_workers: int | None = None,
+        use_processes: bool = False,
+        min_parallel_prompts: int = 64,
+    ):
+        """Projects the tokens and cost of LLM calls without calling any provider.
+
+        Prompt tokens are counted with the tokenizer of each call's model. Calls
+        return a synthetic `LLMResult` with one empty generation per prompt and
+        the projected token usage in `llm_output`.
+
+        Args:
+            prices: Price per 1,000 tokens keyed by model name, see `UsageTracker`.
+            completion_tokens: The projected number of completion tokens per
+                prompt. Defaults to the `max_tokens` of the LLM, if any.
+            max_workers: The number of workers counting tokens in parallel.
+            use_processes: Whether to count tokens in a process pool rather than
+                a thread pool, for big corpora.
+            min_parallel_prompts: Calls with fewer prompts are counted in the
+                calling thread.
+
+        Example:
+            Project the cost of a batch job before running it:
+
+            >>> with DryRunEstimator(use_processes=True) as estimator:
+            >>>     batch_inference_flow(
+            >>>         OpenAI(), "prompts.jsonl", "out.jsonl", dry_run=estimator
+            >>>     )
+            >>> estimator.table()
+
+            Project the cost of an agent run:
+
+            >>> estimator = DryRunEstimator(completion_tokens=50)
+            >>> with RecordLLMCalls(dry_run=estimator):
+            >>>     agent.run("How old is the current Dalai Lama?")
+            >>> estimator.publish()
+        """
+        self.completion_tokens = completion_tokens
+        self.max_workers = max_workers
+        self.use_processes = use_processes
+        self.min_parallel_prompts = min_parallel_prompts
+        self.usage = UsageTracker(prices=prices, publish_artifacts=False)
+        self._executor: Executor | None = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> Executor:
+        """Return the pool used to count tokens, starting it if needed."""
+        with self._lock:
+            if self._executor is None:
+                executor_cls = (
+                    ProcessPoolExecutor if self.use_processes else ThreadPoolExecutor
+                )
+                self._executor = executor_cls(max_workers=self.max_workers)
+            return self._executor
+
+    def count_tokens(self, texts: List[str], model_name: str | None) -> List[int]:
+        """Count the tokens of each text with the tokenizer of a model."""
+        encoding_name = encoding_name_for_model(model_name)
+        if len(texts) < self.min_parallel_prompts:
+            return [num_tokens(text, encoding_name) for text in texts]
+        executor = self._get_executor()
+        return list(
+            executor.map(
+                num_tokens,
+                texts,
+                repeat(encoding_name),
+                chunksize=max(len(texts) // 64, 1),
+            )
+        )
+
+    def estimate(
+        self,
+        llm: BaseLanguageModel,
+        prompts: Any,
+        llm_endpoint: str | None = None,
+        chat: bool = False,
+    ) -> LLMResult | ChatResult:
+        """Project the usage of a call and return a synthetic, empty result.
+
+        Args:
+            llm: The LLM that would be called.
+            prompts: The prompts of the call.
+            llm_endpoint: The endpoint to aggregate the usage under.
+                Defaults to the module of the LLM.
+            chat: Whether `prompts` is the list of messages of a single chat
+                prompt, as passed to `BaseChatModel._generate`.
+        """
+        model_name = get_model_name(llm)
+        if chat:
+            texts = ["".join(get_prompt_content(prompts))] if prompts else [""]
+        else:
+            texts = [
+                p if isinstance(p, str) else "".join(get_prompt_content(p) if p else [])
+                for p in prompts
+            ]
+
+        prompt_tokens = sum(self.count_tokens(texts, model_name))
+        completion_tokens = len(texts) * max(
+            self.completion_tokens
+            if self.completion_tokens is not None
+            else getattr(llm, "max_tokens", None) or 0,
+            0,
+        )
+        llm_output = {
+            "token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "model_name": model_name,
+            "dry_run": True,
+        }
+        result = (
+            ChatResult(
+                generations=[ChatGeneration(message=AIMessage(content=""))],
+                llm_output=llm_output,
+            )
+            if chat
+            else LLMResult(
+                generations=[[Generation(text="")] for _ in texts],
+                llm_output=llm_output,
+            )
+        )
+        self.usage.record(
+            result, model_name=model_name, tags=[llm_endpoint or llm.__module__]
+        )
+        return result
+
+    async def aestimate(self, *args, **kwargs) -> LLMResult | ChatResult:
+        """Like `estimate`, without blocking the event loop."""
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(self.estimate, *args, **kwargs)
+        )
+
+    def table(self) -> List[Dict[str, Any]]:
+        """Return the projected usage per endpoint and in total."""
+        return [
+            {**row, "scope": "endpoint" if row["scope"] == "tag" else row["scope"]}
+            for row in self.usage.table()
+        ]
+
+    def publish(self):
+        """Publish the projected usage per endpoint as a table artifact.
+
+        Returns an awaitable when called from async code.
+        """
+        return create_table_artifact(
+            table=self.table(),
+            description="Projected tokens and cost per endpoint (dry run)",
+        )
+
+    def shutdown(self):
+        """Shut down the pool used to count tokens."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def __enter__(self):
+        """Return the estimator, to shut its pool down on exit."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Shut the token counting pool down."""
+        self.shutdown()
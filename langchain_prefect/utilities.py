@@ -1,13 +1,20 @@
 """Utilities for the langchain_prefect package."""
 
-from typing import Any, Callable, List
+import hashlib
+import inspect
+import json
+import logging
+from typing import Any, Callable, Dict, Iterable, List
 
 import tiktoken
 from langchain.schema import BaseMessage, LLMResult
 from prefect import Flow, flow
+from prefect.context import PrefectObjectRegistry
+from prefect.exceptions import MissingContextError
+from prefect.logging import get_logger, get_run_logger
 from prefect.utilities.asyncutils import is_async_fn
 from prefect.utilities.collections import listrepr
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 def get_prompt_content(prompts: Any) -> List[str]:
@@ -30,6 +37,22 @@ def num_tokens(text: str | List[str], encoding_name: str = "cl100k_base") -> int
     return num_tokens
 
 
+def get_current_logger(name: str):
+    """Return the run logger if in a run context, else the logger `name`."""
+    try:
+        return get_run_logger()
+    except MissingContextError:
+        return get_logger(name)
+
+
+def encoding_name_for_model(model_name: str | None) -> str:
+    """Return the name of the tiktoken encoding used by a model."""
+    try:
+        return tiktoken.encoding_for_model(model_name).name
+    except (KeyError, TypeError, AttributeError):
+        return "cl100k_base"
+
+
 def truncate(text: str, max_length: int = 300) -> str:
     """Truncate text to max_length."""
     if len(text) > 3 and len(text) >= max_length:
@@ -38,79 +61,303 @@ def truncate(text: str, max_length: int = 300) -> str:
     return text
 
 
-class NotAnArtifact(BaseModel):
-    """Placeholder class for soon-to-come `Artifact`."""
+class LLMInvocation:
+    """Record of an LLM invocation, without pydantic validation."""
+
+    __slots__ = (
+        "llm_endpoint",
+        "prompts",
+        "invocation_fn",
+        "args",
+        "kwargs",
+        "max_summarized_prompts",
+        "prompt_tokens",
+        "duplicate_prompts",
+    )
 
-    name: str
-    description: str
-    content: Any
+    def __init__(
+        self,
+        llm_endpoint: str,
+        prompts: Any,
+        invocation_fn: Callable[..., LLMResult],
+        args: tuple = (),
+        kwargs: dict | None = None,
+        max_summarized_prompts: int = 5,
+        prompt_tokens: int | None = None,
+        duplicate_prompts: int | None = None,
+    ):
+        self.llm_endpoint = llm_endpoint
+        self.prompts = prompts
+        self.invocation_fn = invocation_fn
+        self.args = args
+        self.kwargs = kwargs or {}
+        self.max_summarized_prompts = max_summarized_prompts
+        self.prompt_tokens = prompt_tokens
+        self.duplicate_prompts = duplicate_prompts
 
+    @property
+    def summary(self) -> str:
+        """Summary of the first `max_summarized_prompts` prompts, truncated."""
+        shown = get_prompt_content(self.prompts[: self.max_summarized_prompts])
+        n_more = len(self.prompts) - self.max_summarized_prompts
+        return (
+            f"Sending {listrepr([truncate(p) for p in shown])}"
+            + (f" and {n_more} more" if n_more > 0 else "")
+            + f" to {self.llm_endpoint} via {self.invocation_fn!r}"
+        )
 
-def llm_invocation_summary(*args, **kwargs) -> NotAnArtifact:
-    """Will eventually return an artifact."""
+    @property
+    def prompts_hash(self) -> str:
+        """SHA-256 hash of the prompt content."""
+        return hashlib.sha256(
+            "\x1e".join(get_prompt_content(self.prompts)).encode()
+        ).hexdigest()
 
-    subcls, prompts, *rest = args
+    def to_parameters(
+        self, max_bytes: int = 2048, payload_hash: str | None = None
+    ) -> Dict[str, Any]:
+        """Return slim flow run parameters describing this invocation.
+
+        Only the endpoint, hashes, token counts, the number of duplicate prompts
+        skipped when deduplicating and a summary are included, with the summary
+        truncated so that the JSON encoded parameters fit `max_bytes`.
+        `payload_hash` references the full payload if it was stored elsewhere.
+        """
+        summary = self.summary
+        parameters = {
+            "llm_endpoint": self.llm_endpoint,
+            "invocation_fn": self.invocation_fn.__name__,
+            "n_prompts": len(self.prompts),
+            "prompt_tokens": self.prompt_tokens,
+            "prompts_hash": self.prompts_hash,
+            "summary": summary,
+        }
+        if self.duplicate_prompts is not None:
+            parameters["duplicate_prompts"] = self.duplicate_prompts
+        if payload_hash:
+            parameters["payload_hash"] = payload_hash
+
+        # every character removed from the summary removes at least one byte
+        overflow = len(json.dumps(parameters).encode()) - max_bytes
+        if overflow > 0:
+            max_length = len(summary) - overflow - 3
+            parameters["summary"] = (
+                truncate(summary, max_length) if max_length > 3 else ""
+            )
+        return parameters
 
-    invocation_fn = kwargs["invocation_fn"]
+    def __str__(self) -> str:
+        """Return the summary of the invocation."""
+        return self.summary
 
-    llm_endpoint = subcls.__module__
+    def __repr__(self) -> str:
+        """Return the endpoint and method of the invocation."""
+        return (
+            f"LLMInvocation(llm_endpoint={self.llm_endpoint!r},"
+            f" invocation_fn={self.invocation_fn.__name__!r})"
+        )
 
-    prompt_content = get_prompt_content(prompts)
 
-    summary = (
-        f"Sending {listrepr([truncate(p) for p in prompt_content])} "
-        f"to {llm_endpoint} via {invocation_fn!r}"
+def json_default(obj: Any) -> Any:
+    """Serialize pydantic models such as messages, and `repr` anything else."""
+    return obj.dict() if isinstance(obj, BaseModel) else repr(obj)
+
+
+def llm_invocation_summary(*args, **kwargs) -> LLMInvocation:
+    """Return a record of an LLM invocation."""
+
+    subcls, prompts, *rest = args
+
+    invocation_fn = kwargs.pop("invocation_fn")
+
+    return LLMInvocation(
+        llm_endpoint=subcls.__module__,
+        prompts=prompts,
+        invocation_fn=invocation_fn,
+        args=tuple(rest),
+        kwargs=kwargs,
     )
 
-    return NotAnArtifact(
-        name="LLM Invocation Summary",
-        description=f"Query {llm_endpoint} via {invocation_fn.__name__}",
-        content={
-            "llm_endpoint": llm_endpoint,
-            "prompts": prompts,
-            "summary": summary,
-            "args": rest,
-            **kwargs,
-        },
+
+def _merge_llm_outputs(merged: Dict[str, Any], llm_output: Dict[str, Any]):
+    """Add the numbers of an `llm_output` to `merged`, and any missing value."""
+    for key, value in llm_output.items():
+        if merged.get(key) is None:
+            merged[key] = value
+        elif isinstance(value, dict) and isinstance(merged[key], dict):
+            merged[key] = dict(merged[key])
+            _merge_llm_outputs(merged[key], value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            merged[key] += value
+
+
+def merge_llm_results(llm_results: List[LLMResult]) -> LLMResult:
+    """Return one LLM result with the generations of several, in order.
+
+    Numbers in their `llm_output`, such as token counts, are summed. Other values
+    are taken from the first result with a value.
+    """
+    llm_output: Dict[str, Any] = {}
+    for llm_result in llm_results:
+        _merge_llm_outputs(llm_output, llm_result.llm_output or {})
+    return LLMResult(
+        generations=[
+            generations
+            for llm_result in llm_results
+            for generations in llm_result.generations
+        ],
+        llm_output=llm_output or None,
     )
 
 
-def parse_llm_result(llm_result: LLMResult) -> NotAnArtifact:
-    """Will eventually return an artifact."""
-    return NotAnArtifact(
-        name="LLM Result",
-        description="The result of the LLM invocation.",
-        content=llm_result,
+class ResultLogConfig(BaseModel):
+    """Which fields of an LLM result to log, how much of them, and at what level."""
+
+    fields: List[str] = Field(
+        default=["model_name", "token_usage", "generations"],
+        description=(
+            "Fields to log, out of `generations`, `n_generations`, `token_usage`,"
+            " `model_name` and `llm_output`."
+        ),
+    )
+    max_field_bytes: int = Field(
+        default=500, description="Maximum UTF-8 size of each formatted field."
     )
+    redact: Callable[[str, Any], Any] | None = Field(
+        default=None,
+        description="Hook called with each field name and value before formatting,"
+        " returning the value to log.",
+    )
+    level: int = Field(default=logging.INFO, description="Log level of the record.")
+
+
+def _get_result_field(llm_result: LLMResult, field: str) -> Any:
+    """Return a field of an LLM result or chat result."""
+    llm_output = getattr(llm_result, "llm_output", None) or {}
+    if field in ("generations", "n_generations"):
+        generations = [
+            generation
+            for item in llm_result.generations
+            for generation in (item if isinstance(item, list) else [item])
+        ]
+        if field == "n_generations":
+            return len(generations)
+        return [generation.text for generation in generations]
+    if field == "llm_output":
+        return llm_output
+    return llm_output.get(field)
+
+
+def cap_bytes(text: str, max_bytes: int) -> str:
+    """Cap the UTF-8 size of text, marking it with `...` if truncated."""
+    data = text.encode()
+    if len(data) <= max_bytes:
+        return text
+    return data[: max(max_bytes - 3, 0)].decode(errors="ignore") + "..."
+
+
+def _capped_repr(value: Any, max_bytes: int) -> str:
+    """Return the repr of a value capped to `max_bytes`, without formatting
+    more list items than fit."""
+    if not isinstance(value, list):
+        return cap_bytes(repr(value), max_bytes)
+
+    parts, size = [], 2
+    for item in value:
+        if size > max_bytes:
+            parts.append("...")
+            break
+        parts.append(cap_bytes(repr(item), max_bytes))
+        size += len(parts[-1]) + 2
+    return cap_bytes(f"[{', '.join(parts)}]", max_bytes)
+
+
+class LLMResultLogRecord:
+    """Log message for an LLM result, formatted only when emitted."""
+
+    __slots__ = ("llm_result", "config")
+
+    def __init__(self, llm_result: LLMResult, config: ResultLogConfig):
+        self.llm_result = llm_result
+        self.config = config
+
+    def __str__(self) -> str:
+        """Format the selected fields of the result, redacted and capped."""
+        formatted = []
+        for field in self.config.fields:
+            value = _get_result_field(self.llm_result, field)
+            if self.config.redact:
+                value = self.config.redact(field, value)
+            formatted.append(
+                f"{field}={_capped_repr(value, self.config.max_field_bytes)}"
+            )
+        return "Received LLM result: " + " ".join(formatted)
 
 
 def flow_wrapped_fn(
     func: Callable[..., LLMResult],
     flow_kwargs: dict | None = None,
     *args,
+    on_start: Iterable[Callable[[], Any]] = (),
+    on_result: Iterable[Callable[[LLMResult], Any]] = (),
+    result_log_config: ResultLogConfig | None = None,
+    return_result: bool = True,
     **kwargs,
 ) -> Flow:
     """Define a function to be wrapped in a flow depending
-    on whether the original function is sync or async."""
-    flow_kwargs = flow_kwargs or dict(name="Execute LLM Call", log_prints=True)
+    on whether the original function is sync or async.
+
+    Within the flow run, each `on_start` hook is called before the LLM call and
+    each `on_result` hook with the LLM result. Hooks returning an awaitable are
+    awaited in async flow runs. The result is logged according to
+    `result_log_config`, which defaults to `ResultLogConfig()`, and only returned
+    by the flow run if `return_result`.
+
+    The flow is kept out of Prefect's global object registry, which would
+    otherwise hold on to every flow created, and to the call arguments in their
+    closures, for the lifetime of the process."""
+    result_log_config = result_log_config or ResultLogConfig()
+    flow_kwargs = flow_kwargs or dict(
+        name="Execute LLM Call", log_prints=True, validate_parameters=False
+    )
 
     if is_async_fn(func):
 
-        async def execute_async_llm_call(llm_input: NotAnArtifact) -> LLMResult:
+        async def execute_async_llm_call(llm_input: Dict[str, Any]) -> LLMResult:
             """async flow for async LLM calls via `SubclassofBaseLLM.agenerate`"""
-            print(llm_input.content["summary"])
+            get_run_logger().info("%s", llm_input["summary"])
+            for hook in on_start:
+                if inspect.isawaitable(callback := hook()):
+                    await callback
             llm_result = await func(*args, **kwargs)
-            print(f"Recieved: {parse_llm_result(llm_result)!r}")
-            return llm_result
+            get_run_logger().log(
+                result_log_config.level,
+                "%s",
+                LLMResultLogRecord(llm_result, result_log_config),
+            )
+            for hook in on_result:
+                if inspect.isawaitable(callback := hook(llm_result)):
+                    await callback
+            return llm_result if return_result else None
 
-        return flow(**flow_kwargs)(execute_async_llm_call)
+        with PrefectObjectRegistry():
+            return flow(**flow_kwargs)(execute_async_llm_call)
     else:
 
-        def execute_llm_call(llm_input: NotAnArtifact) -> LLMResult:
+        def execute_llm_call(llm_input: Dict[str, Any]) -> LLMResult:
             """sync flow for sync LLM calls via `SubclassofBaseLLM.generate`"""
-            print(llm_input.content["summary"])
+            get_run_logger().info("%s", llm_input["summary"])
+            for hook in on_start:
+                hook()
             llm_result = func(*args, **kwargs)
-            print(f"Recieved: {parse_llm_result(llm_result)!r}")
-            return llm_result
+            get_run_logger().log(
+                result_log_config.level,
+                "%s",
+                LLMResultLogRecord(llm_result, result_log_config),
+            )
+            for hook in on_result:
+                hook(llm_result)
+            return llm_result if return_result else None
 
-        return flow(**flow_kwargs)(execute_llm_call)
+        with PrefectObjectRegistry():
+            return flow(**flow_kwargs)(execute_llm_call)
@@ -0,0 +1,240 @@
+"""Recording of LLM calls made in worker processes of a process pool."""
+
+import multiprocessing
+import pickle
+import queue
+import threading
+from typing import Any, Dict, Iterable, List
+
+import tiktoken
+from prefect.context import FlowRunContext, TagsContext
+from pydantic import BaseModel, Field, validator
+
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.usage import ModelPrice, TokenUsage, UsageTracker
+from langchain_prefect.utilities import encoding_name_for_model
+
+# the recording set up in this process by `init_worker_recording`
+worker_recording: RecordLLMCalls | None = None
+
+
+class WorkerRecordingConfig(BaseModel):
+    """Picklable configuration of `RecordLLMCalls` in worker processes."""
+
+    parent_flow_run_id: str | None = Field(
+        default=None,
+        description="The flow run that usage recorded in workers is attributed to.",
+    )
+    tags: List[str] = Field(
+        default_factory=list, description="Tags of the flow runs of recorded calls."
+    )
+    include: List[Any] | None = Field(
+        default=None, description="See the `include` option of `RecordLLMCalls`."
+    )
+    exclude: List[Any] | None = Field(
+        default=None, description="See the `exclude` option of `RecordLLMCalls`."
+    )
+    warm_tokenizers: List[str] = Field(
+        default_factory=list,
+        description="Models whose tokenizer to load when a worker starts.",
+    )
+    prices: Dict[str, ModelPrice] | None = Field(
+        default=None, description="See the `prices` option of `UsageTracker`."
+    )
+    publish_artifacts: bool = Field(
+        default=False,
+        description="Whether workers publish a usage table for each recorded call.",
+    )
+    recording_kwargs: Dict[str, Any] = Field(
+        default_factory=dict,
+        description="Other keyword arguments of `RecordLLMCalls`.",
+    )
+
+    @validator("recording_kwargs")
+    def _check_picklable(cls, recording_kwargs):
+        """Check that the options of `RecordLLMCalls` can be sent to workers."""
+        for name, value in recording_kwargs.items():
+            try:
+                pickle.dumps(value)
+            except Exception as exc:
+                raise ValueError(
+                    f"{name}={value!r} cannot be sent to worker processes: {exc}"
+                ) from exc
+        return recording_kwargs
+
+
+class _ForwardingUsageTracker(UsageTracker):
+    """Usage tracker sending the usage of each call to the parent process."""
+
+    def __init__(self, usage_queue: Any, parent_flow_run_id: str | None, **kwargs):
+        super().__init__(**kwargs)
+        self.usage_queue = usage_queue
+        self.parent_flow_run_id = parent_flow_run_id
+
+    def add(
+        self,
+        usage: TokenUsage,
+        model_name: str | None = None,
+        tags: Iterable[str] = (),
+        flow_run_id: str | None = None,
+        parent_flow_run_id: str | None = None,
+    ) -> TokenUsage:
+        """Add token usage to the totals of this worker and of the parent."""
+        record = dict(
+            model_name=model_name,
+            tags=list(tags),
+            flow_run_id=flow_run_id,
+            parent_flow_run_id=parent_flow_run_id or self.parent_flow_run_id,
+        )
+        usage = super().add(usage, **record)
+        self.usage_queue.put((usage.dict(), record))
+        return usage
+
+
+def init_worker_recording(config: WorkerRecordingConfig, usage_queue: Any = None):
+    """Record the LLM calls of a worker process, to use as a pool initializer.
+
+    Loads the tokenizers of `config.warm_tokenizers` and patches LLM calls with
+    `RecordLLMCalls` for the lifetime of the process. With a `usage_queue`, the
+    token usage of each call is sent to the parent process.
+    """
+    global worker_recording
+
+    for model_name in config.warm_tokenizers:
+        tiktoken.get_encoding(encoding_name_for_model(model_name)).encode("")
+
+    recording_kwargs = dict(config.recording_kwargs)
+    if usage_queue is not None:
+        recording_kwargs["usage_tracker"] = _ForwardingUsageTracker(
+            usage_queue,
+            config.parent_flow_run_id,
+            prices=config.prices,
+            publish_artifacts=config.publish_artifacts,
+        )
+    worker_recording = RecordLLMCalls(
+        include=config.include,
+        exclude=config.exclude,
+        tags=set(config.tags),
+        **recording_kwargs,
+    )
+    worker_recording.__enter__()
+
+
+class WorkerRecording:
+    """Records LLM calls made in worker processes as part of the current flow run."""
+
+    def __init__(
+        self,
+        usage_tracker: UsageTracker | None = None,
+        tags: Iterable[str] = (),
+        include: List[Any] | None = None,
+        exclude: List[Any] | None = None,
+        warm_tokenizers: Iterable[str] = ("gpt-3.5-turbo",),
+        publish_artifacts: bool = False,
+        **recording_kwargs,
+    ):
+        """Records LLM calls made in worker processes as part of the current flow run.
+
+        Pass `init_worker_recording` and `initargs` as the initializer of a
+        `ProcessPoolExecutor` or `multiprocessing.Pool` so that each worker
+        records its LLM calls with `RecordLLMCalls`. Worker flow runs are tagged
+        with the tags of the current context and the ID of the current flow run,
+        and their token usage is added to `usage_tracker` as part of that flow run
+        while the recording is entered, or when calling `collect`.
+
+        Args:
+            usage_tracker: A `UsageTracker` of this process to add the usage of
+                worker calls to. Its budgets are not enforced on worker calls.
+            tags: Tags to apply to the flow runs of worker calls.
+            include: See `RecordLLMCalls`.
+            exclude: See `RecordLLMCalls`.
+            warm_tokenizers: Models whose tokenizer workers load when they start.
+            publish_artifacts: Whether workers publish a usage table artifact for
+                each recorded call.
+            **recording_kwargs: Other options of `RecordLLMCalls`, which must be
+                picklable.
+
+        Example:
+            Preprocess documents on all cores and record their LLM calls:
+
+            >>> @flow
+            >>> def summarize_corpus(paths):  # noqa: D103
+            >>>     tracker = UsageTracker()
+            >>>     with WorkerRecording(usage_tracker=tracker) as recording:
+            >>>         with ProcessPoolExecutor(
+            >>>             initializer=init_worker_recording,
+            >>>             initargs=recording.initargs,
+            >>>         ) as pool:
+            >>>             summaries = list(pool.map(summarize, paths))
+            >>>     print(tracker.table())
+        """
+        flow_run_context = FlowRunContext.get()
+        parent_flow_run_id = (
+            str(flow_run_context.flow_run.id) if flow_run_context else None
+        )
+        tags = {*TagsContext.get().current_tags, *tags}
+        if parent_flow_run_id:
+            tags.add(f"parent-flow-run:{parent_flow_run_id}")
+
+        self.config = WorkerRecordingConfig(
+            parent_flow_run_id=parent_flow_run_id,
+            tags=sorted(tags),
+            include=include,
+            exclude=exclude,
+            warm_tokenizers=list(warm_tokenizers),
+            prices=usage_tracker.prices if usage_tracker else None,
+            publish_artifacts=publish_artifacts,
+            recording_kwargs=recording_kwargs,
+        )
+        self.usage_tracker = usage_tracker
+        self.usage_queue = multiprocessing.Queue() if usage_tracker else None
+        self._collector: threading.Thread | None = None
+
+    @property
+    def initargs(self) -> tuple:
+        """The arguments to pass to `init_worker_recording` in each worker."""
+        return (self.config, self.usage_queue)
+
+    def _add(self, item: tuple):
+        """Add the usage of a worker call to the usage tracker."""
+        usage, record = item
+        self.usage_tracker.add(TokenUsage(**usage), **record)
+
+    def collect(self) -> int:
+        """Add the usage sent by workers so far to the usage tracker.
+
+        Returns the number of calls collected.
+        """
+        collected = 0
+        while self.usage_queue is not None:
+            try:
+                item = self.usage_queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._add(item)
+                collected += 1
+        return collected
+
+    def _collect_until_stopped(self):
+        """Add usage sent by workers as it arrives, until `None` is received."""
+        while (item := self.usage_queue.get()) is not None:
+            self._add(item)
+
+    def __enter__(self):
+        """Add the usage sent by workers to the usage tracker as it arrives."""
+        if self.usage_queue is not None:
+            self._collector = threading.Thread(
+                target=self._collect_until_stopped,
+                name="langchain-prefect-worker-usage",
+                daemon=True,
+            )
+            self._collector.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Wait for the usage sent by workers that have exited."""
+        if self._collector:
+            self.usage_queue.put(None)
+            self._collector.join()
+            self._collector = None
@@ -1,4 +1,10 @@
+import asyncio
+from typing import Any, Dict, List
+
 import pytest
+from langchain.chat_models.base import BaseChatModel
+from langchain.llms.base import LLM
+from langchain.schema import AIMessage, BaseMessage, ChatGeneration, ChatResult
 from prefect.testing.utilities import prefect_test_harness
 
 
@@ -20,3 +26,58 @@ def reset_object_registry():
 
     with PrefectObjectRegistry():
         yield
+
+
+class EchoLLM(LLM):
+    """Fake LLM echoing prompts `repeat` times, async calls slower for shorter ones."""
+
+    repeat: int = 1
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "echo"
+
+    def _call(self, prompt: str, stop: List[str] | None = None, **kwargs: Any) -> str:
+        return prompt * self.repeat
+
+    async def _acall(
+        self, prompt: str, stop: List[str] | None = None, **kwargs: Any
+    ) -> str:
+        if prompt == "boom":
+            raise ValueError("boom")
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01 / len(prompt))
+        self.in_flight -= 1
+        return prompt * self.repeat
+
+
+class FakeChatModel(BaseChatModel):
+    model_name: str = "gpt-3.5-turbo"
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _generate(
+        self, messages: List[BaseMessage], stop=None, run_manager=None
+    ) -> ChatResult:
+        return ChatResult(
+            generations=[ChatGeneration(message=AIMessage(content="hi"))],
+            llm_output={
+                "token_usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 5,
+                    "total_tokens": 15,
+                },
+                "model_name": self.model_name,
+            },
+        )
+
+    async def _agenerate(self, messages, stop=None, run_manager=None) -> ChatResult:
+        return self._generate(messages)
+
+    def _combine_llm_outputs(self, llm_outputs: List[Dict[str, Any]]) -> dict:
+        return llm_outputs[0]
@@ -0,0 +1,282 @@
+import asyncio
+import json
+from typing import Any, List
+
+import pytest
+from conftest import EchoLLM
+from langchain.llms.base import LLM
+from langchain.schema import Generation
+
+from langchain_prefect.batch import (
+    BatchCheckpoint,
+    abatch_inference,
+    agenerate_many,
+    batch_inference_flow,
+    chunk_prompts,
+    generate_many_flow,
+    merge_shard_outputs,
+    read_jsonl_prompts,
+    shard_output_path,
+    sharded_batch_inference_flow,
+)
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.usage import DryRunEstimator
+
+
+def test_chunk_prompts_by_size_and_tokens():
+    """Test that batches are limited in size and tokens, and keep indices."""
+    prompts = ["foo bar baz"] * 5 + ["foo " * 20]
+
+    assert [
+        (start, len(batch))
+        for start, batch in chunk_prompts(prompts, max_batch_tokens=7, max_batch_size=3)
+    ] == [(0, 2), (2, 2), (4, 1), (5, 1)]
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+async def test_agenerate_many(ordered):
+    """Test that every prompt gets its generations, in order if requested."""
+    llm = EchoLLM()
+    prompts = [f"prompt {'x' * (i % 7)}" for i in range(50)]
+
+    results = [
+        (i, generations[0].text)
+        async for i, generations in agenerate_many(
+            llm, iter(prompts), max_concurrency=3, max_batch_size=4, ordered=ordered
+        )
+    ]
+
+    assert sorted(results) == list(enumerate(prompts))
+    if ordered:
+        assert results == list(enumerate(prompts))
+    assert llm.max_in_flight <= 3 * 4
+
+
+def test_generate_many_flow():
+    """Test that the flow, run with recorded calls, returns generations in order."""
+    prompts = [f"prompt {i}" for i in range(10)]
+
+    with RecordLLMCalls(include=[EchoLLM]):
+        generations = asyncio.run(
+            generate_many_flow(EchoLLM(), prompts, max_batch_size=4)
+        )
+
+    assert [g[0].text for g in generations] == prompts
+
+
+class SlowFirstLLM(LLM):
+    """Fake LLM answering the prompt `slow` after the others."""
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-first"
+
+    def _call(self, prompt: str, stop: List[str] | None = None, **kwargs: Any) -> str:
+        return prompt
+
+    async def _acall(
+        self, prompt: str, stop: List[str] | None = None, **kwargs: Any
+    ) -> str:
+        await asyncio.sleep(0.2 if prompt == "slow" else 0)
+        return prompt
+
+
+async def test_agenerate_many_bounds_read_ahead_in_order():
+    """Test that a slow batch stops reading prompts when yielding in order."""
+    n_read = 0
+
+    def prompts():
+        nonlocal n_read
+        for i in range(100):
+            n_read += 1
+            yield "slow" if i == 0 else f"prompt {i}"
+
+    results = agenerate_many(
+        SlowFirstLLM(), prompts(), max_concurrency=2, max_batch_size=2
+    )
+    assert await results.__anext__() == (0, [Generation(text="slow")])
+    # 4 batches waiting, the batch being queued, and the first prompt of the next
+    assert n_read <= 5 * 2 + 1
+
+    assert len([item async for item in results]) == 99
+
+
+async def test_agenerate_many_raises_errors():
+    """Test that errors raised by the LLM stop the fan-out."""
+    with pytest.raises(ValueError, match="boom"):
+        async for _ in agenerate_many(EchoLLM(), ["ok"] * 10 + ["boom"]):
+            pass
+
+
+async def test_abatch_inference_resumes(tmp_path):
+    """Test that finished rows are skipped and a partial line is discarded."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text(
+        "\n".join(json.dumps({"id": f"id-{i}", "prompt": f"p{i}"}) for i in range(10))
+    )
+    # a crashed run finished rows 3 and 5, and was writing row 7
+    output_path.write_text(
+        '{"row": 3, "generations": ["p3"], "id": "id-3"}\n'
+        '{"row": 5, "generations": ["p5"], "id": "id-5"}\n'
+        '{"row": 7, "gener'
+    )
+
+    stats = await abatch_inference(
+        EchoLLM(), input_path, output_path, id_key="id", checkpoint_every=3
+    )
+
+    assert stats["processed"] == 8 and stats["skipped"] == 2
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted(r["row"] for r in results) == list(range(10))
+    assert all(r["generations"] == [f"p{r['row']}"] for r in results)
+    assert all(r["id"] == f"id-{r['row']}" for r in results)
+
+    checkpoint = BatchCheckpoint.load(output_path.with_suffix(".checkpoint"))
+    assert checkpoint.n_done == 10
+    assert checkpoint.output_offset == output_path.stat().st_size
+    assert all(row in checkpoint for row in range(10)) and 10 not in checkpoint
+
+
+def test_batch_inference_flow(tmp_path):
+    """Test that the flow, run with recorded calls, writes a result per row."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text("\n".join(json.dumps({"prompt": f"p{i}"}) for i in range(10)))
+
+    with RecordLLMCalls(include=[EchoLLM]):
+        stats = asyncio.run(
+            batch_inference_flow(EchoLLM(), input_path, output_path, max_batch_size=4)
+        )
+
+    assert stats["processed"] == 10
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert sorted(r["row"] for r in results) == list(range(10))
+    assert all(r["generations"] == [f"p{r['row']}"] for r in results)
+
+
+@pytest.mark.parametrize("shard_by", ["hash", "bytes"])
+def test_shards_partition_rows(tmp_path, shard_by):
+    """Test that every row is read by exactly one shard, with its row number."""
+    input_path = tmp_path / "in.jsonl"
+    input_path.write_text(
+        "".join(
+            json.dumps({"prompt": "x" * (i % 13), "i": i}) + "\n" for i in range(100)
+        )
+    )
+
+    rows = [
+        (row, record["i"])
+        for index in range(7)
+        for row, record in read_jsonl_prompts(
+            input_path, shard=(index, 7), shard_by=shard_by
+        )
+    ]
+
+    assert sorted(rows) == [(i, i) for i in range(100)]
+
+
+def test_sharded_batch_inference_flow(tmp_path):
+    """Test that shards make recorded calls and merge into one output by row."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text("\n".join(json.dumps({"prompt": f"p{i}"}) for i in range(10)))
+
+    with RecordLLMCalls(include=[EchoLLM]):
+        shard_stats = asyncio.run(
+            sharded_batch_inference_flow(
+                EchoLLM(), input_path, output_path, n_shards=2, max_batch_size=4
+            )
+        )
+
+    assert sorted(stats["shard"] for stats in shard_stats) == [0, 1]
+    assert sum(stats["processed"] for stats in shard_stats) == 10
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [r["row"] for r in results] == list(range(10))
+    assert all(r["generations"] == [f"p{r['row']}"] for r in results)
+
+
+async def test_sharded_outputs_merge_in_row_order(tmp_path):
+    """Test that resumed, sharded outputs merge into one output ordered by row."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text("\n".join(json.dumps({"prompt": f"p{i}"}) for i in range(30)))
+    shard_paths = [shard_output_path(output_path, i, 3) for i in range(3)]
+    # a crashed first run of shard 0 finished its last two rows
+    first_shard_rows = [
+        row for row, _ in read_jsonl_prompts(input_path, shard=(0, 3), shard_by="bytes")
+    ]
+    shard_paths[0].write_text(
+        "".join(
+            json.dumps({"row": row, "generations": [f"p{row}"]}) + "\n"
+            for row in first_shard_rows[-2:]
+        )
+    )
+
+    for index, path in enumerate(shard_paths):
+        await abatch_inference(
+            EchoLLM(),
+            input_path,
+            path,
+            shard=(index, 3),
+            shard_by="bytes",
+            ordered=True,
+        )
+    merge_shard_outputs(shard_paths, output_path)
+
+    results = [json.loads(line) for line in output_path.read_text().splitlines()]
+    assert [r["row"] for r in results] == list(range(30))
+
+
+async def test_ordered_shard_bounds_rows_in_flight(tmp_path, monkeypatch):
+    """Test that a slow row of an ordered shard stops reading the rest."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text(
+        "".join(
+            json.dumps({"prompt": "slow" if i == 0 else f"p{i}"}) + "\n"
+            for i in range(200)
+        )
+    )
+    rows_read, n_read_by_slow_row = [], []
+
+    def read_rows(*args, **kwargs):
+        for row, record in read_jsonl_prompts(*args, **kwargs):
+            rows_read.append(row)
+            yield row, record
+
+    class CountingLLM(SlowFirstLLM):
+        async def _acall(self, prompt: str, *args, **kwargs) -> str:
+            result = await super()._acall(prompt, *args, **kwargs)
+            if prompt == "slow":
+                n_read_by_slow_row.append(len(rows_read))
+            return result
+
+    monkeypatch.setattr("langchain_prefect.batch.read_jsonl_prompts", read_rows)
+    stats = await abatch_inference(
+        CountingLLM(),
+        input_path,
+        output_path,
+        shard=(0, 1),
+        ordered=True,
+        max_concurrency=2,
+        max_batch_size=2,
+    )
+
+    assert stats["processed"] == 200
+    assert n_read_by_slow_row[0] <= 5 * 2 + 1
+
+
+async def test_abatch_inference_dry_run(tmp_path):
+    """Test that a dry run projects the unfinished rows without writing output."""
+    input_path, output_path = tmp_path / "in.jsonl", tmp_path / "out.jsonl"
+    input_path.write_text(
+        "\n".join(json.dumps({"prompt": f"prompt {i}"}) for i in range(10))
+    )
+    output_path.write_text('{"row": 3, "generations": ["prompt 3"]}\n{"row": 5')
+
+    with DryRunEstimator(completion_tokens=1) as estimator:
+        stats = await abatch_inference(
+            EchoLLM(), input_path, output_path, dry_run=estimator, max_batch_size=4
+        )
+
+    assert stats["processed"] == 9 and stats["skipped"] == 1
+    assert stats["batches"] == 3 and stats["completion_tokens"] == 9
+    assert estimator.usage.total.total_tokens == stats["total_tokens"]
+    assert output_path.read_text().endswith('{"row": 5')
+    assert not output_path.with_suffix(".checkpoint").exists()
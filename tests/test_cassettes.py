@@ -0,0 +1,158 @@
+import pytest
+from conftest import EchoLLM, FakeChatModel
+from langchain.schema import (
+    AIMessage,
+    ChatGeneration,
+    ChatResult,
+    Generation,
+    HumanMessage,
+    LLMResult,
+    SystemMessage,
+)
+
+from langchain_prefect.cassettes import (
+    Cassette,
+    CassetteMiss,
+    dump_result,
+    fingerprint,
+    load_result,
+)
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.utilities import llm_invocation_summary
+
+
+class FakeLLM:
+    _identifying_params = {"model_name": "text-davinci-003", "temperature": 0}
+
+
+def generate(llm, prompts, stop=None):
+    return LLMResult(
+        generations=[[Generation(text=prompt.upper())] for prompt in prompts],
+        llm_output={"model_name": "text-davinci-003"},
+    )
+
+
+def make_fingerprint(prompts, **kwargs):
+    return fingerprint(
+        llm_invocation_summary(FakeLLM(), prompts, invocation_fn=generate, **kwargs),
+        FakeLLM(),
+    )
+
+
+def test_fingerprint():
+    """Test that fingerprints only depend on what is sent to the provider."""
+    assert make_fingerprint(["foo"]) == make_fingerprint(["foo"], callbacks=object())
+    assert make_fingerprint(["foo"]) != make_fingerprint(["bar"])
+    assert make_fingerprint(["foo"]) != make_fingerprint(["foo"], stop=["\n"])
+    assert make_fingerprint([HumanMessage(content="foo")]) != make_fingerprint(
+        [SystemMessage(content="foo")]
+    )
+
+
+def test_dump_and_load_results():
+    """Test that LLM and chat results survive a round trip through JSON."""
+    llm_result = generate(None, ["foo", "bar"])
+    chat_result = ChatResult(
+        generations=[ChatGeneration(message=AIMessage(content="hi"))],
+        llm_output={"token_usage": {"total_tokens": 3}},
+    )
+
+    chat_llm_result = LLMResult(
+        generations=[chat_result.generations], llm_output=chat_result.llm_output
+    )
+
+    assert load_result(dump_result(llm_result)) == llm_result
+    assert load_result(dump_result(chat_result)) == chat_result
+    assert load_result(dump_result(chat_llm_result)) == chat_llm_result
+
+
+def test_record_then_replay(tmp_path):
+    """Test that recorded results are replayed without calling the LLM."""
+    path = tmp_path / "cassette.jsonl"
+    recorder = Cassette(path, mode="record")
+    recorded = recorder.wrap(make_fingerprint(["foo"]), "llm", generate)(
+        FakeLLM(), ["foo"]
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("The LLM was called.")
+
+    player = Cassette(path)
+    assert len(player) == 1
+    assert player.wrap(make_fingerprint(["foo"]), "llm", fail)() == recorded
+    assert player.hits == 1
+
+    with pytest.raises(CassetteMiss, match="No result recorded"):
+        player.wrap(make_fingerprint(["bar"]), "llm", fail)()
+
+
+def test_replay_fallthrough(tmp_path):
+    """Test that unrecorded calls fall through and are recorded."""
+    path = tmp_path / "cassette.jsonl"
+    path.write_text("interrupted")
+    cassette = Cassette(path, policy="fallthrough")
+    assert len(cassette) == 0
+
+    result = cassette.wrap(make_fingerprint(["bar"]), "llm", generate)(
+        FakeLLM(), ["bar"]
+    )
+
+    assert cassette.misses == 1
+    assert Cassette(path).get(make_fingerprint(["bar"])) == result
+
+
+async def test_replay_async(tmp_path):
+    """Test that async calls are recorded and replayed."""
+
+    async def agenerate(llm, prompts):
+        return generate(llm, prompts)
+
+    path = tmp_path / "cassette.jsonl"
+    result = await Cassette(path, mode="record").wrap("a" * 64, "llm", agenerate)(
+        FakeLLM(), ["foo"]
+    )
+
+    assert await Cassette(path).wrap("a" * 64, "llm", agenerate)() == result
+
+
+def test_record_llm_generate(tmp_path):
+    """Test that the result of a real LLM call, with its run info, is recorded."""
+    path = tmp_path / "cassette.jsonl"
+    result = Cassette(path, mode="record").wrap("a" * 64, "llm", EchoLLM.generate)(
+        EchoLLM(), ["foo"]
+    )
+
+    assert result.run is not None
+    assert Cassette(path).get("a" * 64) == result
+
+
+def test_record_llm_calls_from_empty_cassette(tmp_path):
+    """Test that calls are recorded to an empty cassette, then replayed."""
+    path = tmp_path / "cassette.jsonl"
+    path.touch()
+
+    recorder = Cassette(path, mode="record")
+    with RecordLLMCalls(include=[EchoLLM], cassette=recorder):
+        assert EchoLLM()("foo") == "foo"
+    assert len(recorder) == 1
+
+    player = Cassette(path)
+    with RecordLLMCalls(include=[EchoLLM], cassette=player):
+        assert EchoLLM()("foo") == "foo"
+    assert player.hits == 1
+
+
+def test_record_then_replay_chat_model(tmp_path):
+    """Test that chat model calls, recorded at `generate`, are replayed."""
+    path = tmp_path / "cassette.jsonl"
+    message = [HumanMessage(content="foo")]
+
+    with RecordLLMCalls(
+        include=[FakeChatModel], cassette=Cassette(path, mode="record")
+    ):
+        assert FakeChatModel()(message) == AIMessage(content="hi")
+
+    player = Cassette(path)
+    with RecordLLMCalls(include=[FakeChatModel], cassette=player):
+        assert FakeChatModel()(message) == AIMessage(content="hi")
+    assert player.hits == 1 and player.misses == 0
@@ -0,0 +1,142 @@
+from typing import Any, List
+
+import pytest
+from langchain.llms.base import LLM
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import Generation, LLMResult
+
+from langchain_prefect.cassettes import Cassette, fingerprint
+from langchain_prefect.circuit_breaker import CircuitBreaker, CircuitOpen, CircuitState
+from langchain_prefect.plugins import RecordLLMCalls, record_llm_call
+from langchain_prefect.usage import BudgetExceeded, TokenUsage, UsageTracker
+from langchain_prefect.utilities import llm_invocation_summary
+
+ENDPOINT = "langchain.llms.openai"
+
+
+def fail(*args, **kwargs):
+    raise ConnectionError("provider is down")
+
+
+def test_circuit_opens_on_error_rate():
+    """Test that the circuit opens once enough calls fail, and then fails fast."""
+    breaker = CircuitBreaker(min_calls=2, failure_rate_threshold=0.5)
+    wrapped = breaker.wrap(ENDPOINT, fail)
+
+    for _ in range(2):
+        assert breaker.allow(ENDPOINT)
+        with pytest.raises(ConnectionError):
+            wrapped()
+
+    assert breaker.state(ENDPOINT) == CircuitState.OPEN
+    with pytest.raises(CircuitOpen, match="Did not call"):
+        breaker.allow(ENDPOINT)
+
+
+def test_circuit_opens_on_latency():
+    """Test that slow calls count as failures."""
+    breaker = CircuitBreaker(min_calls=1, latency_threshold=1)
+    breaker.record(ENDPOINT, failed=False, latency=2)
+    assert breaker.state(ENDPOINT) == CircuitState.OPEN
+
+
+def test_open_circuit_routes_to_fallback():
+    """Test that an open circuit with a fallback does not raise."""
+    breaker = CircuitBreaker(min_calls=1, fallback=object())
+    breaker.record(ENDPOINT, failed=True)
+    assert breaker.allow(ENDPOINT) is False
+
+
+@pytest.mark.parametrize(
+    "probe_failed, expected_state",
+    [(False, CircuitState.CLOSED), (True, CircuitState.OPEN)],
+)
+def test_half_open_probe(probe_failed, expected_state):
+    """Test that a single probe decides whether the circuit recovers."""
+    breaker = CircuitBreaker(min_calls=1, recovery_timeout=0)
+    breaker.record(ENDPOINT, failed=True)
+
+    assert breaker.allow(ENDPOINT)
+    assert breaker.state(ENDPOINT) == CircuitState.HALF_OPEN
+
+    breaker.record(ENDPOINT, failed=probe_failed)
+    assert breaker.state(ENDPOINT) == expected_state
+
+
+async def test_wrap_async_records_success():
+    """Test that async calls are wrapped with an async wrapper."""
+    breaker = CircuitBreaker(min_calls=1)
+
+    async def agenerate():
+        return "result"
+
+    assert await breaker.wrap(ENDPOINT, agenerate)() == "result"
+    assert breaker.state(ENDPOINT) == CircuitState.CLOSED
+
+
+class FailingLLM(LLM):
+    @property
+    def _llm_type(self) -> str:
+        return "failing"
+
+    def _call(self, prompt: str, stop: List[str] | None = None, **kwargs: Any) -> str:
+        raise ConnectionError("provider is down")
+
+
+@pytest.fixture
+def half_open_breaker():
+    """A breaker whose circuit for `FailingLLM` is half-open on the next call."""
+    breaker = CircuitBreaker(min_calls=1, recovery_timeout=0)
+    breaker.record(FailingLLM.__module__, failed=True)
+    return breaker
+
+
+def test_probe_is_released_when_budget_is_exceeded(half_open_breaker):
+    """Test that a call refused by the budget does not keep the probe slot."""
+    tracker = UsageTracker(max_total_tokens=1, publish_artifacts=False)
+    tracker.add(TokenUsage(calls=1, total_tokens=1))
+    generate = record_llm_call(
+        FailingLLM.generate, circuit_breaker=half_open_breaker, usage_tracker=tracker
+    )
+
+    with pytest.raises(BudgetExceeded):
+        generate(FailingLLM(), ["Hello"])
+
+    assert half_open_breaker.allow(FailingLLM.__module__)
+    assert half_open_breaker.state(FailingLLM.__module__) == CircuitState.HALF_OPEN
+
+
+def test_probe_is_released_when_result_is_replayed(half_open_breaker, tmp_path):
+    """Test that a call replayed from a cassette does not keep the probe slot."""
+    llm = FailingLLM()
+    cassette = Cassette(tmp_path / "cassette.jsonl", mode="record")
+    cassette.put(
+        fingerprint(
+            llm_invocation_summary(llm, ["Hello"], invocation_fn=FailingLLM.generate),
+            llm,
+        ),
+        LLMResult(generations=[[Generation(text="Hi")]]),
+    )
+    generate = record_llm_call(
+        FailingLLM.generate,
+        circuit_breaker=half_open_breaker,
+        cassette=Cassette(cassette.path),
+    )
+
+    assert generate(llm, ["Hello"]).generations[0][0].text == "Hi"
+
+    assert half_open_breaker.allow(FailingLLM.__module__)
+    assert half_open_breaker.state(FailingLLM.__module__) == CircuitState.HALF_OPEN
+
+
+def test_open_circuit_calls_fallback_on_same_endpoint():
+    """Test that a fallback sharing the open circuit's endpoint is still called."""
+    fallback = FakeListLLM(responses=["From the fallback"])
+    breaker = CircuitBreaker(min_calls=1, recovery_timeout=3600, fallback=fallback)
+    breaker.record(FakeListLLM.__module__, failed=True)
+
+    with RecordLLMCalls(include=[FakeListLLM], circuit_breaker=breaker):
+        result = FakeListLLM(responses=["From the primary"])("Hello")
+
+    assert result == "From the fallback"
+    assert breaker.state(FakeListLLM.__module__) == CircuitState.OPEN
@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+from typing import Any, List
+
+from langchain.llms.base import LLM
+from prefect import flow
+from prefect.context import FlowRunContext
+
+from langchain_prefect.executors import SyncCallExecutor
+from langchain_prefect.plugins import RecordLLMCalls
+
+
+async def test_arun_offloads_to_worker_thread():
+    """Test that calls run on a worker thread without blocking the event loop."""
+    ticks = 0
+
+    async def tick():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    def call():
+        time.sleep(0.2)
+        return threading.current_thread().name
+
+    ticker = asyncio.create_task(tick())
+    with SyncCallExecutor(max_workers=2) as executor:
+        thread_name = await executor.arun(call)
+    ticker.cancel()
+
+    assert thread_name.startswith("langchain-prefect")
+    assert ticks >= 5
+    assert executor.stats()["calls"] == 1
+
+
+async def test_saturation_and_queue_time_are_reported():
+    """Test that calls waiting for a busy worker are counted."""
+    with SyncCallExecutor(max_workers=1, queue_time_warning=0) as executor:
+        await asyncio.gather(*[executor.arun(time.sleep, 0.1) for _ in range(3)])
+
+    stats = executor.stats()
+    assert stats["calls"] == 3
+    assert stats["in_flight"] == 0
+    assert stats["saturated_calls"] == 2
+    assert stats["max_queue_time"] > 0
+
+
+class FlowRunLLM(LLM):
+    @property
+    def _llm_type(self) -> str:
+        return "flow-run"
+
+    def _call(self, prompt: str, stop: List[str] | None = None, **kwargs: Any) -> str:
+        flow_run = FlowRunContext.get().flow_run
+        return f"{flow_run.name} {flow_run.parent_task_run_id is not None}"
+
+
+async def test_arun_records_calls_in_the_callers_flow_run():
+    """Test that sync calls run on a worker thread are recorded as subflows."""
+
+    @flow
+    async def handle_request() -> str:
+        with SyncCallExecutor() as executor:
+            return await executor.arun(FlowRunLLM(), "Hello")
+
+    with RecordLLMCalls(include=[FlowRunLLM]):
+        assert await handle_request() == f"Calling {FlowRunLLM.__module__} True"
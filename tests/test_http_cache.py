@@ -0,0 +1,103 @@
+import hashlib
+
+import httpx
+import pytest
+
+from langchain_prefect.http_cache import CachingTransport, HttpCache, cache_key
+from langchain_prefect.loaders import GithubIssueLoader
+
+
+class VersionedAPI:
+    """Serves a versioned JSON document, answering 304 to its current ETag."""
+
+    def __init__(self):
+        self.version = 1
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        etag = f'"{hashlib.md5(str(self.version).encode()).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(
+            200,
+            headers={"ETag": etag},
+            json={"path": request.url.path, "version": self.version},
+        )
+
+
+@pytest.fixture
+def api():
+    return VersionedAPI()
+
+
+def caching_client(api: VersionedAPI, cache: HttpCache) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        transport=CachingTransport(cache, httpx.MockTransport(api))
+    )
+
+
+async def test_revalidates_cached_responses(api, tmp_path):
+    """Test that cached responses are revalidated, and served on a 304."""
+    cache = HttpCache(tmp_path)
+    async with caching_client(api, cache) as client:
+        first = await client.get("https://api.test/issues")
+        second = await client.get("https://api.test/issues")
+        api.version = 2
+        third = await client.get("https://api.test/issues")
+
+    assert "If-None-Match" not in api.requests[0].headers
+    assert api.requests[1].headers["If-None-Match"] == first.headers["ETag"]
+    assert second.json() == first.json() == {"path": "/issues", "version": 1}
+    assert second.extensions["from_cache"]
+    assert third.json()["version"] == 2 and "from_cache" not in third.extensions
+    assert (cache.hits, cache.misses) == (1, 2)
+
+    # the updated response is stored, and read back by a new cache
+    cache = HttpCache(tmp_path)
+    async with caching_client(api, cache) as client:
+        assert (await client.get("https://api.test/issues")).json()["version"] == 2
+    assert (cache.hits, cache.misses, len(cache)) == (1, 0, 1)
+
+
+async def test_cache_key_varies_with_authorization(api, tmp_path):
+    """Test that responses to different credentials are cached separately."""
+    cache = HttpCache(tmp_path)
+    async with caching_client(api, cache) as client:
+        for token in ("a", "b", "a"):
+            await client.get(
+                "https://api.test/issues", headers={"Authorization": token}
+            )
+
+    assert (cache.hits, cache.misses, len(cache)) == (1, 2, 2)
+
+
+async def test_evicts_least_recently_used(api, tmp_path):
+    """Test that the least recently used responses are evicted beyond max_bytes."""
+    cache = HttpCache(tmp_path)
+    async with caching_client(api, cache) as client:
+        await client.get("https://api.test/0")
+    entry_size = cache.size
+
+    cache = HttpCache(tmp_path, max_bytes=2 * entry_size)
+    async with caching_client(api, cache) as client:
+        await client.get("https://api.test/1")
+        await client.get("https://api.test/0")
+        await client.get("https://api.test/2")
+        keys = {
+            path: cache_key(client.build_request("GET", f"https://api.test/{path}"))
+            for path in range(3)
+        }
+
+    assert keys[0] in cache and keys[2] in cache and keys[1] not in cache
+    assert cache.size <= cache.max_bytes
+    assert sorted(f.stem for f in tmp_path.iterdir()) == sorted([keys[0], keys[2]])
+
+
+def test_loader_client_uses_cache(tmp_path):
+    """Test that the clients of a loader with a cache send requests through it."""
+    cache = HttpCache(tmp_path)
+    client = GithubIssueLoader("o/r", n_issues=1, cache=cache)._new_client()
+
+    assert isinstance(client._transport, CachingTransport)
+    assert client._transport.cache is cache
@@ -0,0 +1,107 @@
+import asyncio
+import re
+
+import httpx
+import pytest
+
+from langchain_prefect.loaders import GithubIssueLoader
+
+N_ISSUES = 6
+
+
+class FakeGitHub:
+    """Serves issues with two pages of comments each, tracking concurrency."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return httpx.Response(200, json=self.respond(request))
+        finally:
+            self.in_flight -= 1
+
+    def respond(self, request: httpx.Request):
+        page = int(request.url.params["page"])
+        per_page = int(request.url.params["per_page"])
+        if match := re.search(r"/issues/(\d+)/comments$", request.url.path):
+            # three comments, on pages of two
+            return [
+                {"body": f"comment {i} on {match.group(1)}", "user": {"login": "bot"}}
+                for i in range(3)
+            ][(page - 1) * 2 : page * 2]
+        first = (page - 1) * per_page
+        return [
+            {
+                "html_url": f"https://github.com/o/r/issues/{number}",
+                "number": number,
+                "title": f"Issue {number}",
+                "body": "body",
+                "comments": 0 if number % 3 == 0 else 3,
+                "labels": [{"name": "bug"}],
+                "user": {"login": "octocat"},
+            }
+            for number in range(first + 1, min(first + per_page, N_ISSUES) + 1)
+        ]
+
+
+@pytest.fixture
+def github():
+    return FakeGitHub()
+
+
+@pytest.fixture
+def client(github):
+    return httpx.AsyncClient(transport=httpx.MockTransport(github))
+
+
+async def test_aload_fetches_comments_concurrently(github, client):
+    """Test that comments are fetched concurrently, keeping the issue order."""
+    loader = GithubIssueLoader("o/r", n_issues=100, max_concurrency=2, client=client)
+    documents = await loader.aload()
+
+    assert [d.metadata["title"] for d in documents] == [
+        f"Issue {n}" for n in range(1, N_ISSUES + 1)
+    ]
+    assert documents[0].page_content.count("bot: comment") == 3
+    assert "comment" not in documents[2].page_content
+    assert github.max_in_flight == 2
+    # two pages of issues, the last one empty, and three of comments for 4 issues
+    assert github.requests == 2 + 4 * 3
+    assert not client.is_closed
+
+
+def test_load(client):
+    """Test that the sync loader loads the same documents."""
+    documents = GithubIssueLoader("o/r", n_issues=4, client=client).load()
+
+    assert [d.metadata["source"] for d in documents] == [
+        f"https://github.com/o/r/issues/{n}" for n in range(1, 5)
+    ]
+    assert documents[1].metadata["labels"] == "bug"
+
+
+async def test_loader_pools_connections_until_exited(github, monkeypatch):
+    """Test that an entered loader reuses its client, and closes it on exit."""
+    clients = []
+
+    def new_client(self):
+        clients.append(httpx.AsyncClient(transport=httpx.MockTransport(github)))
+        return clients[-1]
+
+    monkeypatch.setattr(GithubIssueLoader, "_new_client", new_client)
+    loader = GithubIssueLoader("o/r", n_issues=2)
+
+    async with loader:
+        await loader.aload()
+        await loader.aload()
+    assert len(clients) == 1 and clients[0].is_closed
+
+    await loader.aload()
+    assert len(clients) == 2 and clients[1].is_closed
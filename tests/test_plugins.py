@@ -1,6 +1,37 @@
+import gc
+import logging
+import os
+import tracemalloc
+from typing import Any, List
+
+import pytest
+from conftest import EchoLLM
+from langchain.base_language import BaseLanguageModel
+from langchain.chat_models import ChatOpenAI
+from langchain.chat_models.base import BaseChatModel
 from langchain.llms import OpenAI
+from langchain.llms.base import BaseLLM
+from langchain.schema import Generation, LLMResult
+from prefect import flow
+from prefect.context import FlowRunContext
+from prefect.logging.handlers import APILogHandler
+
+from langchain_prefect.plugins import (
+    RecordLLMCalls,
+    _patch_plan,
+    _subclasses,
+    record_llm_call,
+)
+from langchain_prefect.usage import UsageTracker
+from langchain_prefect.utilities import (
+    LLMInvocation,
+    llm_invocation_summary,
+)
 
-from langchain_prefect.utilities import NotAnArtifact, llm_invocation_summary
+# calls filling the bounded caches of Prefect and its dependencies
+WARMUP_CALLS = 200
+# see benchmarks/soak_recording.py to soak test recording over 100k calls
+SOAK_CALLS = int(os.getenv("LANGCHAIN_PREFECT_SOAK_CALLS", 200))
 
 
 class TestParseInvocationSummary:
@@ -12,7 +43,186 @@ class TestParseInvocationSummary:
             OpenAI(), llm_input, invocation_fn=lambda x: None
         )
 
-        assert isinstance(artifact, NotAnArtifact)
+        assert isinstance(artifact, LLMInvocation)
+
+        assert artifact.llm_endpoint == "langchain.llms.openai"
+        assert artifact.prompts == llm_input
+
+
+class WrappedOpenAI(OpenAI):
+    def generate(self, prompts, stop=None, **kwargs):
+        return super().generate(prompts, stop=stop, **kwargs)
+
+
+class TunedOpenAI(WrappedOpenAI):
+    pass
+
+
+def test_patch_plan():
+    """Test that methods are patched where they are defined, however deep."""
+    plan = _patch_plan(_subclasses(BaseLanguageModel))
+
+    assert (BaseLLM, "generate", True) in plan
+    assert (WrappedOpenAI, "generate", True) in plan
+    assert (ChatOpenAI, "_generate", True) in plan
+    assert not any(cls in (OpenAI, TunedOpenAI) for cls, _, _ in plan)
+    # abstract methods are left alone
+    assert (BaseChatModel, "_generate", True) not in plan
+    assert len(set(plan)) == len(plan)
+    assert _patch_plan(_subclasses(BaseLanguageModel)) is plan
+
+
+def test_patch_and_restore_subclass_methods():
+    """Test that deep subclasses are patched once and restored on exit."""
+    original = vars(WrappedOpenAI)["generate"]
+
+    with RecordLLMCalls():
+        assert vars(WrappedOpenAI)["generate"] is not original
+        assert "generate" not in vars(TunedOpenAI)
+
+    assert vars(WrappedOpenAI)["generate"] is original
+
+
+class FakeOpenAI(OpenAI):
+    pass
+
+
+def test_patch_plan_include_exclude():
+    """Test that excluded classes are left unpatched, even if they inherit."""
+    recorder = RecordLLMCalls(include=[OpenAI], exclude=[FakeOpenAI])
+    recorded = {(cls, name) for cls, name, recorded in recorder.patch_plan if recorded}
+    assert (OpenAI, "generate") in recorded
+    assert (WrappedOpenAI, "generate") in recorded
+    assert (BaseLLM, "generate") not in recorded
+    assert (FakeOpenAI, "generate", False) in recorder.patch_plan
+
+    recorder = RecordLLMCalls(include=["langchain.llms.openai"])
+    assert (OpenAI, "generate", True) in recorder.patch_plan
+    assert all(
+        cls.__module__ != __name__ or not recorded
+        for cls, _, recorded in recorder.patch_plan
+    )
+
+    recorder = RecordLLMCalls(exclude=["*.FakeOpenAI"])
+    assert (EchoLLM, "generate", True) in recorder.patch_plan
+    assert (ChatOpenAI, "_generate", True) in recorder.patch_plan
+
+    unrecorded = FakeOpenAI.generate
+    with recorder:
+        assert FakeOpenAI.generate is unrecorded
+        assert OpenAI.generate is not unrecorded
+    assert "generate" not in vars(FakeOpenAI)
+    assert OpenAI.generate is unrecorded
+
+
+class BatchLLM(BaseLLM):
+    @property
+    def _llm_type(self) -> str:
+        return "batch"
+
+    def _generate(self, prompts: List[str], *args: Any, **kwargs: Any) -> LLMResult:
+        generated_batches.append(len(prompts))
+        return LLMResult(
+            generations=[[Generation(text=prompt.upper())] for prompt in prompts],
+            llm_output={"token_usage": {"total_tokens": len(prompts)}},
+        )
+
+    async def _agenerate(self, prompts: List[str], *args, **kwargs) -> LLMResult:
+        return self._generate(prompts)
+
+
+generated_batches = []
+
+
+@pytest.mark.parametrize("method", ["generate", "agenerate"])
+async def test_sub_batches(method):
+    """Test that large batches are generated in sub-batches, merged in order."""
+    generated_batches.clear()
+    prompts = [f"prompt {i}" for i in range(10)]
+    generate = record_llm_call(
+        getattr(BatchLLM, method), sub_batch_size=3, max_sub_batch_concurrency=2
+    )
+
+    llm_result = generate(BatchLLM(), prompts)
+    if method == "agenerate":
+        llm_result = await llm_result
+
+    assert [g[0].text for g in llm_result.generations] == [p.upper() for p in prompts]
+    assert llm_result.llm_output["token_usage"] == {"total_tokens": 10}
+    assert sorted(generated_batches) == [1, 3, 3, 3]
+
+
+class SampledLLM(BatchLLM):
+    temperature: float = 0.7
+
+
+@pytest.mark.parametrize("temperature, expected_batches", [(0, [2, 1]), (0.7, [2] * 3)])
+def test_deduplicate_prompts(temperature, expected_batches):
+    """Test that identical prompts are generated once at temperature 0."""
+    generated_batches.clear()
+    prompts = ["a", "b", "a", "a", "c", "b"]
+    generate = record_llm_call(
+        SampledLLM.generate, deduplicate_prompts=True, sub_batch_size=2
+    )
+
+    llm_result = generate(SampledLLM(temperature=temperature), prompts)
+
+    assert [g[0].text for g in llm_result.generations] == [p.upper() for p in prompts]
+    assert sorted(generated_batches) == sorted(expected_batches)
+    assert llm_result.llm_output.get("duplicate_prompts") == (
+        3 if temperature == 0 else None
+    )
+
+
+def test_completed_calls_are_not_kept_by_the_parent_flow_run():
+    """Test that a parent flow run only keeps the states of failed calls."""
+
+    class BrokenLLM(EchoLLM):
+        def _call(self, prompt: str, *args, **kwargs) -> str:
+            raise ValueError("boom")
+
+    generate = record_llm_call(EchoLLM.generate)
+
+    @flow
+    def parent_flow() -> int:
+        generate(EchoLLM(), ["foo"])
+        with pytest.raises(ValueError, match="boom"):
+            generate(BrokenLLM(), ["foo"])
+        return len(FlowRunContext.get().flow_run_states)
+
+    assert parent_flow() == 1
+
+
+def test_recording_memory_stays_flat(monkeypatch):
+    """Test that recorded calls are not retained once they are recorded."""
+    llm = EchoLLM(repeat=100)
+    tracker = UsageTracker(publish_artifacts=False, max_tracked_runs=10)
+    generate = record_llm_call(EchoLLM.generate, usage_tracker=tracker)
+    # pytest keeps log records, and the results they reference, until the end
+    monkeypatch.setattr(logging.getLogger("prefect"), "propagate", False)
+
+    def recording_memory() -> int:
+        APILogHandler.flush()
+        gc.collect()
+        # objects allocated by the whole process, Prefect included
+        snapshot = tracemalloc.take_snapshot().filter_traces(
+            [tracemalloc.Filter(False, tracemalloc.__file__)]
+        )
+        return sum(stat.size for stat in snapshot.statistics("filename"))
+
+    @flow
+    def long_running_agent() -> int:
+        for i in range(WARMUP_CALLS + SOAK_CALLS):
+            if i == WARMUP_CALLS:
+                before = recording_memory()
+            llm_result = generate(llm, [f"Step {i} of a long-running agent"])
+            assert isinstance(llm_result, LLMResult)
+        return recording_memory() - before
+
+    tracemalloc.start()
+    try:
+        growth = long_running_agent()
+    finally:
+        tracemalloc.stop()
 
-        assert artifact.content["llm_endpoint"] == "langchain.llms.openai"
-        assert artifact.content["prompts"] == llm_input
+    assert growth < 256 * 1024, f"{growth} bytes retained over {SOAK_CALLS} calls"
@@ -0,0 +1,61 @@
+import pytest
+from conftest import FakeChatModel
+from langchain.llms.fake import FakeListLLM
+from langchain.schema import HumanMessage
+
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.routing import ModelTier, TokenCountRouter
+
+
+@pytest.fixture
+def router():
+    return TokenCountRouter(
+        tiers=[
+            ModelTier(
+                name="tagged", llm=FakeListLLM(responses=["a"]), tags={"special"}
+            ),
+            ModelTier(
+                name="fast", llm=FakeListLLM(responses=["b"]), max_prompt_tokens=10
+            ),
+            ModelTier(
+                name="long-context",
+                llm=FakeListLLM(responses=["c"]),
+                max_prompt_tokens=100,
+            ),
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "prompt_tokens, tags, expected_tier",
+    [
+        (5, set(), "fast"),
+        (50, set(), "long-context"),
+        (500, {"other"}, None),
+        (500, {"special", "other"}, "tagged"),
+    ],
+)
+def test_route(router, prompt_tokens, tags, expected_tier):
+    """Test that prompts are routed to the first tier that accepts them."""
+    tier = router.route(prompt_tokens, tags)
+
+    assert (tier.name if tier else None) == expected_tier
+    assert router.decisions == {expected_tier: 1}
+
+
+def test_is_tier_llm(router):
+    """Test that tier models are recognized so they are not routed again."""
+    assert router.is_tier_llm(router.tiers[0].llm)
+    assert not router.is_tier_llm(FakeListLLM(responses=["d"]))
+
+
+def test_chat_call_is_routed_once():
+    """Test that a chat call recorded at `generate` and `_generate` routes once."""
+    router = TokenCountRouter(
+        tiers=[ModelTier(name="fast", llm=FakeChatModel(), max_prompt_tokens=1)]
+    )
+
+    with RecordLLMCalls(include=[FakeChatModel], router=router):
+        FakeChatModel()([HumanMessage(content="Hello there, how are you?")])
+
+    assert router.decisions == {None: 1}
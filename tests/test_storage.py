@@ -0,0 +1,62 @@
+from langchain.schema import Generation, HumanMessage, LLMResult, SystemMessage
+
+from langchain_prefect.storage import BlobStore
+from langchain_prefect.utilities import LLMInvocation
+
+
+def make_invocation(question: str, **kwargs) -> LLMInvocation:
+    return LLMInvocation(
+        llm_endpoint="langchain.chat_models.openai",
+        prompts=[
+            [
+                SystemMessage(content="You should speak like a pirate."),
+                HumanMessage(content=question),
+            ]
+        ],
+        invocation_fn=make_invocation,
+        kwargs=kwargs,
+    )
+
+
+def test_identical_prompts_are_stored_once(tmp_path):
+    """Test that shared messages are only written once across invocations."""
+    blob_store = BlobStore(tmp_path)
+
+    first_hash, first_blobs = blob_store.encode_invocation(make_invocation("Hi?"))
+    second_hash, second_blobs = blob_store.encode_invocation(make_invocation("Bye?"))
+
+    # system message, human message and manifest
+    assert blob_store.put_many(first_blobs) == 3
+    # only the new human message and manifest
+    assert blob_store.put_many(second_blobs) == 2
+    assert len(list(tmp_path.glob("*/*.json"))) == 5
+
+    manifest = blob_store.get(first_hash)
+    system_hash, human_hash = manifest["prompts"][0]
+    assert blob_store.get(human_hash)["content"] == "Hi?"
+    assert blob_store.get(second_hash)["prompts"][0][0] == system_hash
+
+
+def test_manifest_leaves_out_callbacks(tmp_path):
+    """Test that callbacks and run managers are not part of the manifest."""
+    blob_store = BlobStore(tmp_path)
+
+    manifest_hash, _ = blob_store.encode_invocation(make_invocation("Hi?", stop=["!"]))
+    with_callbacks_hash, blobs = blob_store.encode_invocation(
+        make_invocation("Hi?", stop=["!"], callbacks=object(), run_manager=object())
+    )
+    blob_store.put_many(blobs)
+
+    assert with_callbacks_hash == manifest_hash
+    assert blob_store.get(manifest_hash)["kwargs"] == {"stop": ["!"]}
+
+
+def test_put_result_round_trip(tmp_path):
+    """Test that LLM results are stored and retrieved by hash."""
+    blob_store = BlobStore(tmp_path)
+    llm_result = LLMResult(generations=[[Generation(text="Arr!")]])
+
+    result_hash = blob_store.put(llm_result)
+
+    assert blob_store.put(llm_result) == result_hash
+    assert blob_store.get(result_hash)["generations"][0][0]["text"] == "Arr!"
@@ -0,0 +1,70 @@
+import json
+import urllib.error
+import urllib.request
+
+import pytest
+
+from langchain_prefect.testing import FakeOpenAIServer
+
+
+def post(url: str, body: dict):
+    request = urllib.request.Request(
+        url,
+        data=json.dumps(body).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    with urllib.request.urlopen(request) as response:
+        return response.read().decode()
+
+
+@pytest.fixture
+def server():
+    with FakeOpenAIServer(response=lambda prompt: prompt.upper()) as server:
+        yield server
+
+
+def test_completions(server):
+    """Test that batched prompts get `n` choices each, with token usage."""
+    response = json.loads(
+        post(f"{server.url}/completions", {"prompt": ["foo", "bar"], "n": 2})
+    )
+
+    assert [c["text"] for c in response["choices"]] == ["FOO", "FOO", "BAR", "BAR"]
+    assert [c["index"] for c in response["choices"]] == [0, 1, 2, 3]
+    assert response["usage"]["total_tokens"] > 0
+
+
+def test_chat_completions_stream(server):
+    """Test that chat completions are streamed as server-sent events."""
+    events = post(
+        f"{server.url}/chat/completions",
+        {"messages": [{"role": "user", "content": "hello there"}], "stream": True},
+    ).split("\n\n")
+
+    assert events[-2] == "data: [DONE]"
+    chunks = [json.loads(event[len("data: ") :]) for event in events[:-2]]
+    assert "".join(c["choices"][0]["delta"]["content"] for c in chunks) == (
+        "HELLO THERE"
+    )
+    assert chunks[-1]["choices"][0]["finish_reason"] == "stop"
+
+
+@pytest.mark.parametrize(
+    "server_kwargs, status",
+    [
+        (dict(error_rate=1.0), 500),
+        (dict(rate_limit_rate=1.0), 429),
+        (dict(max_requests_per_second=0), 429),
+    ],
+)
+def test_errors(server_kwargs, status):
+    """Test that errors and rate limits are answered in the OpenAI format."""
+    with FakeOpenAIServer(**server_kwargs) as server:
+        with pytest.raises(urllib.error.HTTPError) as exc_info:
+            post(f"{server.url}/completions", {"prompt": "foo"})
+
+    assert exc_info.value.code == status
+    assert "error" in json.loads(exc_info.value.read())
+    if status == 429:
+        assert exc_info.value.headers["Retry-After"] == "1.0"
+    assert server.stats["requests"] == 1
@@ -0,0 +1,195 @@
+import pytest
+from conftest import FakeChatModel
+from langchain.schema import AIMessage, Generation, HumanMessage, LLMResult
+
+from langchain_prefect.plugins import RecordLLMCalls
+from langchain_prefect.usage import (
+    BudgetExceeded,
+    DryRunEstimator,
+    ModelPrice,
+    TokenUsage,
+    UsageTracker,
+    parse_token_usage,
+)
+from langchain_prefect.utilities import encoding_name_for_model, num_tokens
+
+
+def make_result(prompt_tokens: int, completion_tokens: int) -> LLMResult:
+    return LLMResult(
+        generations=[[Generation(text="foo")]],
+        llm_output={
+            "token_usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+            "model_name": "text-davinci-003",
+        },
+    )
+
+
+def test_parse_token_usage():
+    """Test that token usage is parsed from `llm_output`."""
+    usage = parse_token_usage(make_result(10, 5))
+    assert usage == TokenUsage(
+        calls=1, prompt_tokens=10, completion_tokens=5, total_tokens=15
+    )
+
+
+def test_parse_token_usage_without_llm_output():
+    """Test that a result without `llm_output` counts as a call with no tokens."""
+    usage = parse_token_usage(LLMResult(generations=[]))
+    assert usage == TokenUsage(calls=1)
+
+
+@pytest.mark.parametrize(
+    "model_name, expected_price",
+    [
+        ("gpt-4", ModelPrice(prompt=0.03, completion=0.06)),
+        ("gpt-4-32k-0314", ModelPrice(prompt=0.06, completion=0.12)),
+        ("unknown-model", ModelPrice()),
+        (None, ModelPrice()),
+    ],
+)
+def test_get_price(model_name, expected_price):
+    """Test that prices are matched exactly or by longest prefix."""
+    assert UsageTracker().get_price(model_name) == expected_price
+
+
+def test_record_aggregates_per_scope():
+    """Test that usage is aggregated per flow run, parent flow and tag."""
+    tracker = UsageTracker(prices={"text-davinci": ModelPrice(prompt=1, completion=2)})
+
+    for flow_run_id in ("a", "b"):
+        tracker.record(
+            make_result(1000, 500),
+            model_name="text-davinci-003",
+            tags=["shared", flow_run_id],
+            flow_run_id=flow_run_id,
+            parent_flow_run_id="parent",
+        )
+
+    assert tracker.total.calls == 2
+    assert tracker.total.total_tokens == 3000
+    assert tracker.total.cost == pytest.approx(4.0)
+    assert tracker.by_flow_run["a"].total_tokens == 1500
+    assert tracker.by_parent_flow_run["parent"].calls == 2
+    assert tracker.by_tag["shared"].cost == pytest.approx(4.0)
+
+    rows = tracker.table(flow_run_id="a", parent_flow_run_id="parent", tags=["a"])
+    assert [(row["scope"], row["key"]) for row in rows] == [
+        ("flow run", "a"),
+        ("parent flow", "parent"),
+        ("tag", "a"),
+        ("total", ""),
+    ]
+
+
+@pytest.mark.parametrize(
+    "tracker_kwargs", [dict(max_total_tokens=1500), dict(max_cost=0.01)]
+)
+def test_check_budget(tracker_kwargs):
+    """Test that calls are refused once the budget is used up."""
+    tracker = UsageTracker(**tracker_kwargs)
+    tracker.check_budget("langchain.llms.openai")
+
+    tracker.record(make_result(1000, 500), model_name="text-davinci-003")
+
+    with pytest.raises(BudgetExceeded, match="Did not call"):
+        tracker.check_budget("langchain.llms.openai")
+
+
+def test_record_forgets_least_recently_used_runs():
+    """Test that usage is kept for a bounded number of flow runs."""
+    tracker = UsageTracker(max_tracked_runs=2)
+    for flow_run_id in ["a", "b", "a", "c"]:
+        tracker.record(make_result(10, 5), flow_run_id=flow_run_id)
+
+    assert list(tracker.by_flow_run) == ["a", "c"]
+    assert tracker.by_flow_run["a"].calls == 2
+    assert tracker.total.calls == 4
+
+
+def test_record_forgets_least_recently_used_tags():
+    """Test that usage is kept for a bounded number of tags, e.g. per-run tags."""
+    tracker = UsageTracker(max_tracked_runs=2)
+    for flow_run_id in ["a", "b", "c"]:
+        tracker.record(
+            make_result(10, 5), tags=["openai", f"parent-flow-run:{flow_run_id}"]
+        )
+
+    assert list(tracker.by_tag) == ["openai", "parent-flow-run:c"]
+    assert tracker.by_tag["openai"].calls == 3
+
+
+def test_chat_call_usage_is_recorded_once():
+    """Test that a chat call recorded at `generate` and `_generate` counts once."""
+    tracker = UsageTracker(max_total_tokens=30, publish_artifacts=False)
+    chat = FakeChatModel()
+
+    with RecordLLMCalls(include=[FakeChatModel], usage_tracker=tracker):
+        for _ in range(2):
+            chat([HumanMessage(content="Hello")])
+        with pytest.raises(BudgetExceeded):
+            chat([HumanMessage(content="Hello")])
+
+    assert tracker.total.calls == 2
+    assert tracker.total.total_tokens == 30
+    assert tracker.by_tag[FakeChatModel.__module__].calls == 2
+
+
+class FakeDavinci:
+    model_name = "text-davinci-003"
+    max_tokens = 16
+
+
+@pytest.mark.parametrize("min_parallel_prompts", [1, 64])
+def test_dry_run_estimate(min_parallel_prompts):
+    """Test that prompt tokens are counted and completions projected per prompt."""
+    prompts = ["How old is the Dalai Lama?", "How tall is Mount Everest?"] * 10
+    with DryRunEstimator(min_parallel_prompts=min_parallel_prompts) as estimator:
+        llm_result = estimator.estimate(FakeDavinci(), prompts, "openai")
+
+    assert llm_result.generations == [[Generation(text="")]] * 20
+    token_usage = llm_result.llm_output["token_usage"]
+    encoding_name = encoding_name_for_model("text-davinci-003")
+    assert token_usage["prompt_tokens"] == sum(
+        num_tokens(prompt, encoding_name) for prompt in prompts
+    )
+    assert token_usage["completion_tokens"] == 20 * 16
+    assert llm_result.llm_output["dry_run"]
+
+    assert estimator.usage.by_tag["openai"].calls == 1
+    assert estimator.usage.by_tag["openai"].cost == pytest.approx(
+        token_usage["total_tokens"] * 0.02 / 1000
+    )
+    assert [(row["scope"], row["key"]) for row in estimator.table()] == [
+        ("endpoint", "openai"),
+        ("total", ""),
+    ]
+
+
+def test_dry_run_estimate_chat():
+    """Test that a chat prompt is estimated as one prompt with an empty reply."""
+    estimator = DryRunEstimator(completion_tokens=5)
+    chat_result = estimator.estimate(
+        FakeDavinci(),
+        [HumanMessage(content="Hi there"), AIMessage(content="Hello!")],
+        "chat",
+        chat=True,
+    )
+
+    assert chat_result.generations[0].message.content == ""
+    assert chat_result.llm_output["token_usage"]["completion_tokens"] == 5
+
+
+def test_dry_run_chat_model_call():
+    """Test that calling a chat model in a dry run returns an empty message."""
+    estimator = DryRunEstimator(completion_tokens=5)
+
+    with RecordLLMCalls(include=[FakeChatModel], dry_run=estimator):
+        message = FakeChatModel()([HumanMessage(content="Hi there")])
+
+    assert message == AIMessage(content="")
+    assert estimator.usage.total.calls == 1
+    assert estimator.usage.total.completion_tokens == 5
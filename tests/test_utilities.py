@@ -1,8 +1,12 @@
+import json
+
 import pytest
 from prefect import Flow
 
 from langchain.schema import (
+    Generation,
     HumanMessage,
+    LLMResult,
     SystemMessage,
 )
 from langchain_prefect import utilities as utils
@@ -98,3 +102,89 @@ def test_truncate(text, max_length, expected_truncated_text):
 def test_get_prompt_content(prompts, expected_prompt_content):
     """Test that get_prompt_content returns the correct content."""
     assert utils.get_prompt_content(prompts) == expected_prompt_content
+
+
+def test_llm_invocation_summary_is_capped():
+    """Test that the invocation summary caps the number of prompts shown."""
+    prompts = [f"prompt {i}" for i in range(12)]
+
+    invocation = utils.LLMInvocation(
+        llm_endpoint="langchain.llms.openai",
+        prompts=prompts,
+        invocation_fn=test_get_prompt_content,
+        max_summarized_prompts=2,
+    )
+
+    summary = str(invocation)
+    assert "'prompt 1'" in summary and "'prompt 2'" not in summary
+    assert summary.endswith(
+        f" and 10 more to langchain.llms.openai via {test_get_prompt_content!r}"
+    )
+
+
+def test_llm_invocation_to_parameters_is_size_capped():
+    """Test that flow run parameters are slim and fit the size cap."""
+    prompts = ["a long retrieved context " * 1000, "another prompt"]
+
+    invocation = utils.LLMInvocation(
+        llm_endpoint="langchain.llms.openai",
+        prompts=prompts,
+        invocation_fn=test_get_prompt_content,
+        args=(["stop"],),
+        prompt_tokens=5000,
+    )
+    parameters = invocation.to_parameters(max_bytes=512, payload_hash="abc")
+
+    assert len(json.dumps(parameters).encode()) <= 512
+    assert parameters["n_prompts"] == 2
+    assert parameters["prompt_tokens"] == 5000
+    assert parameters["payload_hash"] == "abc"
+    assert "prompts" not in parameters and "args" not in parameters
+
+
+def test_llm_result_log_record_is_capped_and_redacted():
+    """Test that logged result fields are selected, redacted and size-capped."""
+    llm_result = LLMResult(
+        generations=[[Generation(text="secret " * 100)] for _ in range(1000)],
+        llm_output={"token_usage": {"total_tokens": 42}, "model_name": "gpt-4"},
+    )
+    config = utils.ResultLogConfig(
+        fields=["n_generations", "token_usage", "generations"],
+        max_field_bytes=50,
+        redact=lambda field, value: (
+            [text.replace("secret", "***") for text in value]
+            if field == "generations"
+            else value
+        ),
+    )
+
+    message = str(utils.LLMResultLogRecord(llm_result, config))
+
+    assert message.startswith(
+        "Received LLM result: n_generations=1000 token_usage={'total_tokens': 42}"
+    )
+    assert "secret" not in message and "***" in message
+    assert len(message.split(" generations=")[1].encode()) <= 50
+
+
+def test_merge_llm_results():
+    """Test that generations are merged in order and token counts summed."""
+    llm_results = [
+        LLMResult(
+            generations=[[Generation(text=text)] for text in texts],
+            llm_output={
+                "token_usage": {"prompt_tokens": len(texts), "total_tokens": 1},
+                "model_name": "gpt-4",
+            },
+        )
+        for texts in (["a", "b"], ["c"])
+    ]
+
+    merged = utils.merge_llm_results(llm_results)
+
+    assert [g[0].text for g in merged.generations] == ["a", "b", "c"]
+    assert merged.llm_output == {
+        "token_usage": {"prompt_tokens": 3, "total_tokens": 2},
+        "model_name": "gpt-4",
+    }
+    assert llm_results[0].llm_output["token_usage"]["prompt_tokens"] == 2
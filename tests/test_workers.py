@@ -0,0 +1,77 @@
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List
+
+import pytest
+from langchain.llms.base import BaseLLM
+from langchain.schema import Generation, LLMResult
+from prefect import flow
+from prefect.context import get_run_context
+
+from langchain_prefect.circuit_breaker import CircuitBreaker
+from langchain_prefect.usage import UsageTracker
+from langchain_prefect.workers import WorkerRecording, init_worker_recording
+
+
+class UsageLLM(BaseLLM):
+    @property
+    def _llm_type(self) -> str:
+        return "usage"
+
+    def _generate(self, prompts: List[str], *args: Any, **kwargs: Any) -> LLMResult:
+        return LLMResult(
+            generations=[[Generation(text=prompt.upper())] for prompt in prompts],
+            llm_output={
+                "model_name": "gpt-3.5-turbo",
+                "token_usage": {
+                    "prompt_tokens": 10,
+                    "completion_tokens": 5,
+                    "total_tokens": 15,
+                },
+            },
+        )
+
+    async def _agenerate(self, prompts: List[str], *args, **kwargs) -> LLMResult:
+        return self._generate(prompts)
+
+
+def shout(text: str) -> str:
+    return UsageLLM().generate([text]).generations[0][0].text
+
+
+def test_worker_recording_config_is_picklable():
+    """Test that the worker configuration pickles and rejects what cannot."""
+    recording = WorkerRecording(
+        tags={"etl"}, include=[UsageLLM, "langchain.*"], max_prompt_tokens=100
+    )
+
+    assert pickle.loads(pickle.dumps(recording.config)) == recording.config
+    assert recording.config.recording_kwargs == {"max_prompt_tokens": 100}
+
+    with pytest.raises(ValueError, match="cannot be sent to worker processes"):
+        WorkerRecording(circuit_breaker=CircuitBreaker())
+
+
+def test_worker_usage_is_added_to_the_parent_flow_run():
+    """Test that calls made in worker processes count towards the parent flow."""
+    tracker = UsageTracker(publish_artifacts=False)
+
+    @flow
+    def parent() -> str:
+        with WorkerRecording(usage_tracker=tracker) as recording:
+            with ProcessPoolExecutor(
+                max_workers=2,
+                mp_context=multiprocessing.get_context("fork"),
+                initializer=init_worker_recording,
+                initargs=recording.initargs,
+            ) as pool:
+                assert list(pool.map(shout, ["a", "b", "c"])) == ["A", "B", "C"]
+        return str(get_run_context().flow_run.id)
+
+    flow_run_id = parent()
+
+    assert tracker.total.total_tokens == 45
+    assert tracker.by_parent_flow_run[flow_run_id].total_tokens == 45
+    assert len(tracker.by_flow_run) == 3
+    assert tracker.by_tag[f"parent-flow-run:{flow_run_id}"].total_tokens == 45